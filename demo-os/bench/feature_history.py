@@ -0,0 +1,187 @@
+"""
+特征历史存储（services/api/app/history.py）：一致性校验 + 写入/回放/窗口聚合基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/feature_history.py --segments 100000 --hours 24 --slot-s 300
+
+先在临时目录里写少量随机读数，对窗口聚合（sum/mean/min/max/count/last/accum）与朴素逐条计算逐一比对，
+降采样后再按粗槽对齐的窗口比对一次；然后模拟一场 24 小时暴雨：每个时间槽整列写入全部路段的
+雨强/水位/拥堵指数，统计写入耗时、磁盘占用、按时间顺序回放全部槽的耗时，以及风险重算一批
+（RISK_REFRESH_CHUNK 个对象）派生滚动特征的耗时。
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services" / "api"))
+
+from app import history  # noqa: E402
+from app.history import FeatureHistory  # noqa: E402
+
+FEATURES = ("rain_now_mmph", "water_level_m", "traffic_index")
+
+
+def f32(v: float) -> float:
+    return array.array("f", [v])[0]
+
+
+def naive(readings: dict[str, list[tuple[float, float]]], oid: str, agg: str, t0: float, t1: float):
+    vals = [v for t, v in sorted(readings.get(oid, [])) if t0 <= t < t1]
+    if not vals:
+        return None
+    return {
+        "sum": sum(vals),
+        "mean": sum(vals) / len(vals),
+        "min": min(vals),
+        "max": max(vals),
+        "count": float(len(vals)),
+        "last": vals[-1],
+        "accum": sum(vals) * 60 / 3600,
+    }[agg]
+
+
+def close(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-4, abs_tol=1e-3)
+
+
+def check_parity(root: str, rnd: random.Random) -> None:
+    store = FeatureHistory(root, FEATURES, slot_s=60, partition_s=3600)
+    store.downsample_after_s = 10**9  # 写入阶段不丢弃“过老”的读数
+    hour = 3600
+    now = (int(time.time()) // hour) * hour
+    t_begin = now - 10 * hour
+    oids = [f"obj-{i:04d}" for i in range(200)]
+    readings: dict[str, list[tuple[float, float]]] = {}
+    latest: dict[tuple[str, float], float] = {}
+    for slot_t in range(t_begin, now, 60):
+        batch = [(oid, {"rain_now_mmph": round(rnd.uniform(0, 80), 2)}) for oid in rnd.sample(oids, 30)]
+        # 同一槽内重复写：后写覆盖先写
+        batch.append((batch[0][0], {"rain_now_mmph": 1.5, "note": "x", "flag": True}))
+        t = slot_t + rnd.uniform(0, 59)
+        store.record_many(batch, t)
+        for oid, feats in batch:
+            latest[(oid, slot_t)] = f32(feats["rain_now_mmph"])
+    for (oid, slot_t), v in latest.items():
+        readings.setdefault(oid, []).append((slot_t, v))
+
+    def compare(windows: list[int], label: str) -> None:
+        for agg in history.AGGS:
+            for w in windows:
+                got = store.window(oids, "rain_now_mmph", agg, w, now)
+                for oid in oids:
+                    want = naive(readings, oid, agg, now - w, now)
+                    assert close(got[oid], want), f"{label} {agg} {w}s {oid}: {got[oid]} != {want}"
+        print(f"parity ({label}): ok")
+
+    compare([60, 600, 3600, 3 * hour + 1800, 10 * hour], "raw")
+
+    series = store.series(oids[0], "rain_now_mmph", t_begin, now)
+    assert [p["value"] for p in series] == [v for _, v in sorted(readings[oids[0]])]
+
+    # 降采样最老的 6 个小时分区：按 15 分钟对齐的窗口结果不变（last 取粗槽内最后一个读数，同样一致）
+    store.downsample_after_s = 3 * hour
+    done = store.maintain(now)
+    assert done["downsampled"] == 6, done
+    compare([4 * hour, 5 * hour + 900, 10 * hour], "downsampled")
+
+    # 保留期：结束时间早于 7.5 小时前的分区整体删除（剩最近 8 个小时分区）
+    store.retention_s = 7 * hour + 1800
+    done = store.maintain(now)
+    assert done["removed"] == 2, done
+    got = store.window(oids, "rain_now_mmph", "count", 10 * hour, now)
+    want = {oid: naive(readings, oid, "count", now - 8 * hour, now) for oid in oids}
+    assert all(close(got[o], want[o]) for o in oids)
+    print("retention: ok")
+    store.close()
+
+
+def storm(root: str, segments: int, hours: int, slot_s: int, rnd: random.Random) -> None:
+    store = FeatureHistory(root, FEATURES, slot_s=slot_s, partition_s=3600)
+    store.downsample_after_s = 10**9
+    oids = [f"a-{i // 1000 + 1:03d}-road-{i % 1000 + 1:03d}" for i in range(segments)]
+    rows = store.resolve(oids)
+    end = (int(time.time()) // 3600) * 3600
+    start = end - hours * 3600
+    # 每个路段一个基准与一个峰值时刻，雨强按钟形曲线变化；每槽整列写入
+    base = [rnd.uniform(0.5, 1.5) for _ in oids]
+    peak = [rnd.uniform(0.3, 0.7) for _ in oids]
+    slots = range(start, end, slot_s)
+    write_s = 0.0
+    for t in slots:
+        x = (t - start) / (end - start)
+        rain = [b * 60 * math.exp(-(((x - p) / 0.12) ** 2)) for b, p in zip(base, peak)]
+        columns = {
+            "rain_now_mmph": rain,
+            "water_level_m": [r / 100 for r in rain],
+            "traffic_index": [1 - r / 120 for r in rain],
+        }
+        t0 = time.perf_counter()
+        store.record_frame(t, rows, columns)
+        write_s += time.perf_counter() - t0
+    size = store.stats()["bytes"]
+    print(
+        f"write  {segments:,} segments x {len(slots)} slots x {len(FEATURES)} features: {write_s:6.2f} s "
+        f"{size / 2**20:,.0f} MiB on disk"
+    )
+
+    t0 = time.perf_counter()
+    frames = 0
+    peak_rain = 0.0
+    over = 0
+    for _, frame in store.replay(start, end):
+        col = frame["rain_now_mmph"]
+        peak_rain = max(peak_rain, max(col))
+        over += sum(1 for v in frame["water_level_m"] if v > 0.5)
+        frames += 1
+    print(
+        f"replay {frames} frames x {len(FEATURES)} features: {time.perf_counter() - t0:6.2f} s "
+        f"(peak {peak_rain:.1f} mm/h, {over:,} segment-slots over 0.5 m)"
+    )
+
+    batch = rnd.sample(oids, min(2000, segments))
+    samples = []
+    for i in range(20):
+        t0 = time.perf_counter()
+        store.rolling(batch, end - i * 600)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"rolling features for {len(batch)} objects: p50 {samples[len(samples) // 2]:6.1f} ms  max {samples[-1]:6.1f} ms")
+
+    samples = []
+    for oid in rnd.sample(oids, 200):
+        t0 = time.perf_counter()
+        store.window([oid], "rain_now_mmph", "max", 24 * 3600, end)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    print(f"24h max, single object: p50 {samples[len(samples) // 2]:6.1f} us")
+    store.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--segments", type=int, default=100_000)
+    ap.add_argument("--hours", type=int, default=24)
+    ap.add_argument("--slot-s", type=int, default=300, help="raw 槽宽（秒），需整除 900")
+    ap.add_argument("--dir", default=None, help="数据目录（默认临时目录，结束后删除）")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        check_parity(os.path.join(tmp, "parity"), rnd)
+        storm(args.dir or os.path.join(tmp, "storm"), args.segments, args.hours, args.slot_s, rnd)
+
+
+if __name__ == "__main__":
+    main()
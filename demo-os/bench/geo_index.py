@@ -0,0 +1,131 @@
+"""
+api 进程内空间索引（/geo/bbox、/geo/radius、/geo/nearest）：一致性校验 + 延迟基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/geo_index.py --objects 300000 --queries 2000
+
+按合成数据生成器的区域布局随机撒点，先对少量查询与暴力扫描逐条比对（框选、半径、k 近邻，
+含类型/区域过滤与截断），再统计各类查询的 p50/p99 延迟，以及逐条 upsert（移动位置）的耗时。
+半径/kNN 按圈外扩、找满即停，耗时主要取决于返回条数（limit / k），而不是半径内的对象总数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services" / "api"))
+
+from app import seed  # noqa: E402
+from app.geo_index import GeoIndex  # noqa: E402
+
+M_PER_DEG = 111_320.0
+
+
+def make_objects(count: int, areas: int, rnd: random.Random) -> list[tuple[str, str, str, float, float]]:
+    cfg = seed.SeedConfig(areas=areas)
+    centers = [seed._Area(cfg, i) for i in range(areas)]
+    out = []
+    for i in range(count):
+        a = centers[i % areas]
+        otype = seed.PUMP_STATION if rnd.random() < 0.05 else seed.ROAD_SEGMENT
+        lon = rnd.gauss(a.lon, seed.AREA_SPREAD_DEG)
+        lat = rnd.gauss(a.lat, seed.AREA_SPREAD_DEG)
+        out.append((f"obj-{i:07d}", otype, a.id, lon, lat))
+    return out
+
+
+def dist(lon: float, lat: float, o) -> float:
+    kx = M_PER_DEG * math.cos(math.radians(lat))
+    return math.hypot((o[3] - lon) * kx, (o[4] - lat) * M_PER_DEG)
+
+
+def check_parity(index: GeoIndex, objects: list, rnd: random.Random, areas: int) -> None:
+    for _ in range(200):
+        a = rnd.choice(objects)
+        lon, lat = a[3] + rnd.uniform(-0.01, 0.01), a[4] + rnd.uniform(-0.01, 0.01)
+        otype = rnd.choice([None, seed.PUMP_STATION])
+        area = rnd.choice([None, seed.area_id(rnd.randrange(areas))])
+        keep = [o for o in objects if (otype is None or o[1] == otype) and (area is None or o[2] == area)]
+
+        w, h = rnd.uniform(0.001, 0.03), rnd.uniform(0.001, 0.03)
+        got, _ = index.bbox(lon - w, lat - h, lon + w, lat + h, otype, area)
+        want = sorted(o[0] for o in keep if lon - w <= o[3] <= lon + w and lat - h <= o[4] <= lat + h)
+        assert [e.object_id for e in got] == want, "bbox mismatch"
+
+        r = rnd.uniform(100, 3000)
+        got, truncated = index.radius(lon, lat, r, otype, area, limit=50)
+        want = sorted((dist(lon, lat, o), o[0]) for o in keep if dist(lon, lat, o) <= r)
+        assert truncated == (len(want) > 50)
+        assert [e.object_id for _, e in got] == [oid for _, oid in want[:50]], "radius mismatch"
+
+        k = rnd.choice([1, 5, 20])
+        max_r = rnd.choice([None, 500.0])
+        got = index.nearest(lon, lat, k, otype, area, max_r)
+        want = sorted((dist(lon, lat, o), o[0]) for o in keep if max_r is None or dist(lon, lat, o) <= max_r)[:k]
+        assert [e.object_id for _, e in got] == [oid for _, oid in want], "nearest mismatch"
+    print("parity: ok")
+
+
+def timed(fn, queries: list) -> tuple[float, float]:
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(*q)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def bench(count: int, areas: int, queries: int, seed_value: int) -> None:
+    rnd = random.Random(seed_value)
+    index = GeoIndex()
+    objects = make_objects(3000, 4, rnd)
+    for o in objects:
+        index.upsert(*o)
+    check_parity(index, objects, rnd, 4)
+
+    objects = make_objects(count, areas, rnd)
+    index = GeoIndex()
+    t0 = time.perf_counter()
+    for o in objects:
+        index.upsert(*o)
+    gc.freeze()  # 与 api 启动时一致：常驻索引对象不参与后续分代回收
+    print(f"build {count:,} objects  {(time.perf_counter() - t0) * 1000:8.1f} ms  {index.stats()}")
+
+    points = [(o[3], o[4]) for o in rnd.sample(objects, queries)]
+    rows = [
+        ("radius 500m, limit 100", lambda lon, lat: index.radius(lon, lat, 500, None, None, 100), points),
+        ("radius 2km pumps", lambda lon, lat: index.radius(lon, lat, 2000, seed.PUMP_STATION, None, 500), points),
+        ("radius 2km, limit 100", lambda lon, lat: index.radius(lon, lat, 2000, None, None, 100), points),
+        ("nearest k=10", lambda lon, lat: index.nearest(lon, lat, 10), points),
+        ("nearest pump k=5", lambda lon, lat: index.nearest(lon, lat, 5, seed.PUMP_STATION), points),
+        ("bbox 0.005deg, limit 500", lambda lon, lat: index.bbox(lon - 0.005, lat - 0.005, lon + 0.005, lat + 0.005, None, None, 500), points),
+    ]
+    for name, fn, qs in rows:
+        p50, p99 = timed(fn, qs)
+        print(f"{name:28s} p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+
+    moves = [(o[0], o[1], o[2], o[3] + rnd.uniform(-0.02, 0.02), o[4]) for o in rnd.sample(objects, queries)]
+    p50, p99 = timed(index.upsert, moves)
+    print(f"{'upsert (move)':28s} p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--objects", type=int, default=300_000)
+    ap.add_argument("--areas", type=int, default=64)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    bench(args.objects, args.areas, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
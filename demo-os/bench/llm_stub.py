@@ -0,0 +1,105 @@
+"""
+本地 OpenAI 兼容大模型桩服务（演示级），用于在无 DeepSeek Key / 无外网时测试智能体。
+
+用法（在 demo-os 目录下）：
+
+    python bench/llm_stub.py --port 8003 --first-token-ms 300 --token-ms 20
+
+然后启动 agent 时指向它：
+
+    DEEPSEEK_API_KEY=stub DEEPSEEK_BASE_URL=http://127.0.0.1:8003 uvicorn app.main:app --port 8001
+
+支持 POST /v1/chat/completions（stream=true 时按 SSE 逐 token 返回 chat.completion.chunk），
+回复内容根据 prompt 中 TopN 的第一条确定性生成；首 token 延迟与逐 token 间隔可配置，
+用于模拟真实大模型的排队与生成耗时。GET /stats 返回已处理的请求数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+from typing import Any
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+app = FastAPI(title="LLM Stub (OpenAI compatible)")
+app.state.first_token_s = 0.3
+app.state.token_s = 0.02
+app.state.requests = 0
+
+
+def _reply(prompt: str) -> str:
+    m = re.search(r'"target_id":\s*"([^"]+)"', prompt)
+    level = re.search(r'"risk_level":\s*"([^"]+)"', prompt)
+    if not m:
+        return "当前无明显风险点位，建议保持监测。"
+    return f"研判：最高风险点位为 {m.group(1)}（风险{level.group(1) if level else '未知'}），建议优先巡查并准备封控绕行。"
+
+
+def _tokens(text: str, size: int = 4) -> list[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@app.get("/stats")
+def stats():
+    return {"requests": app.state.requests}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body: dict[str, Any] = await request.json()
+    app.state.requests += 1
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    text = _reply(prompt)
+    cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = body.get("model", "stub")
+
+    if not body.get("stream"):
+        await asyncio.sleep(app.state.first_token_s + app.state.token_s * len(_tokens(text)))
+        return {
+            "id": cid,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
+
+    async def chunks():
+        await asyncio.sleep(app.state.first_token_s)
+        for token in _tokens(text):
+            chunk = {
+                "id": cid,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(app.state.token_s)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8003)
+    ap.add_argument("--first-token-ms", type=float, default=300)
+    ap.add_argument("--token-ms", type=float, default=20)
+    args = ap.parse_args()
+    app.state.first_token_s = args.first_token_ms / 1000
+    app.state.token_s = args.token_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+api 打分后端对比：远程 model-service（HTTP，JSON / MessagePack）与进程内打分（线程池 / 进程池）（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/model_backend.py --sizes 50,500,5000 --rounds 30 --concurrency 8
+
+启动一个 model-service 子进程，在本进程内分别构造 api 的 ModelClient（http，关闭微批）与 LocalModelClient（local），
+先用随机特征（含缺失字段、显式 null、字符串数值、非法值）比对各后端返回的 items 逐项一致，
+再按请求规模统计串行调用的 p50/p99，以及 --concurrency 个并发调用方下的吞吐（请求/秒）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# 共用模块 services/common（flood_common）：未 pip install 时直接从源码目录导入，服务子进程经 PYTHONPATH 继承
+COMMON = ROOT / "services" / "common"
+sys.path.insert(0, str(COMMON))
+os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, (str(COMMON), os.environ.get("PYTHONPATH"))))
+sys.path.insert(0, str(ROOT / "services" / "api"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import model_client, model_local  # noqa: E402
+from model_wire import free_port, make_payload, wait_healthy  # noqa: E402
+
+
+def make_clients(url: str, workers: int) -> dict[str, object]:
+    return {
+        "http/json": model_client.ModelClient(base_url=url, batch_window_ms=0, wire_format="json"),
+        "http/msgpack": model_client.ModelClient(base_url=url, batch_window_ms=0, wire_format="msgpack"),
+        "local/thread": model_local.LocalModelClient("thread", workers),
+        "local/process": model_local.LocalModelClient("process", workers),
+    }
+
+
+async def check_parity(clients: dict[str, object], rnd: random.Random) -> None:
+    versions = {name: await c.current_version() for name, c in clients.items()}
+    assert len(set(versions.values())) == 1, f"model_version differs: {versions}"
+    payloads = [make_payload(500, rnd, None), make_payload(500, rnd, 12), make_payload(0, rnd, 5), make_payload(37, rnd, 0)]
+    for payload in payloads:
+        results = {name: await c.infer_topn(payload) for name, c in clients.items()}
+        want = results.pop("http/json")
+        for name, got in results.items():
+            assert got == want, f"{name} differs from http/json"
+    print(f"parity: ok ({versions['http/json']})")
+
+
+async def serial(client, payload: dict, rounds: int) -> tuple[float, float]:
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        await client.infer_topn(payload)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+async def throughput(client, payload: dict, concurrency: int, rounds: int) -> float:
+    async def caller() -> None:
+        for _ in range(rounds):
+            await client.infer_topn(payload)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return concurrency * rounds / (time.perf_counter() - t0)
+
+
+async def bench(url: str, sizes: list[int], rounds: int, concurrency: int, workers: int, seed: int) -> None:
+    clients = make_clients(url, workers)
+    for c in clients.values():
+        await c.start()
+    rnd = random.Random(seed)
+    try:
+        await check_parity(clients, rnd)
+        for size in sizes:
+            payload = make_payload(size, rnd, 12)
+            for name, client in clients.items():
+                await client.infer_topn(payload)  # 预热（进程池首次调用需启动子进程）
+                p50, p99 = await serial(client, payload, rounds)
+                rps = await throughput(client, payload, concurrency, max(rounds // concurrency, 2))
+                print(
+                    f"{size:>6,} targets n=12  {name:14s} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms"
+                    f"  {concurrency} callers {rps:8.1f} req/s"
+                )
+    finally:
+        for c in clients.values():
+            await c.close()
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT / "services" / "model", env=os.environ)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        await wait_healthy(url)
+        await bench(url, sizes, args.rounds, args.concurrency, args.workers, args.seed)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="50,500,5000", help="每个请求的目标数，逗号分隔")
+    ap.add_argument("--rounds", type=int, default=30)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=4, help="进程内后端的线程/进程数")
+    ap.add_argument("--seed", type=int, default=7)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+model-service 大批量分块打分（/infer/topn/stream）：一致性校验 + 吞吐/内存基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/model_bulk.py --targets 1000000 --n 50 --chunk 20000
+
+先用较小的随机目标集校验：分块归并 TopN 与 engine.score_topn 完全一致，
+全量 NDJSON 流与逐条打分一致；再对大目标集比较单进程整包解析+打分与分块进程池
+解析+打分的耗时（多核时差距明显），并打印主进程峰值 RSS。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services" / "model"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import bulk, engine  # noqa: E402
+from app.rules import rule_store  # noqa: E402
+from model_engine import make_targets  # noqa: E402
+
+RULES = rule_store.current()
+
+
+def encode_ndjson(ids: list[str], feats: list[dict]) -> bytes:
+    return b"".join(
+        json.dumps({"target_id": tid, "features": f}, ensure_ascii=False).encode("utf-8") + b"\n"
+        for tid, f in zip(ids, feats)
+    )
+
+
+async def ndjson_stream(body: bytes, piece: int = 65536) -> AsyncIterator[bytes]:
+    """模拟请求体：按 piece 字节切片送出（行可能跨片）。"""
+    for start in range(0, len(body), piece):
+        yield body[start : start + piece]
+
+
+async def check_parity(seed: int) -> None:
+    ids, feats = make_targets(5000, seed)
+    body = encode_ndjson(ids, feats)
+    bulk.BULK_CHUNK_SIZE = 700
+    for n in (0, 1, 5, 12, 4999, 5000, 6000):
+        want = engine.score_topn(ids, feats, n, RULES)
+        got, result = await bulk.topn(ndjson_stream(body, piece=1000), n, RULES)
+        if got != want or result.count != len(ids):
+            raise SystemExit(f"bulk topn parity mismatch (n={n})")
+    lines = b"".join([chunk async for chunk in bulk.stream_all(ndjson_stream(body), RULES)])
+    got_all = [json.loads(line) for line in lines.splitlines()]
+    scores = engine.compute_scores(feats, RULES)
+    want_all = [engine.build_item(ids[i], feats[i], scores[i], RULES) for i in range(len(ids))]
+    if got_all != want_all:
+        raise SystemExit("bulk stream parity mismatch")
+    print("parity: ok")
+
+
+async def bench(count: int, n: int, seed: int, chunk: int) -> None:
+    ids, feats = make_targets(count, seed)
+    body = encode_ndjson(ids, feats)
+    del feats
+
+    # 基线：单进程整包解析 + 列式打分（等价于 /infer/topn 去掉 Pydantic 之后的最好情况）
+    t0 = time.perf_counter()
+    rows = [json.loads(line) for line in body.splitlines()]
+    want = engine.score_topn([r["target_id"] for r in rows], [r["features"] for r in rows], n, RULES)
+    single = time.perf_counter() - t0
+    del rows
+
+    bulk.BULK_CHUNK_SIZE = chunk
+    t0 = time.perf_counter()
+    got, result = await bulk.topn(ndjson_stream(body), n, RULES)
+    chunked = time.perf_counter() - t0
+    if got != want:
+        raise SystemExit("bulk topn mismatch on benchmark set")
+    print(f"single process   {single * 1000:9.1f} ms  {count / single:12,.0f} targets/s")
+    print(
+        f"chunked pool     {chunked * 1000:9.1f} ms  {count / chunked:12,.0f} targets/s"
+        f"  workers={bulk.BULK_WORKERS} chunks={result.chunks}"
+    )
+    print(f"peak rss (main)  {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:9.1f} MB")
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--targets", type=int, default=200_000)
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--chunk", type=int, default=bulk.BULK_CHUNK_SIZE)
+    args = ap.parse_args()
+    try:
+        await check_parity(args.seed)
+        await bench(args.targets, args.n, args.seed, args.chunk)
+    finally:
+        bulk.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+model-service 增量重算（/infer/topn/delta）：一致性校验 + 基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/model_delta.py --targets 100000 --n 12 --change 0.01 --rounds 5
+
+每轮随机改动 change 比例目标的特征（并删除/新增少量目标），分别用
+「全量打分 + 排序」与 DeltaScorer 增量合并得到 TopN，逐轮比对一致（同分按 target_id 升序），
+再比较两者每轮耗时；最后用很小的缓存上限验证淘汰后 complete=false、全量 replace 后恢复。
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services" / "model"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app import engine  # noqa: E402
+from app.delta import DeltaScorer  # noqa: E402
+from app.rules import rule_store  # noqa: E402
+from model_engine import make_targets  # noqa: E402
+
+RULES = rule_store.current()
+
+
+def full_topn(state: dict[str, dict], n: int) -> list[dict]:
+    ids = list(state)
+    feats = [state[t] for t in ids]
+    scores = engine.compute_scores(feats, RULES)
+    order = sorted(range(len(ids)), key=lambda i: (-scores[i], ids[i]))[:n]
+    return [engine.build_item(ids[i], feats[i], scores[i], RULES) for i in order]
+
+
+def mutate(state: dict[str, dict], rnd: random.Random, change: float, pool: list[dict]) -> tuple[list[str], list[str]]:
+    """就地改动 state，返回 (变化/新增的 target_id, 删除的 target_id)。"""
+    ids = list(state)
+    changed = rnd.sample(ids, max(1, int(len(ids) * change)))
+    for t in changed:
+        state[t] = dict(rnd.choice(pool))
+    removed = rnd.sample([t for t in ids if t not in set(changed)], 3)
+    for t in removed:
+        del state[t]
+    for _ in range(3):
+        t = f"new-{rnd.randrange(10**9):09d}"
+        state[t] = dict(rnd.choice(pool))
+        changed.append(t)
+    return changed, removed
+
+
+def run(count: int, n: int, change: float, rounds: int, seed: int) -> None:
+    rnd = random.Random(seed)
+    ids, feats = make_targets(count, seed)
+    state = dict(zip(ids, feats))
+    scorer = DeltaScorer()
+
+    t0 = time.perf_counter()
+    out = scorer.apply(RULES, "A", list(state.items()), [], True, n)
+    print(f"initial full load  {(time.perf_counter() - t0) * 1000:9.1f} ms  rescored={out['rescored']}")
+    assert out["items"] == full_topn(state, n)
+
+    full_ms = delta_ms = 0.0
+    for _ in range(rounds):
+        changed, removed = mutate(state, rnd, change, feats)
+        t0 = time.perf_counter()
+        want = full_topn(state, n)
+        full_ms += (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        out = scorer.apply(RULES, "A", [(t, state[t]) for t in changed], removed, False, n)
+        delta_ms += (time.perf_counter() - t0) * 1000
+        if out["items"] != want or out["total"] != len(state):
+            raise SystemExit("delta parity mismatch")
+    print("parity: ok")
+    print(f"full rescoring     {full_ms / rounds:9.1f} ms/round")
+    print(f"delta              {delta_ms / rounds:9.1f} ms/round  ({change:.1%} changed)")
+    print(scorer.stats())
+
+    small = DeltaScorer(max_entries=100)
+    part = list(state.items())[:150]
+    out = small.apply(RULES, "B", part, [], True, n)
+    assert not out["complete"] and small.evictions == 50
+    small.max_entries = 1000
+    out = small.apply(RULES, "B", part, [], True, n)
+    assert out["complete"] and out["total"] == 150
+    print("eviction/resync: ok")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--targets", type=int, default=100_000)
+    ap.add_argument("--n", type=int, default=12)
+    ap.add_argument("--change", type=float, default=0.01)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    run(args.targets, args.n, args.change, args.rounds, args.seed)
+
+
+if __name__ == "__main__":
+    main()
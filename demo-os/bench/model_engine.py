@@ -0,0 +1,129 @@
+"""
+model-service 批量打分引擎：一致性校验 + 吞吐基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/model_engine.py --targets 100000 --n 12
+
+先用随机特征（含缺失字段、字符串数值、非法值）逐条对比编译后的批量引擎与逐因子解释执行的
+rules.reference（默认规则文件 + 一份改过权重/变换/等级的规则），任何差异直接退出非 0；
+再分别测量逐条打分 + 全排序与批量引擎的耗时。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services" / "model"))
+
+from app import engine, rules  # noqa: E402
+from app.rules import CompiledRules, rule_store  # noqa: E402
+
+RULES = rule_store.current()
+
+
+def make_targets(count: int, seed: int) -> tuple[list[str], list[dict]]:
+    rnd = random.Random(seed)
+    ids: list[str] = []
+    feats: list[dict] = []
+    for i in range(count):
+        f: dict = {}
+        if rnd.random() > 0.05:
+            f["rain_now_mmph"] = round(rnd.uniform(0, 120), 1)
+        if rnd.random() > 0.05:
+            f["rain_1h_mm"] = rnd.choice([round(rnd.uniform(0, 90), 1), str(rnd.randint(0, 90))])
+        if rnd.random() > 0.05:
+            f["water_level_m"] = rnd.choice([round(rnd.uniform(0, 7), 2), None, "bad"])
+        if rnd.random() > 0.1:
+            f["elevation_m"] = round(rnd.uniform(-1, 8), 2)
+        if rnd.random() > 0.1:
+            f["drainage_capacity"] = rnd.choice([0.5, 0.8, 1.0, 1.2, 1.4, 2])
+        if rnd.random() > 0.05:
+            f["pump_status"] = rnd.choice(["running", "fault", "DOWN", "offline", "idle"])
+        if rnd.random() > 0.05:
+            f["traffic_index"] = round(rnd.uniform(0, 1), 2)
+        ids.append(f"a-{i % 97:03d}-road-{i:07d}")
+        feats.append(f)
+    return ids, feats
+
+
+def variant_rules() -> CompiledRules:
+    """改过权重、变换（含 above）、等级与解释条数的规则，验证编译器而不只是默认规则。"""
+    spec = json.loads(RULES.source)
+    spec["name"] = "variant"
+    spec["factors"][0]["weight"] = 0.045
+    spec["factors"][1]["transform"] = {"type": "above", "threshold": 20}
+    spec["factors"][5]["transform"]["values"] = ["FAULT", "idle"]
+    spec["factors"].append({"name": "水位(重复列)", "feature": "water_level_m", "default": 0.5, "weight": -0.1})
+    spec["levels"] = [{"level": "高", "min": 6}, {"level": "中", "min": 2.5}, {"level": "低"}]
+    spec["explain_top"] = 2
+    return rules.load_source(json.dumps(spec, ensure_ascii=False).encode("utf-8"))
+
+
+def reference(ids: list[str], feats: list[dict], n: int | None, compiled: CompiledRules = RULES) -> list[dict]:
+    items = []
+    for tid, f in zip(ids, feats):
+        score, conf, explain = compiled.reference(f, tid)
+        items.append(
+            {
+                "target_id": tid,
+                "target_type": "road_segment",
+                "risk_score": score,
+                "risk_level": compiled.risk_level(score),
+                "confidence": conf,
+                "explain_factors": explain,
+                "model_version": compiled.version,
+            }
+        )
+    items.sort(key=lambda it: it["risk_score"], reverse=True)
+    return items if n is None else items[:n]
+
+
+def check_parity(seed: int) -> None:
+    ids, feats = make_targets(5000, seed)
+    variant = variant_rules()
+    assert variant.version != RULES.version
+    for compiled in (RULES, variant):
+        for n in (None, 0, 1, 5, 12, 4999, 5000, 6000):
+            want = reference(ids, feats, n, compiled)
+            got = engine.score_topn(ids, feats, n, compiled)
+            if got != want:
+                for i, (a, b) in enumerate(zip(got, want)):
+                    if a != b:
+                        raise SystemExit(f"parity mismatch ({compiled.name}, n={n}) at #{i}: engine={a} reference={b}")
+                raise SystemExit(f"parity mismatch ({compiled.name}, n={n}): len engine={len(got)} reference={len(want)}")
+    print(f"parity: ok ({RULES.version}, {variant.version})")
+
+
+def bench(count: int, n: int, seed: int, repeat: int) -> None:
+    ids, feats = make_targets(count, seed)
+    for name, fn in (
+        ("per-target + full sort", lambda: reference(ids, feats, n)),
+        ("batch engine + top-n", lambda: engine.score_topn(ids, feats, n, RULES)),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        print(f"{name:<24} {best * 1000:9.1f} ms  {count / best:12,.0f} targets/s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--targets", type=int, default=100_000)
+    ap.add_argument("--n", type=int, default=12)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    check_parity(args.seed)
+    bench(args.targets, args.n, args.seed, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+model-service 侧特征库（services/model/app/feature_store.py）：一致性校验 + 同步语义 + 内存/延迟基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/model_feature_store.py --objects 100000 --area-size 2000
+
+1. 一致性：随机特征（含缺失字段、显式 null、整数、字符串数值、非法值）写入特征库后按 target_ids / area_id 打分，
+   与直接把特征 dict 交给 engine.score_topn 的结果逐项比对；
+2. 同步：用 httpx.MockTransport 模拟 api 的 /objects/changes（键集分页），校验全量/增量同步、旧版本不覆盖新版本、
+   水位线只在读到末尾后推进、ensure(min_updated_at) 按需同步；
+3. 内存：特征库记录与等量 JSON 解码出的特征 dict 的内存占用（tracemalloc）；
+4. 延迟：一个区域的 topn 请求，“发送全部特征”（api 列式编码 + 模型侧解码 + 打分）与“按 target_ids 从特征库取”的耗时与请求体大小。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import httpx
+import msgpack
+
+SERVICES = Path(__file__).resolve().parents[1] / "services"
+sys.path.insert(0, str(SERVICES / "model"))
+
+from app import engine, feature_store, wire  # noqa: E402
+from app.feature_store import FeatureStore, StaleStore, columns_of  # noqa: E402
+from app.rules import rule_store  # noqa: E402
+
+RULES = rule_store.current()
+
+
+def load_api_wire():
+    spec = importlib.util.spec_from_file_location("api_wire", SERVICES / "api" / "app" / "wire.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+API_WIRE = load_api_wire()
+
+
+def make_features(rnd: random.Random) -> dict:
+    f: dict = {}
+    if rnd.random() > 0.05:
+        f["rain_now_mmph"] = round(rnd.uniform(0, 120), 1)
+    if rnd.random() > 0.05:
+        f["rain_1h_mm"] = rnd.choice([round(rnd.uniform(0, 90), 1), str(rnd.randint(0, 90)), rnd.randint(0, 90)])
+    if rnd.random() > 0.05:
+        f["water_level_m"] = rnd.choice([round(rnd.uniform(0, 7), 2), None, "bad", 3, True])
+    if rnd.random() > 0.1:
+        f["elevation_m"] = round(rnd.uniform(-1, 8), 2)
+    if rnd.random() > 0.1:
+        f["drainage_capacity"] = rnd.choice([0.5, 0.8, 1.0, 1.2, 1.4, 2])
+    if rnd.random() > 0.05:
+        f["pump_status"] = rnd.choice(["running", "fault", "DOWN", "offline", None, 1])
+    if rnd.random() > 0.05:
+        f["traffic_index"] = round(rnd.uniform(0, 1), 2)
+    if rnd.random() < 0.1:
+        f["note"] = rnd.choice(["", "积水", {"k": 1}, [1, 2]])
+    return f
+
+
+def expand(result: dict) -> list[dict]:
+    """列式结果展开为 items（与 api 侧 wire.expand_results 相同）。"""
+    body, _ = wire.encode_response(RULES, [result], None)
+    return API_WIRE.expand_results(json.loads(body))[0]
+
+
+def check_parity(rnd: random.Random) -> None:
+    store = FeatureStore(sync_url="")
+    ids = [f"a-{i % 7:03d}-road-{i:05d}" for i in range(3000)]
+    feats = {}
+    for i, oid in enumerate(ids):
+        feats[oid] = make_features(rnd)
+        store.upsert(oid, f"A-{i % 7:03d}", feats[oid], 1000.0 + i)
+    for _ in range(20):
+        sample = rnd.sample(ids, rnd.randint(0, 800))
+        n = rnd.choice([None, 0, 1, 12, 5000])
+        records, missing = store.lookup(target_ids=sample)
+        assert not missing
+        got = expand(engine.score_columns(sample, columns_of(records), n, RULES))
+        want = engine.score_topn(sample, [feats[o] for o in sample], n, RULES)
+        assert got == want, "stored scoring differs (target_ids)"
+    records, _ = store.lookup(area_id="A-003")
+    area_ids = sorted(o for i, o in enumerate(ids) if i % 7 == 3)
+    got = expand(engine.score_columns([r.object_id for r in records], columns_of(records), 12, RULES))
+    assert got == engine.score_topn(area_ids, [feats[o] for o in area_ids], 12, RULES), "stored scoring differs (area)"
+    print("parity: ok")
+
+
+class FakeChanges:
+    """内存版 /objects/changes：(updated_at, object_id) 键集分页，since 含下限。"""
+
+    def __init__(self):
+        self.rows: dict[str, dict] = {}
+        self.requests = 0
+
+    def put(self, oid: str, area: str, features: dict, updated_at: float, object_type: str = "road_segment") -> None:
+        self.rows[oid] = {"object_id": oid, "object_type": object_type, "area_id": area, "features": features, "updated_at": updated_at}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        q = request.url.params
+        limit = int(q["limit"])
+        rows = sorted(self.rows.values(), key=lambda r: (r["updated_at"], r["object_id"]))
+        if q.get("object_type"):
+            rows = [r for r in rows if r["object_type"] == q["object_type"]]
+        if q.get("since"):
+            rows = [r for r in rows if r["updated_at"] >= float(q["since"])]
+        if q.get("cursor"):
+            at, oid = json.loads(q["cursor"])
+            rows = [r for r in rows if (r["updated_at"], r["object_id"]) > (at, oid)]
+        page = rows[:limit]
+        cursor = json.dumps([page[-1]["updated_at"], page[-1]["object_id"]]) if len(page) == limit else None
+        return httpx.Response(200, content=msgpack.packb({"items": page, "next_cursor": cursor}))
+
+
+async def check_sync() -> None:
+    src = FakeChanges()
+    store = FeatureStore(sync_url="http://api.test", transport=httpx.MockTransport(src.handler))
+    feature_store.MODEL_FEATURE_SYNC_PAGE = 7  # 小页，覆盖多页键集分页
+    for i in range(50):
+        src.put(f"r{i:03d}", "A-001", {"rain_now_mmph": float(i)}, 100.0 + i // 4)
+    src.put("pump-1", "A-001", {"pump_status": "fault"}, 120.0, object_type="pump_station")
+
+    assert await store.sync() == 50
+    assert store.watermark == 112.0 and store.stats()["objects"] == 50
+    # 增量：从水位线回退 2 秒处重读（updated_at >= 110 的行幂等重放），新变化（含换区域）被合并
+    src.put("r001", "A-002", {"rain_now_mmph": 99.0}, 130.0)
+    src.put("r002", "A-001", {"rain_now_mmph": -1.0}, 111.5)
+    assert await store.sync() == sum(1 for r in src.rows.values() if r["object_type"] == "road_segment" and r["updated_at"] >= 110.0)
+    records, _ = store.lookup(target_ids=["r001", "r002"])
+    assert records[0].area_id == "A-002" and list(records[0].nums) == [99.0]
+    assert list(records[1].nums) == [-1.0]
+    assert [r.object_id for r in store.lookup(area_id="A-002")[0]] == ["r001"]
+    assert store.watermark == 130.0
+    # 更旧的版本（如乱序到达）不覆盖已有记录
+    assert not store.upsert("r002", "A-001", {"rain_now_mmph": 5.0}, 111.0)
+    assert list(store.lookup(target_ids=["r002"])[0][0].nums) == [-1.0]
+
+    # 按需同步：要求的水位线高于当前时先拉一轮；数据源也没有时拒绝
+    src.put("r003", "A-001", {"rain_now_mmph": 7.5}, 140.0)
+    before = src.requests
+    await store.ensure(min_updated_at=140.0)
+    assert src.requests > before and store.watermark == 140.0
+    await store.ensure(min_updated_at=135.0, target_ids=["r003"])  # 已满足：不再请求
+    try:
+        await store.ensure(min_updated_at=150.0)
+        raise AssertionError("expected StaleStore")
+    except StaleStore:
+        pass
+    try:
+        await store.ensure(target_ids=["r999"])
+        raise AssertionError("expected StaleStore")
+    except StaleStore:
+        pass
+    await store.stop()
+    print("sync: ok", {k: store.stats()[k] for k in ("syncs", "pages", "on_demand", "rejected")})
+
+
+def measure(objects: int, area_size: int, rnd: random.Random) -> None:
+    rows = [
+        {"object_id": f"a-{i // area_size:03d}-road-{i:07d}", "area_id": f"A-{i // area_size:03d}", "features": make_features(rnd)}
+        for i in range(objects)
+    ]
+    encoded = [json.dumps(r["features"]) for r in rows]
+
+    gc.collect()
+    tracemalloc.start()
+    dicts = [json.loads(e) for e in encoded]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del dicts
+
+    store = FeatureStore(sync_url="")
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for i, (r, e) in enumerate(zip(rows, encoded)):
+        store.upsert(r["object_id"], r["area_id"], json.loads(e), 1000.0 + i)
+    load_s = time.perf_counter() - t0
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(
+        f"memory {objects:,} objects: feature dicts {dict_bytes / 2**20:7.1f} MiB   "
+        f"store {store_bytes / 2**20:7.1f} MiB   (upsert {load_s * 1e6 / objects:.1f} us/object)"
+    )
+
+    area = rows[:area_size]
+    ids = [r["object_id"] for r in area]
+    payload = {"time": "2026-07-01T08:00:00+00:00", "area_id": "A-000", "targets": [{"target_id": r["object_id"], "features": r["features"]} for r in area], "n": None}
+    stored_body = json.dumps({"target_ids": ids, "n": None, "min_updated_at": 1.0}).encode("utf-8")
+
+    def shipped():
+        body = API_WIRE.encode_request([payload])
+        ((tids, cols, n),) = wire.decode_request(body, wire.MSGPACK)
+        return engine.score_columns(tids, cols, n, RULES)
+
+    def stored():
+        records, _ = store.lookup(target_ids=json.loads(stored_body)["target_ids"])
+        return engine.score_columns(ids, columns_of(records), None, RULES)
+
+    assert expand(shipped()) == expand(stored())
+    for name, fn, size in (
+        ("ship features (packed)", shipped, len(API_WIRE.encode_request([payload]))),
+        ("JSON /infer/topn body", None, len(json.dumps(payload).encode("utf-8"))),
+        ("target_ids from store", stored, len(stored_body)),
+    ):
+        if fn is None:
+            print(f"{name:24s} {'':>26s} request {size / 1024:8.1f} KiB")
+            continue
+        samples = []
+        for _ in range(20):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        print(f"{name:24s} {area_size:,} targets p50 {samples[10]:7.2f} ms  request {size / 1024:8.1f} KiB")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--objects", type=int, default=100_000)
+    ap.add_argument("--area-size", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+    check_parity(rnd)
+    asyncio.run(check_sync())
+    measure(args.objects, args.area_size, rnd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+api -> model-service 传输格式：JSON（/infer/topn）与 MessagePack 列式（/infer/topn/packed）一致性校验 + 延迟基准（演示级）。
+
+用法（在 demo-os 目录下）：
+
+    python bench/model_wire.py --sizes 200,2000,20000 --rounds 20
+
+启动一个 model-service 子进程，在本进程内以 api 的 ModelClient（关闭微批）分别用两种格式发同一批请求：
+先用随机特征（含缺失字段、显式 null、字符串数值、非法值）比对两种格式展开后的 items 逐项一致
+（全量排序与 TopN、单请求与多请求），再按请求规模统计往返延迟 p50/p99 与请求/响应体大小。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+SERVICES = Path(__file__).resolve().parents[1] / "services"
+# 共用模块 services/common（flood_common）：未 pip install 时直接从源码目录导入，服务子进程经 PYTHONPATH 继承
+COMMON = SERVICES / "common"
+sys.path.insert(0, str(COMMON))
+os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, (str(COMMON), os.environ.get("PYTHONPATH"))))
+
+
+def load_api_module(name: str):
+    """以别名包 flood_api 导入 services/api/app 下的模块（不触发 api 的数据库等初始化）。"""
+    if "flood_api" not in sys.modules:
+        spec = importlib.machinery.ModuleSpec("flood_api", None, is_package=True)
+        spec.submodule_search_locations = [str(SERVICES / "api" / "app")]
+        sys.modules["flood_api"] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f"flood_api.{name}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_payload(count: int, rnd: random.Random, n: int | None) -> dict:
+    targets = []
+    for i in range(count):
+        f: dict = {}
+        if rnd.random() > 0.05:
+            f["rain_now_mmph"] = round(rnd.uniform(0, 120), 1)
+        if rnd.random() > 0.05:
+            f["rain_1h_mm"] = rnd.choice([round(rnd.uniform(0, 90), 1), str(rnd.randint(0, 90))])
+        if rnd.random() > 0.05:
+            f["water_level_m"] = rnd.choice([round(rnd.uniform(0, 7), 2), None, "bad", 3])
+        if rnd.random() > 0.1:
+            f["elevation_m"] = round(rnd.uniform(-1, 8), 2)
+        if rnd.random() > 0.1:
+            f["drainage_capacity"] = rnd.choice([0.5, 0.8, 1.0, 1.2, 1.4, 2])
+        if rnd.random() > 0.05:
+            f["pump_status"] = rnd.choice(["running", "fault", "DOWN", "offline", None])
+        if rnd.random() > 0.05:
+            f["traffic_index"] = round(rnd.uniform(0, 1), 2)
+        if rnd.random() < 0.2:
+            f["note"] = rnd.choice(["", "积水", {"k": 1}])
+        targets.append({"target_id": f"a-{i % 97:03d}-road-{i:07d}", "features": f})
+    return {"time": "2026-07-01T08:00:00+00:00", "area_id": "A-001", "targets": targets, "n": n}
+
+
+async def check_parity(json_client, packed_client, rnd: random.Random) -> None:
+    cases = [[make_payload(500, rnd, None)], [make_payload(500, rnd, 12)], [make_payload(0, rnd, 5)]]
+    cases.append([make_payload(rnd.randint(1, 300), rnd, rnd.choice([None, 0, 3, 50])) for _ in range(5)])
+    for payloads in cases:
+        a = await json_client._score(payloads)
+        b = await packed_client._score(payloads)
+        assert a == b, "json / msgpack results differ"
+    print("parity: ok")
+
+
+async def bench(url: str, sizes: list[int], rounds: int, seed: int) -> None:
+    model_client = load_api_module("model_client")
+    wire = load_api_module("wire")
+    clients = {
+        fmt: model_client.ModelClient(base_url=url, batch_window_ms=0, wire_format=fmt) for fmt in ("json", "msgpack")
+    }
+    for c in clients.values():
+        await c.start()
+    rnd = random.Random(seed)
+    try:
+        await check_parity(clients["json"], clients["msgpack"], rnd)
+        for size in sizes:
+            for n in (None, 12):
+                payload = make_payload(size, rnd, n)
+                req_bytes = {
+                    "json": len(json.dumps(payload, ensure_ascii=False).encode("utf-8")),
+                    "msgpack": len(wire.encode_request([payload])),
+                }
+                for fmt, client in clients.items():
+                    await client.infer_topn(payload)  # 预热
+                    samples = []
+                    for _ in range(rounds):
+                        t0 = time.perf_counter()
+                        await client.infer_topn(payload)
+                        samples.append((time.perf_counter() - t0) * 1000)
+                    samples.sort()
+                    label = f"{size:>7,} targets n={'all' if n is None else n:<4} {fmt:8s}"
+                    print(
+                        f"{label} p50 {samples[len(samples) // 2]:8.1f} ms  p99 {samples[int(len(samples) * 0.99)]:8.1f} ms"
+                        f"  request {req_bytes[fmt] / 1024:9,.1f} KiB"
+                    )
+    finally:
+        for c in clients.values():
+            await c.close()
+
+
+async def wait_healthy(url: str, timeout_s: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while True:
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"model-service not healthy: {url}")
+            await asyncio.sleep(0.2)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    if args.model_url:
+        await bench(args.model_url.rstrip("/"), sizes, args.rounds, args.seed)
+        return
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=SERVICES / "model", env={**os.environ, "MODEL_RULES_POLL_S": "0"})
+    try:
+        url = f"http://127.0.0.1:{port}"
+        await wait_healthy(url)
+        await bench(url, sizes, args.rounds, args.seed)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="200,2000,20000", help="每个请求的目标数，逗号分隔")
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--model-url", default=None, help="已运行的 model-service（默认启动一个子进程）")
+    ap.add_argument("--seed", type=int, default=7)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
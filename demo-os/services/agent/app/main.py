@@ -1,23 +1,63 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import os
+import time
+from contextlib import asynccontextmanager
 from typing import Any
 
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 # LangChain 用于“工具调用式智能体”编排（演示级：无 Key 时仍可用规则式策略）
 from langchain_core.tools import tool
 
+from flood_common import metrics
+
+from .summary_cache import fingerprint, summary_cache
+
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://api:8000").rstrip("/")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "").strip()
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
-
-
-app = FastAPI(title="Flood Demo Agent Service", version="0.1.0")
+# agent -> api 长连接池大小；单次工具调用 / LLM 调用超时（秒）
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", "15"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "25"))
+# 多区域批量研判：同时在途的区域数上限、单次请求区域数上限
+AGENT_BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "8"))
+AGENT_BATCH_MAX_AREAS = int(os.getenv("AGENT_BATCH_MAX_AREAS", "200"))
+
+
+# 进程级 HTTP 客户端：由 lifespan 创建/关闭，所有工具调用复用 keep-alive 连接
+_api_client: httpx.AsyncClient | None = None
+_llm_client: httpx.AsyncClient | None = None
+# 工具调用耗时统计：name -> {calls, errors, timeouts, total_ms, max_ms}
+_tool_stats: dict[str, dict[str, float]] = {}
+# 流式响应断开后仍需跑完的后台任务（保持强引用）
+_background: set[asyncio.Task] = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _api_client, _llm_client
+    limits = httpx.Limits(max_connections=API_POOL_SIZE, max_keepalive_connections=API_POOL_SIZE)
+    _api_client = httpx.AsyncClient(base_url=API_BASE_URL, limits=limits, timeout=TOOL_TIMEOUT_S)
+    _llm_client = httpx.AsyncClient(timeout=LLM_TIMEOUT_S)
+    try:
+        yield
+    finally:
+        await _api_client.aclose()
+        await _llm_client.aclose()
+        _api_client = _llm_client = None
+
+
+app = FastAPI(title="Flood Demo Agent Service", version="0.1.0", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 class ChatRequest(BaseModel):
@@ -35,20 +75,84 @@ class ChatResponse(BaseModel):
     tasks: list[dict[str, Any]] = Field(default_factory=list)
     evidence: list[dict[str, Any]] = Field(default_factory=list)
     risk_controls: dict[str, Any] = Field(default_factory=dict)
+    # 本次请求各步骤耗时（毫秒），用于定位 chat 延迟
+    timings_ms: dict[str, float] = Field(default_factory=dict)
+
+
+class BatchArea(BaseModel):
+    area_id: str
+    target_id: str | None = None
+    incident_id: str | None = None
+
+
+class BatchChatRequest(BaseModel):
+    areas: list[BatchArea] = Field(min_length=1, max_length=AGENT_BATCH_MAX_AREAS)
+    message: str
+
+
+class AreaResult(BaseModel):
+    area_id: str
+    ok: bool
+    plan: ChatResponse | None = None
+    error: str | None = None
+
+
+class BatchChatResponse(BaseModel):
+    # 全市研判摘要（一次大模型调用汇总各区域；无 Key/失败时为规则式拼接）
+    summary: str
+    results: list[AreaResult]
+    timings_ms: dict[str, float] = Field(default_factory=dict)
+
+
+def _client() -> httpx.AsyncClient:
+    if _api_client is None:
+        raise RuntimeError("agent http client not started")
+    return _api_client
 
 
 async def api_get(path: str, params: dict[str, Any] | None = None) -> Any:
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        r = await client.get(f"{API_BASE_URL}{path}", params=params)
-        r.raise_for_status()
-        return r.json()
+    # X-Trace-Id 透传到 api（再由 api 透传到 model-service）
+    r = await _client().get(path, params=params, headers=metrics.trace_headers())
+    r.raise_for_status()
+    return r.json()
 
 
 async def api_post(path: str, payload: dict[str, Any]) -> Any:
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.post(f"{API_BASE_URL}{path}", json=payload)
-        r.raise_for_status()
-        return r.json()
+    r = await _client().post(path, json=payload, headers=metrics.trace_headers())
+    r.raise_for_status()
+    return r.json()
+
+
+def _stat(name: str) -> dict[str, float]:
+    return _tool_stats.setdefault(name, {"calls": 0, "errors": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+
+async def timed(name: str, aw: Any, timings: dict[str, float], timeout: float = TOOL_TIMEOUT_S) -> Any:
+    """带超时执行一次工具/LLM 调用，记录耗时到本次请求 timings 与进程级统计。"""
+    st = _stat(name)
+    st["calls"] += 1
+    t0 = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            return await aw
+    except TimeoutError:
+        st["timeouts"] += 1
+        raise
+    except Exception:
+        st["errors"] += 1
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        timings[name] = round(ms, 2)
+        st["total_ms"] += ms
+        st["max_ms"] = max(st["max_ms"], ms)
+        metrics.record(name, ms)
+
+
+def _tool_error(name: str, e: Exception) -> HTTPException:
+    if isinstance(e, TimeoutError):
+        return HTTPException(504, f"{name} timed out")
+    return HTTPException(502, f"{name} failed: {e}")
 
 
 # -----------------------
@@ -152,11 +256,39 @@ async def _call_deepseek(prompt: str) -> str:
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.2,
     }
-    async with httpx.AsyncClient(timeout=25.0) as client:
-        r = await client.post(url, headers=headers, json=payload)
+    if _llm_client is None:
+        raise RuntimeError("agent http client not started")
+    r = await _llm_client.post(url, headers=headers, json=payload)
+    r.raise_for_status()
+    data = r.json()
+    return data["choices"][0]["message"]["content"]
+
+
+async def _stream_deepseek(prompt: str):
+    """流式调用（stream=true）：逐个产出 choices[0].delta.content。"""
+    if not DEEPSEEK_API_KEY:
+        raise RuntimeError("no deepseek api key")
+    if _llm_client is None:
+        raise RuntimeError("agent http client not started")
+    url = f"{DEEPSEEK_BASE_URL}/v1/chat/completions"
+    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
+    payload = {
+        "model": DEEPSEEK_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+        "stream": True,
+    }
+    async with _llm_client.stream("POST", url, headers=headers, json=payload) as r:
         r.raise_for_status()
-        data = r.json()
-        return data["choices"][0]["message"]["content"]
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta") or {}
+            if delta.get("content"):
+                yield delta["content"]
 
 
 @app.get("/health")
@@ -164,41 +296,301 @@ def health():
     return {"ok": True, "deepseek_enabled": bool(DEEPSEEK_API_KEY)}
 
 
+@app.get("/metrics")
+def service_metrics():
+    """按路由的延迟直方图、在途请求数、每请求各工具/LLM 调用次数与耗时。"""
+    return metrics.registry.snapshot("agent")
+
+
+@app.get("/metrics/traces")
+def trace_metrics(trace_id: str | None = None, limit: int = Query(default=50, ge=1, le=1000)):
+    return metrics.registry.find_traces(trace_id, limit)
+
+
+@app.get("/metrics/tools")
+def tool_metrics():
+    """各工具/LLM 调用的次数、失败、超时与耗时（总计/平均/最大，毫秒）。"""
+    return {
+        name: {**st, "avg_ms": (st["total_ms"] / st["calls"]) if st["calls"] else 0.0}
+        for name, st in _tool_stats.items()
+    }
+
+
+@app.get("/metrics/summary-cache")
+def summary_cache_metrics():
+    return summary_cache.stats()
+
+
+SUMMARY_PROMPT = (
+    "你是应急指挥参谋，请根据以下TopN风险清单，生成一段不超过120字的研判摘要，"
+    "必须提到最高风险点位、风险等级、主要原因（3条以内），不要编造证据。\n\n"
+)
+
+
+def _summary_prompt(topn: dict) -> tuple[str, str]:
+    """返回 (prompt, 缓存 key)。只取 TopN 条目并规范化，响应时间戳不影响缓存命中。"""
+    items = topn.get("items", [])
+    prompt = SUMMARY_PROMPT + "TopN=" + json.dumps(items, ensure_ascii=False, sort_keys=True) + "\n"
+    return prompt, fingerprint(DEEPSEEK_MODEL, SUMMARY_PROMPT, items)
+
+
+def _wants_dispatch(message: str) -> bool:
+    # 一句话：如果用户发“下发/派单”等，自动触发工作流
+    return any(k in message for k in ["下发", "派单", "生成任务", "一键"])
+
+
+async def _summarize(topn: dict, timings: dict[str, float]) -> str | None:
+    """可选：用 DeepSeek 生成更自然的 summary；失败/超时返回 None（回退规则式摘要）。"""
+    if not DEEPSEEK_API_KEY:
+        return None
+    prompt, key = _summary_prompt(topn)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        summary = (await timed("llm_summary", _call_deepseek(prompt), timings, LLM_TIMEOUT_S)).strip()
+    except Exception:
+        return None
+    if summary:
+        summary_cache.put(key, summary)
+    return summary
+
+
+async def _dispatch(incident_id: str, tasks: list[dict], timings: dict[str, float]) -> dict:
+    try:
+        pack = await timed("create_task_pack", create_task_pack.ainvoke({"incident_id": incident_id, "tasks": tasks}), timings)
+        return await timed("trigger_workflow", trigger_workflow.ainvoke({"incident_id": incident_id, "task_pack": pack}), timings)
+    except Exception as e:
+        raise _tool_error("trigger_workflow", e)
+
+
+async def _plan(req: ChatRequest, timings: dict[str, float]) -> tuple[dict, ChatResponse]:
+    """建事件与 query_risk_topn 并发执行（互不依赖），再出规则式方案。"""
+
+    async def ensure_incident() -> str:
+        # 若没有 incident，自动创建
+        if req.incident_id:
+            return req.incident_id
+        payload = {"area_id": req.area_id, "title": "城市暴雨内涝处置事件（演示）"}
+        inc = await timed("create_incident", api_post("/workflow/incidents", payload), timings)
+        return inc["incident_id"]
+
+    try:
+        incident_id, topn = await asyncio.gather(
+            ensure_incident(),
+            timed("query_risk_topn", query_risk_topn.ainvoke({"area_id": req.area_id, "n": 5}), timings),
+        )
+    except Exception as e:
+        raise _tool_error("api", e)
+    return topn, _rule_based_plan(topn, incident_id, req.target_id)
+
+
 @app.post("/agent/chat", response_model=ChatResponse)
 async def chat(req: ChatRequest):
     """
     演示级智能体：
-    - 先调用工具 query_risk_topn 拿到 TopN
+    - 建事件与 query_risk_topn 并发执行（互不依赖）
     - 无 DeepSeek：走规则式编排（可稳定演示闭环）
-    - 有 DeepSeek：用大模型生成摘要（仍输出结构化 tasks，保持可控）
+    - 有 DeepSeek：用大模型生成摘要（仍输出结构化 tasks，保持可控），与派单并发执行
     """
-    # 若没有 incident，自动创建
-    incident_id = req.incident_id
-    if not incident_id:
-        inc = await api_post("/workflow/incidents", {"area_id": req.area_id, "title": "城市暴雨内涝处置事件（演示）"})
-        incident_id = inc["incident_id"]
-
-    topn = await query_risk_topn.ainvoke({"area_id": req.area_id, "n": 5})
-    base = _rule_based_plan(topn, incident_id, req.target_id)
-
-    # 可选：用 DeepSeek 生成更自然的 summary（保持结构化不变）
-    if DEEPSEEK_API_KEY:
-        prompt = (
-            "你是应急指挥参谋，请根据以下TopN风险清单，生成一段不超过120字的研判摘要，"
-            "必须提到最高风险点位、风险等级、主要原因（3条以内），不要编造证据。\n\n"
-            f"TopN={topn}\n"
-        )
-        try:
-            summary = await _call_deepseek(prompt)
-            base.summary = summary.strip()
-        except Exception:
-            # 回退
-            pass
-
-    # 一句话：如果用户发“下发/派单”等，自动触发工作流
-    if any(k in req.message for k in ["下发", "派单", "生成任务", "一键"]):
-        pack = await create_task_pack.ainvoke({"incident_id": incident_id, "tasks": base.tasks})
-        await trigger_workflow.ainvoke({"incident_id": incident_id, "task_pack": pack})
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+    topn, base = await _plan(req, timings)
+
+    # 摘要只依赖 TopN，派单只依赖规则式 tasks：两者并发；派单失败时取消仍在进行的 LLM 调用
+    summarize = asyncio.ensure_future(_summarize(topn, timings))
+    try:
+        if _wants_dispatch(req.message):
+            await _dispatch(base.incident_id, base.tasks, timings)
+        summary = await summarize
+    finally:
+        summarize.cancel()
+    if summary:
+        base.summary = summary
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 2)
+    base.timings_ms = timings
     return base
 
 
+BATCH_SUMMARY_PROMPT = (
+    "你是应急指挥参谋，以下是全市各区域的TopN风险研判（每行一个区域），"
+    "请生成一段不超过200字的全市研判摘要：按风险从高到低点名最需要优先处置的区域与点位，"
+    "给出统筹建议，不要编造证据。\n\n"
+)
+
+
+async def _summarize_batch(plans: list[ChatResponse], areas: list[str], timings: dict[str, float]) -> str:
+    """各区域规则式摘要合并成一次大模型请求；无 Key/失败/超时回退为规则式拼接。"""
+    fallback = "\n".join(f"[{a}] {p.summary}" for a, p in zip(areas, plans))
+    if not DEEPSEEK_API_KEY or not plans:
+        return fallback
+    lines = [
+        {"area_id": a, "summary": p.summary, "recommendations": p.recommendations}
+        for a, p in zip(areas, plans)
+    ]
+    key = fingerprint(DEEPSEEK_MODEL, BATCH_SUMMARY_PROMPT, lines)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+    prompt = BATCH_SUMMARY_PROMPT + "\n".join(json.dumps(x, ensure_ascii=False, sort_keys=True) for x in lines)
+    try:
+        summary = (await timed("llm_batch_summary", _call_deepseek(prompt), timings, LLM_TIMEOUT_S)).strip()
+    except Exception:
+        return fallback
+    if not summary:
+        return fallback
+    summary_cache.put(key, summary)
+    return summary
+
+
+@app.post("/agent/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(req: BatchChatRequest):
+    """
+    多区域批量研判（全市暴雨时一次请求覆盖所有区域）：
+    - 各区域建事件 + query_risk_topn 受 AGENT_BATCH_CONCURRENCY 限流并发；
+    - 每个区域独立出规则式方案，失败区域单独返回 error，不影响其它区域；
+    - 成功区域的摘要合并为一次大模型请求；需要派单时与该请求并发执行。
+    """
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+    sem = asyncio.Semaphore(AGENT_BATCH_CONCURRENCY)
+    area_timings: list[dict[str, float]] = [{} for _ in req.areas]
+
+    async def plan_area(i: int, area: BatchArea) -> ChatResponse:
+        async with sem:
+            sub = ChatRequest(area_id=area.area_id, target_id=area.target_id, incident_id=area.incident_id, message=req.message)
+            _, base = await _plan(sub, area_timings[i])
+            return base
+
+    planned = await asyncio.gather(*(plan_area(i, a) for i, a in enumerate(req.areas)), return_exceptions=True)
+    timings["plan"] = round((time.perf_counter() - t0) * 1000, 2)
+    ok = [(i, p) for i, p in enumerate(planned) if isinstance(p, ChatResponse)]
+
+    dispatch_errors: dict[int, Exception] = {}
+
+    async def dispatch_area(i: int, plan: ChatResponse) -> None:
+        async with sem:
+            try:
+                await _dispatch(plan.incident_id, plan.tasks, area_timings[i])
+            except Exception as e:
+                dispatch_errors[i] = e
+
+    steps = [_summarize_batch([p for _, p in ok], [req.areas[i].area_id for i, _ in ok], timings)]
+    if _wants_dispatch(req.message):
+        steps.append(asyncio.gather(*(dispatch_area(i, p) for i, p in ok if p.tasks)))
+    summary, *_ = await asyncio.gather(*steps)
+
+    results: list[AreaResult] = []
+    for i, (area, p) in enumerate(zip(req.areas, planned)):
+        if isinstance(p, ChatResponse):
+            p.timings_ms = area_timings[i]
+            err = dispatch_errors.get(i)
+            results.append(AreaResult(area_id=area.area_id, ok=err is None, plan=p, error=_error_text(err) if err else None))
+        else:
+            results.append(AreaResult(area_id=area.area_id, ok=False, error=_error_text(p)))
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 2)
+    return BatchChatResponse(summary=summary, results=results, timings_ms=timings)
+
+
+def _error_text(e: BaseException) -> str:
+    return str(e.detail) if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+
+
+def _sse(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+@app.post("/agent/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    流式智能体（SSE）：
+    - plan：规则式结构化方案（拿到 TopN 即返回，不等大模型）
+    - summary_delta：大模型摘要增量 token；summary：最终摘要（cached/fallback 标记来源）
+    - dispatch：派单结果（消息含“下发/派单”等时，与摘要并发执行）
+    - done：各步骤耗时
+    """
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+    topn, base = await _plan(req, timings)
+
+    async def events():
+        yield _sse("plan", base.model_dump(exclude={"timings_ms"}))
+        dispatch = None
+        if _wants_dispatch(req.message):
+            dispatch = asyncio.create_task(_dispatch(base.incident_id, base.tasks, timings))
+        summary = _stream_summary(topn, base.summary, timings)
+        try:
+            async for event, data in summary:
+                yield _sse(event, data)
+            if dispatch is not None:
+                try:
+                    result = await dispatch
+                    yield _sse("dispatch", {"ok": True, **result})
+                except HTTPException as e:
+                    yield _sse("dispatch", {"ok": False, "error": e.detail})
+            timings["total"] = round((time.perf_counter() - t0) * 1000, 2)
+            yield _sse("done", {"timings_ms": timings})
+        finally:
+            # 客户端提前断开：关闭摘要流（连带上游 LLM 请求）；已发起的派单照常在后台完成
+            await summary.aclose()
+            if dispatch is not None and not dispatch.done():
+                _background.add(dispatch)
+                dispatch.add_done_callback(_background.discard)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _stream_summary(topn: dict, fallback: str, timings: dict[str, float]):
+    """产出 (event, data)：缓存命中直接给整段摘要；否则逐 token 转发，失败时回退规则式摘要。"""
+    if not DEEPSEEK_API_KEY:
+        yield "summary", {"summary": fallback, "fallback": True}
+        return
+    prompt, key = _summary_prompt(topn)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        yield "summary_delta", {"text": cached}
+        yield "summary", {"summary": cached, "cached": True}
+        return
+
+    st = _stat("llm_summary_stream")
+    st["calls"] += 1
+    parts: list[str] = []
+    t1 = time.perf_counter()
+    # 超时预算只计入等待上游 token 的时间（每次 __anext__ 单独 wait_for），不跨 yield：
+    # 消费方发送变慢不占预算，超时也不会落在响应任务上，回退摘要照常发出
+    loop = asyncio.get_running_loop()
+    budget = LLM_TIMEOUT_S
+    stream = _stream_deepseek(prompt)
+    try:
+        while True:
+            t2 = loop.time()
+            try:
+                token = await asyncio.wait_for(anext(stream), budget)
+            except StopAsyncIteration:
+                break
+            budget = max(budget - (loop.time() - t2), 0.0)
+            if not parts:
+                timings["llm_first_token"] = round((time.perf_counter() - t1) * 1000, 2)
+                metrics.registry.observe("llm_first_token_ms", timings["llm_first_token"])
+            parts.append(token)
+            yield "summary_delta", {"text": token}
+    except Exception as e:
+        st["timeouts" if isinstance(e, TimeoutError) else "errors"] += 1
+        yield "summary", {"summary": "".join(parts).strip() or fallback, "fallback": True}
+        return
+    finally:
+        # 正常结束、超时或客户端断开（GeneratorExit）都关闭上游流，释放连接
+        await stream.aclose()
+        ms = (time.perf_counter() - t1) * 1000
+        timings["llm_summary_stream"] = round(ms, 2)
+        metrics.record("llm_summary_stream", ms)
+        st["total_ms"] += ms
+        st["max_ms"] = max(st["max_ms"], ms)
+    summary = "".join(parts).strip()
+    if summary:
+        summary_cache.put(key, summary)
+    yield "summary", {"summary": summary or fallback, "fallback": not summary}
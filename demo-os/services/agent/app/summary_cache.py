@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+# LLM 研判摘要缓存（演示级）：
+# - key 为 (模型名, prompt, TopN 条目) 规范化 JSON 的 sha256；TopN 响应中的 time 不参与，
+#   同一批风险点位在 TTL 内重复研判时直接复用摘要，不再请求大模型；
+# - 进程内 LRU，条目数与 TTL 均有上限。
+
+SUMMARY_CACHE_MAX = int(os.getenv("SUMMARY_CACHE_MAX", "256"))
+SUMMARY_CACHE_TTL_S = float(os.getenv("SUMMARY_CACHE_TTL_S", "120"))
+
+
+def fingerprint(model: str, prompt: str, items: list[dict[str, Any]]) -> str:
+    canonical = json.dumps(
+        {"model": model, "prompt": prompt, "items": items},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, max_entries: int = SUMMARY_CACHE_MAX, ttl_s: float = SUMMARY_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> str | None:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key: str, summary: str) -> None:
+        self._data[key] = (time.monotonic() + self.ttl_s, summary)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+summary_cache = SummaryCache()
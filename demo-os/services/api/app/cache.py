@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+try:  # 可选依赖：未安装 redis 或未配置 REDIS_URL 时使用进程内缓存
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover
+    aioredis = None
+
+
+# 读缓存（演示级）：
+# - 后端：REDIS_URL 可用时用 Redis，否则退化为进程内 LRU+TTL（本地/测试可用）；
+# - 失效：按 key 删除（对象快照），或对命名空间代数 +1（topn/战报：旧代数的 key 自然失效）；
+# - 对象快照 key 不带代数（否则任一写入都会让所有对象快照失效），改为回填守卫：加载前后比较 objects 命名空间代数，
+#   加载期间有写入（代数变化）就只返回结果、不写缓存，避免“先读旧值、失效之后才写入”把旧快照留满一个 TTL；
+# - 防击穿：同一 key 进程内 single-flight；Redis 下再加短锁，其它进程短暂等待回填；
+# - Redis 异常时直接回源，不影响接口可用性。
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_LOCAL_MAX_KEYS = int(os.getenv("CACHE_LOCAL_MAX_KEYS", "10000"))
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "2000"))
+CACHE_KEY_PREFIX = "flood:"
+
+
+class LocalBackend:
+    """进程内 LRU + TTL。"""
+
+    name = "local"
+
+    def __init__(self, max_keys: int = CACHE_LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    async def get(self, key: str) -> str | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl_s: float | None) -> None:
+        self._data[key] = ((time.monotonic() + ttl_s) if ttl_s else 0.0, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+
+    async def delete(self, keys: list[str]) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int((await self.get(key)) or 0) + 1
+        await self.set(key, str(value), None)
+        return value
+
+    async def acquire_lock(self, key: str) -> bool:
+        # 进程内已由 single-flight 保证只有一个加载者
+        return True
+
+    async def release_lock(self, key: str) -> None:
+        return None
+
+    async def close(self) -> None:
+        self._data.clear()
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, url: str):
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> str | None:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: str, ttl_s: float | None) -> None:
+        await self._redis.set(key, value, px=int(ttl_s * 1000) if ttl_s else None)
+
+    async def delete(self, keys: list[str]) -> None:
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return int(await self._redis.incr(key))
+
+    async def acquire_lock(self, key: str) -> bool:
+        return bool(await self._redis.set(f"{key}:lock", "1", nx=True, px=CACHE_LOCK_TTL_MS))
+
+    async def release_lock(self, key: str) -> None:
+        await self._redis.delete(f"{key}:lock")
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class Cache:
+    def __init__(self):
+        self.backend: LocalBackend | RedisBackend = LocalBackend()
+        self._flights: dict[str, asyncio.Future] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "coalesced": 0,
+            "invalidations": 0,
+            "stale_skips": 0,
+            "errors": 0,
+        }
+
+    async def start(self) -> None:
+        if REDIS_URL and aioredis is not None:
+            backend = RedisBackend(REDIS_URL)
+            try:
+                await backend._redis.ping()
+                self.backend = backend
+            except Exception as e:
+                logger.warning("redis unavailable (%s), falling back to in-process cache", e)
+                await backend.close()
+
+    async def close(self) -> None:
+        await self.backend.close()
+        self.backend = LocalBackend()
+
+    def _key(self, key: str) -> str:
+        return CACHE_KEY_PREFIX + key
+
+    async def _get(self, key: str) -> Any | None:
+        try:
+            raw = await self.backend.get(self._key(key))
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning("cache get %s failed: %s", key, e)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    async def _set(self, key: str, value: Any, ttl_s: float) -> None:
+        try:
+            await self.backend.set(self._key(key), json.dumps(value, ensure_ascii=False, separators=(",", ":")), ttl_s)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning("cache set %s failed: %s", key, e)
+
+    async def generation(self, namespace: str) -> int:
+        """命名空间当前代数；失效时 +1，拼进 key 后旧缓存不再命中。"""
+        try:
+            raw = await self.backend.get(self._key(f"gen:{namespace}"))
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning("cache generation %s failed: %s", namespace, e)
+            return -1
+        return int(raw or 0)
+
+    async def get_or_load(
+        self, key: str, ttl_s: float, loader: Callable[[], Awaitable[Any]], guard: str | None = None
+    ) -> Any:
+        """命中直接返回；未命中时同 key 只有一个调用方执行 loader，其余等待其结果。
+
+        guard 为命名空间：loader 执行期间该命名空间代数变化（有写入）时结果不写入缓存。
+        """
+        if not CACHE_ENABLED:
+            return await loader()
+        value = await self._get(key)
+        if value is not None:
+            self._stats["hits"] += 1
+            return value
+        self._stats["misses"] += 1
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self._stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                # 被取消的是领头者而不是自己：重新走一遍（再查缓存，必要时由自己接任加载）
+                if not flight.cancelled():
+                    raise
+            return await self.get_or_load(key, ttl_s, loader, guard)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            value = await self._load(key, ttl_s, loader, guard)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # 没有其它等待者时避免 "exception was never retrieved"
+            flight.exception()
+            raise
+        finally:
+            self._flights.pop(key, None)
+
+    async def _load(self, key: str, ttl_s: float, loader: Callable[[], Awaitable[Any]], guard: str | None) -> Any:
+        full_key = self._key(key)
+        try:
+            locked = await self.backend.acquire_lock(full_key)
+        except Exception:
+            self._stats["errors"] += 1
+            locked = True
+        if not locked:
+            # 其它进程正在回填：短暂等待其结果，超时后自行加载
+            for _ in range(max(CACHE_LOCK_TTL_MS // 25, 1)):
+                await asyncio.sleep(0.025)
+                value = await self._get(key)
+                if value is not None:
+                    self._stats["coalesced"] += 1
+                    return value
+        try:
+            self._stats["loads"] += 1
+            gen = await self.generation(guard) if guard else None
+            value = await loader()
+            if value is not None:
+                if guard and (gen < 0 or await self.generation(guard) != gen):
+                    self._stats["stale_skips"] += 1
+                else:
+                    await self._set(key, value, ttl_s)
+            return value
+        finally:
+            if locked:
+                try:
+                    await self.backend.release_lock(full_key)
+                except Exception:
+                    self._stats["errors"] += 1
+
+    async def invalidate(self, keys: Iterable[str]) -> None:
+        full = [self._key(k) for k in keys]
+        if not full:
+            return
+        self._stats["invalidations"] += len(full)
+        try:
+            await self.backend.delete(full)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning("cache invalidate failed: %s", e)
+
+    async def bump(self, namespaces: Iterable[str]) -> None:
+        for ns in set(namespaces):
+            self._stats["invalidations"] += 1
+            try:
+                await self.backend.incr(self._key(f"gen:{ns}"))
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning("cache bump %s failed: %s", ns, e)
+
+    def stats(self) -> dict[str, Any]:
+        st = dict(self._stats)
+        lookups = st["hits"] + st["misses"]
+        st["hit_rate"] = (st["hits"] / lookups) if lookups else 0.0
+        st["backend"] = self.backend.name
+        st["enabled"] = CACHE_ENABLED
+        return st
+
+
+# 缓存 key 约定
+# 对象快照的回填守卫命名空间：任一对象写入后 +1
+OBJECT_NAMESPACE = "objects"
+
+
+def object_key(object_id: str) -> str:
+    return f"obj:{object_id}"
+
+
+def topn_namespace(area_id: str) -> str:
+    return f"topn:{area_id}"
+
+
+def incident_namespace(incident_id: str) -> str:
+    return f"incident:{incident_id}"
+
+
+cache = Cache()
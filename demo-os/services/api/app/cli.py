@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from . import history, incident_metrics, seed
+from .storage import db
+from .storage.models import Incident, ensure_schema
+
+
+# 运维命令（演示级）。在 services/api 目录下执行：
+#   python -m app.cli rebuild-metrics [--incident INC_ID] [--check]
+#   python -m app.cli seed --areas 100 --segments 10000 --pumps 50 --incidents 200 --tasks 4 [--seed N]
+#   python -m app.cli history-maintain   # 立即执行一次特征历史降采样/过期清理（api 进程内也会定期执行）
+
+
+async def _rebuild_metrics(incident_id: str | None, check_only: bool) -> int:
+    if incident_id:
+        ids = [incident_id]
+    else:
+        async with db.async_session() as s:
+            ids = list((await s.scalars(select(Incident.id).order_by(Incident.id))).all())
+    mismatched = 0
+    for iid in ids:
+        diff = await incident_metrics.rebuild(iid, write=not check_only)
+        if diff:
+            mismatched += 1
+            detail = ", ".join(f"{k}: {stored} -> {computed}" for k, (stored, computed) in sorted(diff.items()))
+            print(f"{iid}: {detail}")
+    action = "checked" if check_only else "rebuilt"
+    print(f"{action} {len(ids)} incident(s), {mismatched} inconsistent")
+    await db.async_engine.dispose()
+    return 1 if (check_only and mismatched) else 0
+
+
+def _seed(args: argparse.Namespace) -> int:
+    anchor = datetime.fromisoformat(args.anchor)
+    cfg = seed.SeedConfig(
+        areas=args.areas,
+        segments_per_area=args.segments,
+        pumps_per_area=args.pumps,
+        incidents_per_area=args.incidents,
+        tasks_per_incident=args.tasks,
+        ack_ratio=args.ack_ratio,
+        hotspot_ratio=args.hotspot_ratio,
+        history_days=args.history_days,
+        seed=args.seed,
+        anchor=anchor if anchor.tzinfo else anchor.replace(tzinfo=timezone.utc),
+        chunk_size=args.chunk_size,
+    )
+    result = seed.run(cfg, progress=None if args.quiet else print)
+    rows = ", ".join(f"{name}={count:,}" for name, count in sorted(result.rows.items())) or "none"
+    total = sum(result.rows.values())
+    rate = total / result.seconds if result.seconds else 0.0
+    print(
+        f"seeded {result.units} unit(s), skipped {result.skipped} already present; rows: {rows}; "
+        f"{result.seconds:.1f}s ({rate:,.0f} rows/s)"
+    )
+    return 0
+
+
+def _history_maintain() -> int:
+    if history.feature_history is None:
+        print("feature history disabled (HISTORY_ENABLED=false)")
+        return 1
+    done = history.feature_history.maintain()
+    history.feature_history.close()
+    print(f"downsampled {done['downsampled']} partition(s), removed {done['removed']}; {history.feature_history.stats()}")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-metrics", help="从 task/timeline_event 重算 incident_metrics")
+    p.add_argument("--incident", help="只处理指定事件")
+    p.add_argument("--check", action="store_true", help="只核对不写入；存在不一致时退出码为 1")
+
+    p = sub.add_parser("seed", help="批量生成合成区域/路段/事件/任务/时间线（可复现、可续跑）")
+    p.add_argument("--areas", type=int, default=3)
+    p.add_argument("--segments", type=int, default=12, help="每个区域的路段数")
+    p.add_argument("--pumps", type=int, default=0, help="每个区域的泵站数")
+    p.add_argument("--incidents", type=int, default=1, help="每个区域的事件数")
+    p.add_argument("--tasks", type=int, default=0, help="每个事件的任务数")
+    p.add_argument("--ack-ratio", type=float, default=0.6)
+    p.add_argument("--hotspot-ratio", type=float, default=0.25)
+    p.add_argument("--history-days", type=float, default=30.0)
+    p.add_argument("--seed", type=int, default=seed.SeedConfig.seed)
+    p.add_argument("--anchor", default=seed.DEFAULT_ANCHOR.isoformat(), help="事件时间锚点（ISO 8601）")
+    p.add_argument("--chunk-size", type=int, default=seed.SEED_CHUNK_SIZE, help="每个事务约写入的行数")
+    p.add_argument("--quiet", action="store_true")
+
+    sub.add_parser("history-maintain", help="特征历史：降采样过期 raw 分区、删除超出保留期的分区")
+
+    args = parser.parse_args(argv)
+    ensure_schema()
+    if args.command == "rebuild-metrics":
+        return asyncio.run(_rebuild_metrics(args.incident, args.check))
+    if args.command == "seed":
+        return _seed(args)
+    if args.command == "history-maintain":
+        return _history_maintain()
+    return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any
+from uuid import uuid4
+
+
+# 进程内事件总线（演示级）：
+# - 写路径（建事件/派单/回执/风险等级变化）提交后 publish 一次，总线按订阅过滤条件扇出；
+# - 每个订阅者一个有界队列，慢消费者溢出时收到 resync 并断开，由客户端重连；
+# - 最近 EVENT_BUFFER_SIZE 条事件留在环形缓冲区，断线重连按 Last-Event-ID 补发；
+#   超出缓冲区（或进程重启）时，时间线事件可按 cursor 从数据库补齐。
+# 多 worker 部署时每个进程各自一条总线（需要跨进程时可换成 Redis pub/sub）。
+
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "2048"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+
+
+class Subscription:
+    __slots__ = ("incident_id", "area_id", "queue", "overflowed")
+
+    def __init__(self, incident_id: str | None, area_id: str | None):
+        self.incident_id = incident_id
+        self.area_id = area_id
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, event: dict[str, Any]) -> bool:
+        if self.incident_id and event.get("incident_id") != self.incident_id:
+            return False
+        if self.area_id and event.get("area_id") != self.area_id:
+            return False
+        return True
+
+
+class EventBus:
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        # 进程启动标识：Last-Event-ID 来自其它进程/上次启动时不能按 seq 补发
+        self.boot_id = uuid4().hex[:8]
+        self._last_seq = 0
+        self._buffer: deque[dict[str, Any]] = deque(maxlen=buffer_size)
+        self._subs: set[Subscription] = set()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, kind: str, **fields: Any) -> dict[str, Any]:
+        self._last_seq += 1
+        event = {"id": f"{self.boot_id}:{self._last_seq}", "kind": kind, **fields}
+        self._buffer.append(event)
+        self.published += 1
+        for sub in self._subs:
+            if sub.overflowed or not sub.matches(event):
+                continue
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                sub.overflowed = True
+                self.dropped += 1
+        return event
+
+    def current_id(self) -> str:
+        """最近一条已发布事件的 id（用于补发/resync 事件，使客户端续传位置前移）。"""
+        return f"{self.boot_id}:{self._last_seq}"
+
+    def subscribe(self, incident_id: str | None = None, area_id: str | None = None) -> Subscription:
+        sub = Subscription(incident_id, area_id)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subs.discard(sub)
+
+    def replay(self, last_event_id: str, sub: Subscription) -> list[dict[str, Any]] | None:
+        """返回 last_event_id 之后、仍在缓冲区内的匹配事件；无法按 seq 续传时返回 None。"""
+        boot, _, seq = last_event_id.partition(":")
+        if boot != self.boot_id or not seq.isdigit() or not self._buffer:
+            return None
+        last = int(seq)
+        oldest = int(self._buffer[0]["id"].partition(":")[2])
+        if last < oldest - 1:
+            return None
+        return [e for e in self._buffer if int(e["id"].partition(":")[2]) > last and sub.matches(e)]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "subscribers": len(self._subs),
+            "published": self.published,
+            "dropped": self.dropped,
+            "buffered": len(self._buffer),
+        }
+
+
+def format_sse(event: dict[str, Any]) -> bytes:
+    data = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {data}\n\n".encode("utf-8")
+
+
+bus = EventBus()
@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import math
+import os
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import select
+
+from .storage import db
+from .storage.models import ObjectState
+
+
+# 进程内空间索引（演示级）：
+# - 坐标存放在 ObjectState.attrs 的 lon / lat（WGS84 经纬度），无需改表；
+# - 每种 object_type 一张等经纬度网格：cell = (floor(lon / GEO_CELL_DEG), floor(lat / GEO_CELL_DEG))，
+#   按类型过滤（如只查泵站）时不必扫描其他类型的对象；
+# - 距离用以查询点为原点的等距柱状投影（城市尺度内与大圆距离误差远小于 0.1%）；
+# - 半径 / kNN 都从查询点所在格向外逐圈扩展：已找满所需条数、且下一圈的最近可能距离超过当前第 k 名时停止，
+#   开销取决于返回条数而不是半径内的对象总数；
+# - 增量维护：本进程写入后直接 upsert；另有后台按 updated_at 水位线增量同步，
+#   覆盖其他 worker / 批量生成器写入的对象。
+
+logger = logging.getLogger(__name__)
+
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", "0.002"))  # 约 220 m（纬向）
+GEO_SYNC_INTERVAL_S = float(os.getenv("GEO_SYNC_INTERVAL_S", "5"))
+GEO_LOAD_PAGE = 20000
+# 水位线回退：容忍不同写入方之间的时钟/提交顺序差异（upsert 幂等，重复读无害）
+_SYNC_OVERLAP = timedelta(seconds=2)
+_M_PER_DEG = 111_320.0
+
+Cell = tuple[int, int]
+
+
+def location_of(attrs: dict[str, Any] | None) -> tuple[float, float] | None:
+    """从 attrs 取 (lon, lat)；缺失或越界返回 None。"""
+    if not attrs:
+        return None
+    lon, lat = attrs.get("lon"), attrs.get("lat")
+    if isinstance(lon, bool) or isinstance(lat, bool):
+        return None
+    if not isinstance(lon, (int, float)) or not isinstance(lat, (int, float)):
+        return None
+    if not (-180.0 <= lon <= 180.0 and -90.0 <= lat <= 90.0):
+        return None
+    return float(lon), float(lat)
+
+
+class _GeoEntry:
+    __slots__ = ("object_id", "object_type", "area_id", "lon", "lat", "cell")
+
+    def __init__(self, object_id: str, object_type: str, area_id: str, lon: float, lat: float, cell: Cell):
+        self.object_id = object_id
+        self.object_type = object_type
+        self.area_id = area_id
+        self.lon = lon
+        self.lat = lat
+        self.cell = cell
+
+
+class GeoIndex:
+    def __init__(self, cell_deg: float = GEO_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._entries: dict[str, _GeoEntry] = {}
+        # object_type -> cell -> {object_id: entry}
+        self._grids: dict[str, dict[Cell, dict[str, _GeoEntry]]] = {}
+        # 已占用格子的外包范围（只扩不缩），kNN 外扩的上限
+        self._bounds: list[int] | None = None
+        self._watermark: datetime | None = None
+        self._sync_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cell(self, lon: float, lat: float) -> Cell:
+        return math.floor(lon / self.cell_deg), math.floor(lat / self.cell_deg)
+
+    # ---------- 维护 ----------
+
+    def upsert(self, object_id: str, object_type: str, area_id: str, lon: float, lat: float) -> None:
+        cell = self._cell(lon, lat)
+        old = self._entries.get(object_id)
+        if old is not None and (old.cell != cell or old.object_type != object_type):
+            self._remove_from_cell(old)
+        entry = _GeoEntry(object_id, object_type, area_id, lon, lat, cell)
+        self._entries[object_id] = entry
+        self._grids.setdefault(object_type, {}).setdefault(cell, {})[object_id] = entry
+        b = self._bounds
+        if b is None:
+            self._bounds = [cell[0], cell[0], cell[1], cell[1]]
+        else:
+            b[0], b[1] = min(b[0], cell[0]), max(b[1], cell[0])
+            b[2], b[3] = min(b[2], cell[1]), max(b[3], cell[1])
+
+    def remove(self, object_id: str) -> None:
+        entry = self._entries.pop(object_id, None)
+        if entry is not None:
+            self._remove_from_cell(entry)
+
+    def _remove_from_cell(self, entry: _GeoEntry) -> None:
+        grid = self._grids.get(entry.object_type)
+        bucket = grid.get(entry.cell) if grid is not None else None
+        if bucket is not None:
+            bucket.pop(entry.object_id, None)
+            if not bucket:
+                del grid[entry.cell]
+
+    def apply_rows(self, rows: Iterable[tuple[str, str, str, dict[str, Any] | None]]) -> int:
+        """(object_id, object_type, area_id, attrs) 批量合并；attrs 无坐标的对象从索引移除。"""
+        count = 0
+        for oid, otype, area, attrs in rows:
+            loc = location_of(attrs)
+            if loc is None:
+                self.remove(oid)
+            else:
+                self.upsert(oid, otype, area, *loc)
+                count += 1
+        return count
+
+    async def sync(self) -> int:
+        """按 updated_at 水位线增量读取（首次为全量），分页合并进索引。"""
+        since = self._watermark - _SYNC_OVERLAP if self._watermark is not None else None
+        merged = 0
+        cursor: tuple[datetime, str] | None = None
+        while True:
+            stmt = select(
+                ObjectState.object_id,
+                ObjectState.object_type,
+                ObjectState.area_id,
+                ObjectState.attrs,
+                ObjectState.updated_at,
+            )
+            if since is not None:
+                stmt = stmt.where(ObjectState.updated_at >= since)
+            if cursor is not None:
+                stmt = stmt.where(
+                    (ObjectState.updated_at > cursor[0])
+                    | ((ObjectState.updated_at == cursor[0]) & (ObjectState.object_id > cursor[1]))
+                )
+            stmt = stmt.order_by(ObjectState.updated_at, ObjectState.object_id).limit(GEO_LOAD_PAGE)
+            async with db.async_session() as s:
+                rows = (await s.execute(stmt)).all()
+            merged += self.apply_rows((oid, otype, area, attrs) for oid, otype, area, attrs, _ in rows)
+            if rows:
+                cursor = (rows[-1][4], rows[-1][0])
+                if self._watermark is None or cursor[0] > self._watermark:
+                    self._watermark = cursor[0]
+            if len(rows) < GEO_LOAD_PAGE:
+                return merged
+
+    async def start(self) -> None:
+        await self.sync()
+        if GEO_SYNC_INTERVAL_S > 0:
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(GEO_SYNC_INTERVAL_S)
+            try:
+                await self.sync()
+            except Exception as e:  # noqa: BLE001 - 同步失败不影响查询，下轮重试
+                logger.warning("geo index sync failed: %s", e)
+
+    # ---------- 查询 ----------
+
+    def _grids_for(self, object_type: str | None) -> list[dict[Cell, dict[str, _GeoEntry]]]:
+        if object_type is None:
+            return list(self._grids.values())
+        grid = self._grids.get(object_type)
+        return [grid] if grid else []
+
+    def bbox(
+        self,
+        min_lon: float,
+        min_lat: float,
+        max_lon: float,
+        max_lat: float,
+        object_type: str | None = None,
+        area_id: str | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[_GeoEntry], bool]:
+        """框选；结果按 object_id 排序，超过 limit 时截断并返回 truncated=True。"""
+        x0, y0 = self._cell(min_lon, min_lat)
+        x1, y1 = self._cell(max_lon, max_lat)
+        out: list[_GeoEntry] = []
+        for grid in self._grids_for(object_type):
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(grid):
+                # 框选范围比已占用的格子还多：直接遍历非空格
+                buckets = (b for (cx, cy), b in grid.items() if x0 <= cx <= x1 and y0 <= cy <= y1)
+            else:
+                buckets = (grid[c] for c in ((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)) if c in grid)
+            for bucket in buckets:
+                for e in bucket.values():
+                    if (
+                        min_lon <= e.lon <= max_lon
+                        and min_lat <= e.lat <= max_lat
+                        and (area_id is None or e.area_id == area_id)
+                    ):
+                        out.append(e)
+        if limit is not None and len(out) > limit:
+            return heapq.nsmallest(limit, out, key=lambda e: e.object_id), True
+        out.sort(key=lambda e: e.object_id)
+        return out, False
+
+    def radius(
+        self,
+        lon: float,
+        lat: float,
+        radius_m: float,
+        object_type: str | None = None,
+        area_id: str | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[tuple[float, _GeoEntry]], bool]:
+        """半径检索：(距离米, entry) 按距离升序（同距离按 object_id），超过 limit 时截断并返回 truncated=True。"""
+        if limit is None:
+            hits = self._scan(lon, lat, None, object_type, area_id, radius_m)
+            return hits, False
+        hits = self._scan(lon, lat, limit + 1, object_type, area_id, radius_m)
+        return hits[:limit], len(hits) > limit
+
+    def nearest(
+        self,
+        lon: float,
+        lat: float,
+        k: int,
+        object_type: str | None = None,
+        area_id: str | None = None,
+        max_radius_m: float | None = None,
+    ) -> list[tuple[float, _GeoEntry]]:
+        """k 近邻：(距离米, entry) 按距离升序；max_radius_m 限定最远距离。"""
+        if k <= 0:
+            return []
+        return self._scan(lon, lat, k, object_type, area_id, max_radius_m)
+
+    def _scan(
+        self,
+        lon: float,
+        lat: float,
+        k: int | None,
+        object_type: str | None,
+        area_id: str | None,
+        max_radius_m: float | None,
+    ) -> list[tuple[float, _GeoEntry]]:
+        grids = self._grids_for(object_type)
+        if not grids or self._bounds is None:
+            return []
+        kx = _M_PER_DEG * math.cos(math.radians(lat))
+        ky = _M_PER_DEG
+        # 一圈格子在两个方向上的最小跨度（米）：第 r 圈上的点到查询点至少 (r - 1) 个格宽
+        ring_m = max(self.cell_deg * min(kx, ky), 1e-6)
+        cx0, cy0 = self._cell(lon, lat)
+        b = self._bounds
+        max_ring = max(cx0 - b[0], b[1] - cx0, cy0 - b[2], b[3] - cy0, 0)
+        if max_radius_m is not None:
+            max_ring = min(max_ring, int(max_radius_m / ring_m) + 1)
+        limit2 = max_radius_m * max_radius_m if max_radius_m is not None else math.inf
+        occupied = sum(len(g) for g in grids)
+
+        cands: list[tuple[float, str, _GeoEntry]] = []
+        kth = math.inf
+
+        def collect(bucket: dict[str, _GeoEntry]) -> None:
+            for e in bucket.values():
+                if area_id is not None and e.area_id != area_id:
+                    continue
+                dx = (e.lon - lon) * kx
+                dy = (e.lat - lat) * ky
+                d2 = dx * dx + dy * dy
+                if d2 <= limit2:
+                    cands.append((d2, e.object_id, e))
+
+        for ring in range(max_ring + 1):
+            reach = max(ring - 1, 0) * ring_m
+            if k is not None and len(cands) >= k and reach * reach > kth:
+                break
+            if (2 * ring + 1) ** 2 > occupied * 4:
+                # 外扩的格子数已远超非空格数（查询点远离数据或过滤后很稀疏）：剩余部分直接遍历非空格
+                for grid in grids:
+                    for (cx, cy), bucket in grid.items():
+                        if max(abs(cx - cx0), abs(cy - cy0)) >= ring:
+                            collect(bucket)
+                break
+            for cell in _ring_cells(cx0, cy0, ring):
+                for grid in grids:
+                    bucket = grid.get(cell)
+                    if bucket:
+                        collect(bucket)
+            if k is not None and len(cands) >= k:
+                kth = heapq.nsmallest(k, cands)[k - 1][0]
+        picked = sorted(cands) if k is None else heapq.nsmallest(k, cands)
+        return [(math.sqrt(d2), e) for d2, _, e in picked]
+
+    def stats(self) -> dict[str, Any]:
+        sizes = [len(b) for g in self._grids.values() for b in g.values()]
+        return {
+            "objects": len(self._entries),
+            "by_type": {t: sum(len(b) for b in g.values()) for t, g in self._grids.items()},
+            "cells": len(sizes),
+            "cell_deg": self.cell_deg,
+            "max_per_cell": max(sizes) if sizes else 0,
+            "avg_per_cell": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+        }
+
+
+def _ring_cells(cx: int, cy: int, ring: int) -> Iterator[Cell]:
+    if ring == 0:
+        yield (cx, cy)
+        return
+    for x in range(cx - ring, cx + ring + 1):
+        yield (x, cy - ring)
+        yield (x, cy + ring)
+    for y in range(cy - ring + 1, cy + ring):
+        yield (cx - ring, y)
+        yield (cx + ring, y)
+
+
+geo_index = GeoIndex()
@@ -0,0 +1,754 @@
+from __future__ import annotations
+
+import array
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import filterfalse, repeat
+from datetime import datetime, timezone
+from typing import Any
+
+
+# 特征历史存储（演示级）：
+# - ObjectState.features 只保留最新快照；数值特征的每次读数另外写入本地列式历史：
+#     <HISTORY_DIR>/objects.txt            对象注册表（追加写，行号即对象在各分区里的行号）
+#     <HISTORY_DIR>/<分区起点>/meta.json    分区元数据（时间跨度、槽宽、raw / downsampled）
+#     <HISTORY_DIR>/<分区起点>/<特征>.f4    raw 分区：行 = 对象、列 = 时间槽的 float32 矩阵，NaN 表示无读数
+# - 文件 mmap 映射：写一次读数 = 按 (行, 槽) 偏移改 4 字节；一个时间槽的整列（全部对象）是步长切片，批量读写都在 C 里完成；
+# - 分区超过 HISTORY_DOWNSAMPLE_AFTER_S 后降采样为粗槽的 sum / min / max / last / cnt 五个数组，raw 文件删除；
+#   超过 HISTORY_RETENTION_S 的分区整体删除；
+# - 窗口聚合（sum / mean / min / max / count / last / accum）跨 raw 与降采样分区合并；降采样分区按粗槽粒度计入窗口；
+# - accum 把速率类读数（每小时的量，如 mm/h）按时间积分成窗口内累计量：每个读数视为在其 raw 槽内恒定，
+#   Σ 读数 × raw 槽宽 / 3600；无读数的槽按 0 计（不插值），所以缺数只会少算、不会像均值那样把几条读数放大成整窗口；
+# - 多 worker 共用同一目录：注册表追加、分区创建/扩容、降采样用文件锁串行化；
+#   其他进程缓存的分区按 meta.json 的 mtime 失效重开。
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+# 默认放在系统临时目录（不随工作目录写进源码树）；容器内由 HISTORY_DIR 指向数据卷
+HISTORY_DIR = os.getenv("HISTORY_DIR") or os.path.join(tempfile.gettempdir(), "flood-demo", "feature_history")
+HISTORY_FEATURES = tuple(
+    f.strip() for f in os.getenv("HISTORY_FEATURES", "rain_now_mmph,water_level_m,traffic_index").split(",") if f.strip()
+)
+HISTORY_SLOT_S = int(os.getenv("HISTORY_SLOT_S", "60"))
+HISTORY_PARTITION_S = int(os.getenv("HISTORY_PARTITION_S", "3600"))
+HISTORY_DOWNSAMPLE_AFTER_S = int(os.getenv("HISTORY_DOWNSAMPLE_AFTER_S", str(6 * 3600)))
+HISTORY_DOWNSAMPLE_SLOT_S = int(os.getenv("HISTORY_DOWNSAMPLE_SLOT_S", "900"))
+HISTORY_RETENTION_S = int(os.getenv("HISTORY_RETENTION_S", str(7 * 86400)))
+HISTORY_MAINTAIN_INTERVAL_S = float(os.getenv("HISTORY_MAINTAIN_INTERVAL_S", "300"))
+# 风险重算时用历史派生的滚动特征覆盖快照里的同名字段（如 rain_1h_mm 不再依赖上游预计算）
+HISTORY_DERIVE_ROLLING = os.getenv("HISTORY_DERIVE_ROLLING", "false").lower() == "true"
+HISTORY_GROW_ROWS = 16384
+
+RAW = "raw"
+DOWNSAMPLED = "downsampled"
+AGGS = ("sum", "mean", "min", "max", "count", "last", "accum")
+# 降采样分区的数组：后缀 -> array typecode
+_DS_ARRAYS = (("sum", "f"), ("min", "f"), ("max", "f"), ("last", "f"), ("cnt", "B"))
+_EXT = {"f": "f4", "B": "u1"}
+_NAN_BYTES = array.array("f", [math.nan]).tobytes()
+
+# 滚动特征：名称 -> (源特征, 聚合, 窗口秒数)
+ROLLING_FEATURES: dict[str, tuple[str, str, int]] = {
+    # 近 1 小时累计雨量（mm）= 雨强（mm/h）按槽宽积分；缺读数的槽按无雨计
+    "rain_1h_mm": ("rain_now_mmph", "accum", 3600),
+    "rain_3h_max_mmph": ("rain_now_mmph", "max", 3 * 3600),
+    "water_level_max_1h_m": ("water_level_m", "max", 3600),
+}
+
+
+def epoch(value: datetime | float | None) -> float:
+    if value is None:
+        return time.time()
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    return float(value)
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class _Registry:
+    """对象注册表：objects.txt 每行一个 object_id，行号即矩阵行号；只追加，不删除。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids: list[str] = []
+        self.rows: dict[str, int] = {}
+        self._offset = 0
+
+    def refresh(self) -> None:
+        """读取其他进程追加的新行（只读完整行）。"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8").splitlines():
+            self.rows[line] = len(self.ids)
+            self.ids.append(line)
+        self._offset += end
+
+    def row(self, object_id: str) -> int | None:
+        return self.rows.get(object_id)
+
+    def ensure(self, object_ids: Sequence[str], lock: Any) -> list[int]:
+        """对象行号（-1 表示无法注册）；未注册的对象在文件锁内追加。"""
+        rows = list(map(self.rows.get, object_ids, repeat(-1)))
+        if -1 not in rows:
+            return rows
+        with lock():
+            self.refresh()
+            new = [oid for oid in dict.fromkeys(object_ids) if oid not in self.rows and "\n" not in oid]
+            if new:
+                payload = "".join(f"{oid}\n" for oid in new).encode("utf-8")
+                with open(self.path, "ab") as f:
+                    f.write(payload)
+                self.refresh()
+        return list(map(self.rows.get, object_ids, repeat(-1)))
+
+
+class _Partition:
+    """一个时间分区：各数组的 mmap 与 memoryview（按需映射）。"""
+
+    def __init__(self, path: str, meta: dict[str, Any], mtime_ns: int):
+        self.path = path
+        self.start = float(meta["start"])
+        self.span_s = int(meta["span_s"])
+        self.slot_s = int(meta["slot_s"])
+        # 读数本身的槽宽：降采样分区的 sum 由 raw 槽读数累加而来，accum 按它折算时间
+        self.raw_slot_s = int(meta.get("raw_slot_s", HISTORY_SLOT_S if meta["kind"] == DOWNSAMPLED else self.slot_s))
+        self.slots = self.span_s // self.slot_s
+        self.kind = meta["kind"]
+        self.features = tuple(meta["features"])
+        self.mtime_ns = mtime_ns
+        self._maps: dict[str, tuple[mmap.mmap, memoryview]] = {}
+
+    def array(self, name: str, typecode: str = "f") -> memoryview | None:
+        mapped = self._maps.get(name)
+        if mapped is None:
+            file_path = os.path.join(self.path, name)
+            try:
+                with open(file_path, "r+b" if self.kind == RAW else "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        return None
+                    access = mmap.ACCESS_WRITE if self.kind == RAW else mmap.ACCESS_READ
+                    mm = mmap.mmap(f.fileno(), 0, access=access)
+            except FileNotFoundError:
+                return None
+            mapped = self._maps[name] = (mm, memoryview(mm).cast(typecode))
+        return mapped[1]
+
+    def capacity(self, name: str) -> int:
+        mv = self.array(name)
+        return len(mv) // self.slots if mv is not None else 0
+
+    def grow(self, rows: int) -> None:
+        """raw 分区扩容到至少 rows 行（调用方持有文件锁；其他进程可能已先扩容）。"""
+        for feature in self.features:
+            name = f"{feature}.f4"
+            file_path = os.path.join(self.path, name)
+            size = os.path.getsize(file_path)
+            want = rows * self.slots * 4
+            if size < want:
+                with open(file_path, "ab") as f:
+                    f.write(_NAN_BYTES * ((want - size) // 4))
+            self._unmap(name)
+
+    def _unmap(self, name: str) -> None:
+        mapped = self._maps.pop(name, None)
+        if mapped is not None:
+            mm, mv = mapped
+            mv.release()
+            mm.close()
+
+    def close(self) -> None:
+        for name in list(self._maps):
+            mm = self._maps[name][0]
+            if self.kind == RAW:
+                mm.flush()
+            self._unmap(name)
+
+    def slot_range(self, t0: float, t1: float) -> tuple[int, int]:
+        """[t0, t1) 在本分区内覆盖的槽号范围（按槽粒度向外取整）。"""
+        s0 = max(0, math.floor((t0 - self.start) / self.slot_s))
+        s1 = min(self.slots, math.ceil((t1 - self.start) / self.slot_s))
+        return s0, max(s0, s1)
+
+
+class _Acc:
+    __slots__ = ("sum", "count", "min", "max", "last", "accum")
+
+    def __init__(self):
+        self.sum = 0.0
+        self.accum = 0.0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last: float | None = None
+
+    def add_values(self, values: list[float], slot_s: int) -> None:
+        total = sum(values)
+        if total != total:  # 含 NaN（有缺读数的槽）才逐个过滤；满槽时全在 C 里完成
+            values = list(filterfalse(math.isnan, values))
+            total = sum(values)
+        if values:
+            self.sum += total
+            self.accum += total * slot_s / 3600
+            self.count += len(values)
+            self.min = min(self.min, min(values))
+            self.max = max(self.max, max(values))
+            self.last = values[-1]
+
+    def add_summary(self, s: float, mn: float, mx: float, last: float, count: int, slot_s: int) -> None:
+        if count:
+            self.sum += s
+            self.accum += s * slot_s / 3600
+            self.count += count
+            self.min = min(self.min, mn)
+            self.max = max(self.max, mx)
+            self.last = last
+
+    def result(self, agg: str) -> float | None:
+        if not self.count:
+            return None
+        if agg == "sum":
+            return self.sum
+        if agg == "mean":
+            return self.sum / self.count
+        if agg == "min":
+            return self.min
+        if agg == "max":
+            return self.max
+        if agg == "count":
+            return float(self.count)
+        if agg == "accum":
+            return self.accum
+        return self.last
+
+
+class FeatureHistory:
+    def __init__(
+        self,
+        root: str = HISTORY_DIR,
+        features: Sequence[str] = HISTORY_FEATURES,
+        slot_s: int = HISTORY_SLOT_S,
+        partition_s: int = HISTORY_PARTITION_S,
+    ):
+        if partition_s % slot_s or partition_s % HISTORY_DOWNSAMPLE_SLOT_S or HISTORY_DOWNSAMPLE_SLOT_S % slot_s:
+            raise ValueError("partition_s / downsample slot must be multiples of slot_s")
+        self.root = root
+        self.features = tuple(features)
+        self.slot_s = slot_s
+        self.partition_s = partition_s
+        self.downsample_after_s = HISTORY_DOWNSAMPLE_AFTER_S
+        self.downsample_slot_s = HISTORY_DOWNSAMPLE_SLOT_S
+        self.retention_s = HISTORY_RETENTION_S
+        self.registry = _Registry(os.path.join(root, "objects.txt"))
+        self.registry.refresh()
+        self._partitions: dict[int, _Partition] = {}
+        self._lock = threading.RLock()
+        self._task: asyncio.Task | None = None
+        self._writer: ThreadPoolExecutor | None = None
+        self.written = 0
+        self.dropped = 0
+
+    # ---------- 分区 ----------
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _partition_start(self, ts: float) -> int:
+        return int(ts // self.partition_s) * self.partition_s
+
+    def _get(self, start: int) -> _Partition | None:
+        """打开已存在的分区；meta.json 变化（其他进程降采样）时重新映射。"""
+        meta_path = os.path.join(self.root, str(start), "meta.json")
+        try:
+            mtime_ns = os.stat(meta_path).st_mtime_ns
+        except FileNotFoundError:
+            self._drop(start)
+            return None
+        part = self._partitions.get(start)
+        if part is not None and part.mtime_ns == mtime_ns:
+            return part
+        self._drop(start)
+        with open(meta_path, encoding="utf-8") as f:
+            part = _Partition(os.path.dirname(meta_path), json.load(f), mtime_ns)
+        self._partitions[start] = part
+        return part
+
+    def _drop(self, start: int) -> None:
+        part = self._partitions.pop(start, None)
+        if part is not None:
+            part.close()
+
+    def _for_write(self, ts: float) -> _Partition | None:
+        start = self._partition_start(ts)
+        part = self._get(start)
+        if part is None:
+            if time.time() - (start + self.partition_s) > self.downsample_after_s:
+                return None  # 迟到太久的读数：分区应已降采样，不再回写
+            with self._file_lock():
+                part = self._get(start)
+                if part is None:
+                    part = self._create(start)
+        return part if part.kind == RAW else None
+
+    def _create(self, start: int) -> _Partition:
+        path = os.path.join(self.root, str(start))
+        os.makedirs(path, exist_ok=True)
+        slots = self.partition_s // self.slot_s
+        rows = max(HISTORY_GROW_ROWS, -(-len(self.registry.ids) // HISTORY_GROW_ROWS) * HISTORY_GROW_ROWS)
+        blank = _NAN_BYTES * (rows * slots)
+        for feature in self.features:
+            with open(os.path.join(path, f"{feature}.f4"), "wb") as f:
+                f.write(blank)
+        meta = {
+            "start": start,
+            "span_s": self.partition_s,
+            "slot_s": self.slot_s,
+            "kind": RAW,
+            "features": list(self.features),
+        }
+        _write_json(os.path.join(path, "meta.json"), meta)
+        return self._get(start)
+
+    def _ensure_rows(self, part: _Partition, rows: int) -> None:
+        if part.capacity(f"{part.features[0]}.f4") >= rows:
+            return
+        with self._file_lock():
+            want = -(-rows // HISTORY_GROW_ROWS) * HISTORY_GROW_ROWS
+            part.grow(want)
+
+    def _partitions_between(self, t0: float, t1: float) -> list[_Partition]:
+        out = []
+        start = self._partition_start(t0)
+        while start < t1:
+            part = self._get(start)
+            if part is not None:
+                out.append(part)
+            start += self.partition_s
+        return out
+
+    # ---------- 写入 ----------
+
+    def record_many(self, rows: Iterable[tuple[str, dict[str, Any]]], ts: datetime | float | None = None) -> int:
+        """写入一批读数（object_id, features）：只取配置中的数值特征，同一槽内后写覆盖先写。"""
+        t = epoch(ts)
+        readings = [
+            (oid, [(f, float(v)) for f, v in features.items() if f in self.features and _is_number(v)])
+            for oid, features in rows
+        ]
+        readings = [(oid, vals) for oid, vals in readings if vals]
+        if not readings:
+            return 0
+        with self._lock:
+            part = self._for_write(t)
+            if part is None:
+                self.dropped += len(readings)
+                return 0
+            row_ids = self.registry.ensure([oid for oid, _ in readings], self._file_lock)
+            self._ensure_rows(part, max(row_ids) + 1)
+            slot = int((t - part.start) // part.slot_s)
+            arrays = {f: part.array(f"{f}.f4") for f in part.features}
+            written = 0
+            for row, (_, vals) in zip(row_ids, readings):
+                if row < 0:
+                    continue
+                offset = row * part.slots + slot
+                for feature, value in vals:
+                    mv = arrays.get(feature)
+                    if mv is not None:
+                        mv[offset] = value
+                        written += 1
+            self.written += written
+            return written
+
+    async def record_async(self, rows: Iterable[tuple[str, dict[str, Any]]], ts: datetime | float | None = None) -> int:
+        """事件循环中调用：在单一写线程里执行 record_many（mmap 写入、建分区、文件锁都可能阻塞），
+        各批按提交顺序写入，同槽后写覆盖先写的语义不变。"""
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feature-history")
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self.record_many, list(rows), ts)
+
+    def resolve(self, object_ids: Sequence[str]) -> Sequence[int]:
+        """对象 -> 行号（必要时注册）；行号连续时返回 range，供 record_frame 按步长切片整列写入。"""
+        with self._lock:
+            rows = self.registry.ensure(object_ids, self._file_lock)
+        if rows and rows[0] >= 0 and rows == list(range(rows[0], rows[0] + len(rows))):
+            return range(rows[0], rows[0] + len(rows))
+        return rows
+
+    def record_frame(
+        self,
+        ts: datetime | float,
+        rows: Sequence[int],
+        columns: dict[str, Sequence[float]],
+    ) -> int:
+        """
+        整列写入：同一时刻多个对象的读数（回放导入/压测用）。rows 为 resolve() 的结果，连续写多个槽时复用；
+        行号连续（range）时每个特征一次步长切片赋值。
+        """
+        t = epoch(ts)
+        if not rows:
+            return 0
+        with self._lock:
+            part = self._for_write(t)
+            if part is None:
+                self.dropped += len(rows)
+                return 0
+            contiguous = isinstance(rows, range)
+            self._ensure_rows(part, (rows[-1] if contiguous else max(rows)) + 1)
+            slot = int((t - part.start) // part.slot_s)
+            written = 0
+            for feature, values in columns.items():
+                mv = part.array(f"{feature}.f4") if feature in part.features else None
+                if mv is None:
+                    continue
+                if contiguous:
+                    first = rows[0] * part.slots + slot
+                    mv[first : first + len(rows) * part.slots : part.slots] = array.array("f", values)
+                else:
+                    for row, value in zip(rows, values):
+                        if row >= 0:
+                            mv[row * part.slots + slot] = value
+                written += len(rows)
+            self.written += written
+            return written
+
+    # ---------- 查询 ----------
+
+    def window(
+        self,
+        object_ids: Sequence[str],
+        feature: str,
+        agg: str,
+        window_s: float,
+        now: datetime | float | None = None,
+    ) -> dict[str, float | None]:
+        """最近 window_s 秒内的聚合值；无读数为 None。"""
+        if agg not in AGGS:
+            raise ValueError(f"unknown agg {agg!r}")
+        t1 = epoch(now)
+        accs = self._accumulate(object_ids, feature, t1 - window_s, t1)
+        return {oid: acc.result(agg) for oid, acc in zip(object_ids, accs)}
+
+    def _accumulate(self, object_ids: Sequence[str], feature: str, t0: float, t1: float) -> list[_Acc]:
+        accs = [_Acc() for _ in object_ids]
+        with self._lock:
+            self.registry.refresh()
+            rows = [self.registry.row(oid) for oid in object_ids]
+            for part in self._partitions_between(t0, t1):
+                s0, s1 = part.slot_range(t0, t1)
+                if s0 >= s1:
+                    continue
+                if part.kind == RAW:
+                    mv = part.array(f"{feature}.f4")
+                    if mv is None:
+                        continue
+                    cap = len(mv) // part.slots
+                    for acc, row in zip(accs, rows):
+                        if row is not None and row < cap:
+                            base = row * part.slots
+                            acc.add_values(mv[base + s0 : base + s1].tolist(), part.slot_s)
+                else:
+                    arrs = [part.array(_ds_name(feature, suffix, code), code) for suffix, code in _DS_ARRAYS]
+                    if any(a is None for a in arrs):
+                        continue
+                    sums, mins, maxs, lasts, cnts = arrs
+                    cap = len(cnts) // part.slots
+                    for acc, row in zip(accs, rows):
+                        if row is None or row >= cap:
+                            continue
+                        base = row * part.slots
+                        for i in range(base + s0, base + s1):
+                            acc.add_summary(sums[i], mins[i], maxs[i], lasts[i], cnts[i], part.raw_slot_s)
+        return accs
+
+    def series(self, object_id: str, feature: str, t0: datetime | float, t1: datetime | float) -> list[dict[str, Any]]:
+        """单对象时间序列：raw 分区逐槽，降采样分区为粗槽均值/最大值。"""
+        a, b = epoch(t0), epoch(t1)
+        out: list[dict[str, Any]] = []
+        with self._lock:
+            self.registry.refresh()
+            row = self.registry.row(object_id)
+            if row is None:
+                return out
+            for part in self._partitions_between(a, b):
+                s0, s1 = part.slot_range(a, b)
+                base = row * part.slots
+                if part.kind == RAW:
+                    mv = part.array(f"{feature}.f4")
+                    if mv is None or row >= len(mv) // part.slots:
+                        continue
+                    for i, v in enumerate(mv[base + s0 : base + s1].tolist(), start=s0):
+                        if v == v:
+                            out.append({"time": _iso(part.start + i * part.slot_s), "value": v})
+                else:
+                    sums, cnts, maxs = (
+                        part.array(f"{feature}.sum.f4"),
+                        part.array(f"{feature}.cnt.u1", "B"),
+                        part.array(f"{feature}.max.f4"),
+                    )
+                    if sums is None or cnts is None or maxs is None or row >= len(cnts) // part.slots:
+                        continue
+                    for i in range(s0, s1):
+                        c = cnts[base + i]
+                        if c:
+                            out.append(
+                                {
+                                    "time": _iso(part.start + i * part.slot_s),
+                                    "value": sums[base + i] / c,
+                                    "max": maxs[base + i],
+                                    "count": c,
+                                    "slot_s": part.slot_s,
+                                }
+                            )
+        return out
+
+    def rolling(self, object_ids: Sequence[str], now: datetime | float | None = None) -> dict[str, dict[str, float]]:
+        """按 ROLLING_FEATURES 派生滚动特征；没有历史读数的项不出现在结果里。"""
+        out: dict[str, dict[str, float]] = {oid: {} for oid in object_ids}
+        t1 = epoch(now)
+        for name, (source, agg, window_s) in ROLLING_FEATURES.items():
+            if source not in self.features:
+                continue
+            for oid, value in self.window(object_ids, source, agg, window_s, t1).items():
+                if value is not None:
+                    out[oid][name] = round(value, 3)
+        return out
+
+    def replay(
+        self,
+        t0: datetime | float,
+        t1: datetime | float,
+        features: Sequence[str] | None = None,
+    ) -> Iterator[tuple[float, dict[str, list[float]]]]:
+        """
+        按时间顺序回放 [t0, t1)：每个槽产出 (槽起点, {特征: 按注册表行号排列的整列读数})，NaN 表示该槽无读数；
+        降采样分区产出粗槽均值。对象 ID 见 self.registry.ids。
+        """
+        a, b = epoch(t0), epoch(t1)
+        names = [f for f in (features or self.features) if f in self.features]
+        with self._lock:
+            self.registry.refresh()
+            n = len(self.registry.ids)
+            parts = self._partitions_between(a, b)
+        for part in parts:
+            s0, s1 = part.slot_range(a, b)
+            for slot in range(s0, s1):
+                frame: dict[str, list[float]] = {}
+                with self._lock:
+                    for feature in names:
+                        frame[feature] = self._column(part, feature, slot, n)
+                yield part.start + slot * part.slot_s, frame
+
+    @staticmethod
+    def _column(part: _Partition, feature: str, slot: int, n: int) -> list[float]:
+        """一个槽的整列（前 n 行）；分区行数不足 n（之后注册的对象）补 NaN。"""
+        if part.kind == RAW:
+            mv = part.array(f"{feature}.f4")
+            rows = min(n, len(mv) // part.slots) if mv is not None else 0
+            col = mv[slot : rows * part.slots : part.slots].tolist() if rows else []
+        else:
+            sums = part.array(f"{feature}.sum.f4")
+            cnts = part.array(f"{feature}.cnt.u1", "B")
+            rows = min(n, len(cnts) // part.slots) if sums is not None and cnts is not None else 0
+            col = (
+                [
+                    s / c if c else math.nan
+                    for s, c in zip(
+                        sums[slot : rows * part.slots : part.slots].tolist(),
+                        cnts[slot : rows * part.slots : part.slots].tolist(),
+                    )
+                ]
+                if rows
+                else []
+            )
+        if rows < n:
+            col.extend([math.nan] * (n - rows))
+        return col
+
+    # ---------- 降采样与保留 ----------
+
+    def maintain(self, now: datetime | float | None = None) -> dict[str, int]:
+        """降采样过期 raw 分区、删除超出保留期的分区；返回处理数量。"""
+        t = epoch(now)
+        done = {"downsampled": 0, "removed": 0}
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return done
+        for name in sorted(names):
+            if not name.isdigit():
+                continue
+            start = int(name)
+            age = t - (start + self.partition_s)
+            if age > self.retention_s:
+                # 加锁顺序与写入路径一致：先进程内锁，再文件锁
+                with self._lock, self._file_lock():
+                    self._drop(start)
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                done["removed"] += 1
+            elif age > self.downsample_after_s:
+                with self._lock:
+                    part = self._get(start)
+                if part is not None and part.kind == RAW and self._downsample(part):
+                    done["downsampled"] += 1
+        return done
+
+    def _downsample(self, part: _Partition) -> bool:
+        """降采样一个 raw 分区：在锁外计算（只读 raw 文件的独立映射），只在替换 meta 与删除 raw 文件时持锁；
+        其他进程已先完成时返回 False。"""
+        factor = self.downsample_slot_s // part.slot_s
+        coarse = part.slots // factor
+        outputs: dict[str, dict[str, array.array]] = {}
+        for feature in part.features:
+            try:
+                with open(os.path.join(part.path, f"{feature}.f4"), "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return False
+            mv = memoryview(mm).cast("f")
+            rows = len(mv) // part.slots
+            out = {suffix: array.array(code) for suffix, code in _DS_ARRAYS}
+            nan = math.nan
+            for row in range(rows):
+                values = mv[row * part.slots : (row + 1) * part.slots].tolist()
+                for j in range(coarse):
+                    present = [v for v in values[j * factor : (j + 1) * factor] if v == v]
+                    if present:
+                        out["sum"].append(sum(present))
+                        out["min"].append(min(present))
+                        out["max"].append(max(present))
+                        out["last"].append(present[-1])
+                        out["cnt"].append(len(present))
+                    else:
+                        for suffix in ("sum", "min", "max", "last"):
+                            out[suffix].append(nan)
+                        out["cnt"].append(0)
+            mv.release()
+            mm.close()
+            outputs[feature] = out
+        meta = {
+            "start": int(part.start),
+            "span_s": part.span_s,
+            "slot_s": self.downsample_slot_s,
+            "raw_slot_s": part.slot_s,
+            "kind": DOWNSAMPLED,
+            "features": list(part.features),
+        }
+        with self._lock, self._file_lock():
+            try:
+                with open(os.path.join(part.path, "meta.json"), encoding="utf-8") as f:
+                    if json.load(f).get("kind") != RAW:
+                        return False
+            except FileNotFoundError:
+                return False
+            for feature, out in outputs.items():
+                for suffix, code in _DS_ARRAYS:
+                    target = os.path.join(part.path, _ds_name(feature, suffix, code))
+                    with open(target + ".tmp", "wb") as f:
+                        out[suffix].tofile(f)
+                    os.replace(target + ".tmp", target)
+            _write_json(os.path.join(part.path, "meta.json"), meta)
+            self._drop(int(part.start))
+            for feature in part.features:
+                os.remove(os.path.join(part.path, f"{feature}.f4"))
+        return True
+
+    # ---------- 生命周期 ----------
+
+    async def start(self) -> None:
+        if HISTORY_MAINTAIN_INTERVAL_S > 0:
+            self._task = asyncio.get_running_loop().create_task(self._maintain_loop())
+
+    async def _maintain_loop(self) -> None:
+        while True:
+            await asyncio.sleep(HISTORY_MAINTAIN_INTERVAL_S)
+            try:
+                done = await asyncio.to_thread(self.maintain)
+                if any(done.values()):
+                    logger.info("feature history maintenance: %s", done)
+            except Exception as e:  # noqa: BLE001 - 下轮重试
+                logger.warning("feature history maintenance failed: %s", e)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for start in list(self._partitions):
+                self._drop(start)
+
+    def stats(self) -> dict[str, Any]:
+        kinds = {RAW: 0, DOWNSAMPLED: 0}
+        size = 0
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else ():
+            path = os.path.join(self.root, name)
+            if name.isdigit() and os.path.exists(os.path.join(path, "meta.json")):
+                with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                    kinds[json.load(f)["kind"]] += 1
+                size += sum(os.path.getsize(os.path.join(path, n)) for n in os.listdir(path))
+        return {
+            "enabled": HISTORY_ENABLED,
+            "dir": self.root,
+            "features": list(self.features),
+            "slot_s": self.slot_s,
+            "partition_s": self.partition_s,
+            "objects": len(self.registry.ids),
+            "partitions": kinds,
+            "bytes": size,
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+def _ds_name(feature: str, suffix: str, code: str) -> str:
+    return f"{feature}.{suffix}.{_EXT[code]}"
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _write_json(path: str, obj: dict[str, Any]) -> None:
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(path + ".tmp", path)
+
+
+feature_history = FeatureHistory() if HISTORY_ENABLED else None
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import pagination
+from .storage import db
+from .storage.models import Incident, IncidentMetrics, Task, TimelineEvent, utcnow
+
+
+# 事件指标增量维护（演示级）：
+# - create_tasks / ack_task 在同一事务内对 incident_metrics 做 col = col + delta 原子更新；
+# - 任务状态归为 pending / done / other 三个桶；
+# - 首次回执时累计回执耗时，并判断是否超过任务 SLA；
+# - rebuild 从 task / timeline_event 全量重算，用于一致性核对与修复；
+# - backfill 在启动时为尚无聚合行的事件（如升级前已存在的事件）重算补齐，之后才接收增量。
+
+STATUS_BUCKETS = ("pending", "done", "other")
+
+
+def status_bucket(status: str | None) -> str:
+    return status if status in ("pending", "done") else "other"
+
+
+def as_utc(dt: datetime) -> datetime:
+    # SQLite 取回的是 naive 时间（存储时即为 UTC）
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+async def _ensure_row(s: AsyncSession, incident_id: str) -> None:
+    stmt = db.dialect_insert(db.async_engine.dialect.name, IncidentMetrics).on_conflict_do_nothing(
+        index_elements=["incident_id"]
+    )
+    await s.execute(stmt, [{"incident_id": incident_id, "updated_at": utcnow()}])
+
+
+async def _apply(s: AsyncSession, incident_id: str, **deltas: float) -> None:
+    await _ensure_row(s, incident_id)
+    values: dict[str, Any] = {name: getattr(IncidentMetrics, name) + delta for name, delta in deltas.items() if delta}
+    values["updated_at"] = utcnow()
+    await s.execute(
+        update(IncidentMetrics)
+        .where(IncidentMetrics.incident_id == incident_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def on_tasks_created(s: AsyncSession, incident_id: str, count: int) -> None:
+    if count:
+        await _apply(s, incident_id, task_total=count, task_pending=count)
+
+
+async def on_task_ack(s: AsyncSession, task: Task, old_status: str, first_ack_at: datetime | None) -> None:
+    """task 已更新为新状态；first_ack_at 仅在首次回执时传入。"""
+    deltas: dict[str, float] = {}
+    old_bucket, new_bucket = status_bucket(old_status), status_bucket(task.status)
+    if old_bucket != new_bucket:
+        deltas[f"task_{old_bucket}"] = -1
+        deltas[f"task_{new_bucket}"] = 1
+    if first_ack_at is not None:
+        elapsed = (as_utc(first_ack_at) - as_utc(task.created_at)).total_seconds()
+        deltas["task_acked"] = 1
+        deltas["ack_seconds_sum"] = elapsed
+        if elapsed > task.sla_minutes * 60:
+            deltas["sla_breached"] = 1
+    if deltas:
+        await _apply(s, task.incident_id, **deltas)
+
+
+def to_report(row: IncidentMetrics | None) -> dict[str, Any]:
+    total = row.task_total if row else 0
+    done = row.task_done if row else 0
+    acked = row.task_acked if row else 0
+    return {
+        "task_total": total,
+        "task_done": done,
+        "task_done_rate": (done / total) if total else 0.0,
+        "task_by_status": {b: (getattr(row, f"task_{b}") if row else 0) for b in STATUS_BUCKETS},
+        "task_acked": acked,
+        "mean_time_to_ack_s": (row.ack_seconds_sum / acked) if acked else None,
+        "sla_breached": row.sla_breached if row else 0,
+    }
+
+
+async def compute(incident_id: str) -> dict[str, float]:
+    """从 task / timeline_event 重算单个事件的指标（按键集分批读取首次回执）。"""
+    values: dict[str, float] = {f"task_{b}": 0 for b in STATUS_BUCKETS}
+    values.update(task_total=0, task_acked=0, ack_seconds_sum=0.0, sla_breached=0)
+    async with db.async_session() as s:
+        tasks = {
+            tid: (status, created_at, sla)
+            for tid, status, created_at, sla in await s.execute(
+                select(Task.id, Task.status, Task.created_at, Task.sla_minutes).where(Task.incident_id == incident_id)
+            )
+        }
+    for status, _, _ in tasks.values():
+        values["task_total"] += 1
+        values[f"task_{status_bucket(status)}"] += 1
+
+    first_ack: dict[str, datetime] = {}
+    cursor = None
+    while True:
+        async with db.async_session() as s:
+            stmt = select(TimelineEvent).where(TimelineEvent.incident_id == incident_id, TimelineEvent.type == "task_ack")
+            if cursor is not None:
+                stmt = stmt.where(pagination.after_cursor(TimelineEvent, cursor))
+            page = (await s.scalars(stmt.order_by(*pagination.order_by(TimelineEvent)).limit(1000))).all()
+        for e in page:
+            tid = (e.payload or {}).get("task_id")
+            if tid in tasks and tid not in first_ack:
+                first_ack[tid] = e.created_at
+        if len(page) < 1000:
+            break
+        cursor = (page[-1].created_at, page[-1].id)
+
+    for tid, acked_at in first_ack.items():
+        _, created_at, sla = tasks[tid]
+        elapsed = (as_utc(acked_at) - as_utc(created_at)).total_seconds()
+        values["task_acked"] += 1
+        values["ack_seconds_sum"] += elapsed
+        if elapsed > sla * 60:
+            values["sla_breached"] += 1
+    return values
+
+
+async def rebuild(incident_id: str, write: bool = True) -> dict[str, tuple[float, float]]:
+    """重算并（可选）覆盖写入；返回与当前聚合行不一致的字段 {name: (stored, computed)}。"""
+    computed = await compute(incident_id)
+    async with db.async_session() as s:
+        row = await s.get(IncidentMetrics, incident_id)
+        stored = {k: (getattr(row, k) if row else 0) for k in computed}
+        diff = {k: (stored[k], v) for k, v in computed.items() if abs(stored[k] - v) > 1e-6}
+        if write and (diff or row is None):
+            await _ensure_row(s, incident_id)
+            await s.execute(
+                update(IncidentMetrics)
+                .where(IncidentMetrics.incident_id == incident_id)
+                .values(**computed, updated_at=utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await s.commit()
+    return diff
+
+
+async def backfill() -> int:
+    """为尚无聚合行的事件从 task / timeline_event 重算补齐（启动时、接收请求前调用，幂等）。"""
+    async with db.async_session() as s:
+        missing = list(
+            (
+                await s.scalars(
+                    select(Incident.id)
+                    .outerjoin(IncidentMetrics, IncidentMetrics.incident_id == Incident.id)
+                    .where(IncidentMetrics.incident_id.is_(None))
+                    .order_by(Incident.id)
+                )
+            ).all()
+        )
+    for incident_id in missing:
+        await rebuild(incident_id)
+    return len(missing)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import AsyncIterator, Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import func, literal_column, select
+
+from . import risk_index
+from .geo_index import geo_index, location_of
+from .history import feature_history
+from .cache import OBJECT_NAMESPACE, cache, object_key, topn_namespace
+from .storage import db
+from .storage.models import ObjectState
+
+
+# 高频特征批量写入（演示级）：
+# - 输入：NDJSON 流（每行 {"object_id", "features", 可选 "object_type"/"area_id"/"location": {"lon", "lat"}}）
+#   或紧凑批格式 {"fields": [...], "rows": [[object_id, v1, v2, ...], ...]}；
+# - 每 INGEST_BATCH_SIZE 条做一次多行 INSERT ... ON CONFLICT DO UPDATE，
+#   features / dq_tags / attrs 在数据库侧合并（Postgres: jsonb ||；SQLite: json_patch）；
+#   合并语义按顶层键覆盖：入库前递归去掉 null（json_patch 会把嵌套 null 当删除、jsonb || 则原样保留），
+#   两边都不会因 null 删字段；差异只剩嵌套对象值——Postgres 整体替换，SQLite 递归合并，特征值应保持为标量/数组；
+# - 同一事务内刷新 updated_at、dq_tags.freshness，并把风险索引置脏；
+# - 提交后失效对象快照缓存，并使受影响区域的 topn 缓存代数 +1；带坐标的对象同步更新空间索引；
+# - 数值特征读数追加到本地特征历史（history.py），供窗口聚合与滚动特征派生。
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+INGEST_MAX_ERRORS = 100
+
+
+class IngestFormatError(ValueError):
+    pass
+
+
+@dataclass
+class IngestRecord:
+    object_id: str
+    features: dict[str, Any]
+    object_type: str | None = None
+    area_id: str | None = None
+    location: tuple[float, float] | None = None
+
+
+@dataclass
+class IngestResult:
+    accepted: int = 0
+    rejected: int = 0
+    batches: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def reject(self, ref: Any, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < INGEST_MAX_ERRORS:
+            self.errors.append({"ref": ref, "reason": reason})
+
+
+def _to_record(obj: Any) -> IngestRecord:
+    if not isinstance(obj, dict):
+        raise IngestFormatError("record must be an object")
+    oid = obj.get("object_id")
+    features = obj.get("features")
+    if not isinstance(oid, str) or not oid:
+        raise IngestFormatError("missing object_id")
+    for key in ("object_type", "area_id"):
+        if obj.get(key) is not None and not isinstance(obj[key], str):
+            raise IngestFormatError(f"{key} must be a string")
+    location = None
+    if obj.get("location") is not None:
+        location = location_of(obj["location"]) if isinstance(obj["location"], dict) else None
+        if location is None:
+            raise IngestFormatError("location must be {lon, lat} within WGS84 range")
+    if features is None and location is not None:
+        features = {}
+    if not isinstance(features, dict):
+        raise IngestFormatError("features must be an object")
+    # null 视为本次未上报（与紧凑格式一致），不删除已有字段
+    features = _without_nulls(features)
+    if not features and location is None:
+        raise IngestFormatError("features must be a non-empty object")
+    return IngestRecord(
+        object_id=oid,
+        features=features,
+        object_type=obj.get("object_type"),
+        area_id=obj.get("area_id"),
+        location=location,
+    )
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], result: IngestResult) -> AsyncIterator[IngestRecord]:
+    """按行增量解析请求体；坏行计入 rejected，不中断整个流。"""
+    buf = b""
+    line_no = 0
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line_no += 1
+            rec = _parse_line(line, line_no, result)
+            if rec is not None:
+                yield rec
+    if buf.strip():
+        rec = _parse_line(buf, line_no + 1, result)
+        if rec is not None:
+            yield rec
+
+
+def _parse_line(line: bytes, line_no: int, result: IngestResult) -> IngestRecord | None:
+    if not line.strip():
+        return None
+    try:
+        return _to_record(json.loads(line))
+    except (ValueError, IngestFormatError) as e:
+        result.reject({"line": line_no}, str(e))
+        return None
+
+
+def iter_compact(body: dict[str, Any], result: IngestResult) -> Iterator[IngestRecord]:
+    """紧凑批格式：字段名只出现一次，行内 null 表示该字段本次未上报。"""
+    if not isinstance(body, dict):
+        raise IngestFormatError("compact batch must be an object")
+    fields = body.get("fields")
+    rows = body.get("rows")
+    if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields) or not isinstance(rows, list):
+        raise IngestFormatError("compact batch requires 'fields' (list[str]) and 'rows' (list)")
+    width = len(fields) + 1
+    for i, row in enumerate(rows):
+        if not isinstance(row, list) or len(row) != width or not isinstance(row[0], str):
+            result.reject({"row": i}, f"row must be [object_id, {len(fields)} values]")
+            continue
+        features = _without_nulls(dict(zip(fields, row[1:])))
+        if not features:
+            result.reject({"row": i, "object_id": row[0]}, "no feature values")
+            continue
+        yield IngestRecord(object_id=row[0], features=features)
+
+
+def _without_nulls(value: Any) -> Any:
+    """递归去掉对象里的 null，让 jsonb || 与 json_patch 的结果一致（数组内不动，两者都整体替换数组）。"""
+    if isinstance(value, dict):
+        return {k: _without_nulls(v) for k, v in value.items() if v is not None}
+    return value
+
+
+def _upsert_stmt(dialect: str):
+    stmt = db.dialect_insert(dialect, ObjectState)
+    if dialect == "postgresql":
+        merged_features = literal_column("(object_state.features::jsonb || excluded.features::jsonb)::json")
+        merged_dq = literal_column("(object_state.dq_tags::jsonb || excluded.dq_tags::jsonb)::json")
+        merged_attrs = literal_column("(object_state.attrs::jsonb || excluded.attrs::jsonb)::json")
+    else:
+        merged_features = func.json_patch(ObjectState.features, stmt.excluded.features)
+        merged_dq = func.json_patch(ObjectState.dq_tags, stmt.excluded.dq_tags)
+        merged_attrs = func.json_patch(ObjectState.attrs, stmt.excluded.attrs)
+    return stmt.on_conflict_do_update(
+        index_elements=[ObjectState.object_id],
+        set_={
+            "features": merged_features,
+            "dq_tags": merged_dq,
+            "attrs": merged_attrs,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+async def write_batch(records: Iterable[IngestRecord], result: IngestResult) -> set[str]:
+    """一批记录一次事务：同对象多条先在内存合并，再多行 upsert；返回涉及路段的区域。"""
+    merged: dict[str, IngestRecord] = {}
+    counts: dict[str, int] = {}
+    for rec in records:
+        prev = merged.get(rec.object_id)
+        counts[rec.object_id] = counts.get(rec.object_id, 0) + 1
+        if prev is None:
+            merged[rec.object_id] = IngestRecord(
+                rec.object_id, dict(rec.features), rec.object_type, rec.area_id, rec.location
+            )
+        else:
+            prev.features.update(rec.features)
+            prev.object_type = rec.object_type or prev.object_type
+            prev.area_id = rec.area_id or prev.area_id
+            prev.location = rec.location or prev.location
+    if not merged:
+        return set()
+
+    now = datetime.now(timezone.utc)
+    dq_patch = {"freshness": 1.0}
+    async with db.async_session() as s:
+        existing = {
+            oid: (otype, area)
+            for oid, otype, area in await s.execute(
+                select(ObjectState.object_id, ObjectState.object_type, ObjectState.area_id).where(
+                    ObjectState.object_id.in_(list(merged))
+                )
+            )
+        }
+        params: list[dict[str, Any]] = []
+        new_rows: list[tuple[str, str, str]] = []
+        for oid, rec in merged.items():
+            known = existing.get(oid)
+            if known is None:
+                if not (rec.object_type and rec.area_id):
+                    for _ in range(counts[oid]):
+                        result.reject({"object_id": oid}, "unknown object (object_type/area_id required to create)")
+                    continue
+                known = (rec.object_type, rec.area_id)
+                new_rows.append((oid, rec.object_type, rec.area_id))
+            params.append(
+                {
+                    "object_id": oid,
+                    "object_type": known[0],
+                    "area_id": known[1],
+                    "attrs": {"lon": rec.location[0], "lat": rec.location[1]} if rec.location else {},
+                    "features": rec.features,
+                    "dq_tags": dq_patch,
+                    "updated_at": now,
+                }
+            )
+        if not params:
+            return set()
+        await s.execute(_upsert_stmt(db.async_engine.dialect.name), params)
+        # 风险索引：已有对象置脏，新建路段补 dirty 行
+        await risk_index.mark_dirty(s, [p["object_id"] for p in params if p["object_id"] in existing])
+        await risk_index.add_rows(s, new_rows)
+        await s.commit()
+    for p in params:
+        if p["attrs"]:
+            geo_index.upsert(p["object_id"], p["object_type"], p["area_id"], p["attrs"]["lon"], p["attrs"]["lat"])
+    if feature_history is not None:
+        await feature_history.record_async(((p["object_id"], p["features"]) for p in params), now)
+    areas = {p["area_id"] for p in params if p["object_type"] == risk_index.RISK_INDEX_OBJECT_TYPE}
+    # 先推进对象代数再删 key：加载中的旧快照会因代数变化放弃写入
+    await cache.bump([OBJECT_NAMESPACE, *(topn_namespace(a) for a in areas)])
+    await cache.invalidate(object_key(p["object_id"]) for p in params)
+    result.accepted += sum(counts[p["object_id"]] for p in params)
+    result.batches += 1
+    return areas
@@ -1,37 +1,91 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
+import json
 import os
 from contextlib import asynccontextmanager
-from datetime import datetime, timedelta, timezone
-from uuid import uuid4
+from dataclasses import asdict
+from datetime import datetime, timezone
+from itertools import islice
 from typing import Any
 
-import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from flood_common import metrics
+
+from . import incident_metrics, ingest, pagination, risk_index, seed, wire
+from .cache import OBJECT_NAMESPACE, cache, incident_namespace, object_key, topn_namespace
+from .events import bus, format_sse
+from .geo_index import geo_index
+from .history import AGGS, ROLLING_FEATURES, epoch, feature_history
+from .model_client import ModelServiceError, model_client
 from .storage import db
 from .storage.models import (
-    AlertEvent,
     Incident,
+    IncidentMetrics,
     ObjectState,
+    RiskScore,
     Task,
     TimelineEvent,
     ensure_schema,
+    new_id,
+    utcnow,
 )
 
 
-MODEL_SERVICE_URL = os.getenv("MODEL_SERVICE_URL", "http://model-service:8002").rstrip("/")
 AUTO_SEED = os.getenv("AUTO_SEED", "false").lower() == "true"
+# 战报时间线默认页大小；全量导出走 NDJSON 流，每批 EXPORT_PAGE_SIZE 行
+REPORT_TIMELINE_LIMIT = int(os.getenv("REPORT_TIMELINE_LIMIT", "500"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+# SSE 心跳间隔（秒），防止代理因空闲断开长连接
+EVENT_HEARTBEAT_S = float(os.getenv("EVENT_HEARTBEAT_S", "15"))
+# 读缓存 TTL（秒）：写路径会主动失效，TTL 只是兜底
+CACHE_TTL_OBJECT_S = float(os.getenv("CACHE_TTL_OBJECT_S", "30"))
+CACHE_TTL_TOPN_S = float(os.getenv("CACHE_TTL_TOPN_S", "10"))
+CACHE_TTL_REPORT_S = float(os.getenv("CACHE_TTL_REPORT_S", "10"))
+CACHE_TTL_AREAS_S = float(os.getenv("CACHE_TTL_AREAS_S", "60"))
+# 全市/多区域 topn：同时重算/读取的区域数上限（受数据库连接池与模型服务并发约束；
+# SQLite 只有一个写者，并行重算只会互相等锁，默认逐个区域进行）
+TOPN_AREA_CONCURRENCY = int(
+    os.getenv("TOPN_AREA_CONCURRENCY", "1" if db.ASYNC_DATABASE_URL.startswith("sqlite") else "16")
+)
+# 对象变化增量读取（/objects/changes）单页上限
+OBJECT_CHANGES_MAX_PAGE = int(os.getenv("OBJECT_CHANGES_MAX_PAGE", "20000"))
+# 空间查询上限：单次返回条数、半径
+GEO_MAX_RESULTS = int(os.getenv("GEO_MAX_RESULTS", "5000"))
+GEO_MAX_RADIUS_M = float(os.getenv("GEO_MAX_RADIUS_M", "50000"))
+# 特征历史查询上限：单次聚合的对象数、单对象序列的时间跨度（秒）
+HISTORY_MAX_OBJECTS = int(os.getenv("HISTORY_MAX_OBJECTS", "10000"))
+HISTORY_MAX_SPAN_S = int(os.getenv("HISTORY_MAX_SPAN_S", str(7 * 86400)))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     ensure_schema()
     if AUTO_SEED:
-        seed_demo_data()
-    yield
+        seed.seed_demo_data()
+    await risk_index.backfill()
+    await incident_metrics.backfill()
+    await geo_index.start()
+    if feature_history is not None:
+        await feature_history.start()
+    await model_client.start()
+    await cache.start()
+    try:
+        yield
+    finally:
+        await geo_index.stop()
+        if feature_history is not None:
+            await feature_history.stop()
+        await cache.close()
+        await model_client.close()
+        await db.async_engine.dispose()
 
 
 app = FastAPI(title="Flood Demo API", version="0.1.0", lifespan=lifespan)
@@ -41,7 +95,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Next-Cursor"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # -----------------------------
@@ -65,6 +121,25 @@ class RiskTopNResponse(BaseModel):
     items: list[RiskItem]
 
 
+class AreaRiskItem(RiskItem):
+    area_id: str
+
+
+class MultiAreaTopNResponse(BaseModel):
+    time: str
+    area_ids: list[str]
+    items: list[AreaRiskItem]
+    by_area: dict[str, list[RiskItem]]
+
+
+class HistoryAggregateRequest(BaseModel):
+    object_ids: list[str]
+    feature: str
+    agg: str = "mean"
+    window_s: int = Field(3600, gt=0)
+    time: datetime | None = None
+
+
 class AgentTask(BaseModel):
     task_type: str
     target_object_id: str
@@ -118,40 +193,236 @@ def health():
     return {"ok": True}
 
 
+@app.get("/events/stream")
+async def event_stream(
+    request: Request,
+    incident_id: str | None = None,
+    area_id: str | None = None,
+    cursor: str | None = None,
+    last_event_id: str | None = Header(default=None),
+):
+    """
+    SSE 推送：时间线事件（timeline）、任务状态变化（task_status）、风险等级变化（risk_level），
+    可按 incident_id / area_id 过滤。断线重连：浏览器自动带 Last-Event-ID，从内存缓冲区补发；
+    缓冲区已覆盖时先推送 resync，客户端应重新拉取快照。带 incident_id 时还可传 cursor
+    （timeline 事件里的 cursor 字段）从数据库补齐之后的时间线，客户端按 event_id 去重。
+    """
+    db_cursor = _parse_cursor(cursor) if incident_id else None
+    sub = bus.subscribe(incident_id, area_id)
+    backlog = bus.replay(last_event_id, sub) if last_event_id else []
+
+    async def stream():
+        try:
+            if backlog is None:
+                yield format_sse({"id": bus.current_id(), "kind": "resync"})
+            if db_cursor is not None:
+                page_cursor = db_cursor
+                while page_cursor is not None:
+                    async with db.async_session() as s:
+                        page, next_cursor = await _keyset_page(
+                            s, TimelineEvent, incident_id, EXPORT_PAGE_SIZE, page_cursor, descending=False
+                        )
+                    for e in page:
+                        yield format_sse(
+                            {
+                                "id": bus.current_id(),
+                                "kind": "timeline",
+                                "incident_id": incident_id,
+                                "cursor": pagination.encode_cursor(e.created_at, e.id),
+                                **_event_dict(e),
+                            }
+                        )
+                    page_cursor = pagination.decode_cursor(next_cursor) if next_cursor else None
+            for e in backlog or []:
+                yield format_sse(e)
+            while not await request.is_disconnected():
+                try:
+                    e = await asyncio.wait_for(sub.queue.get(), timeout=EVENT_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                yield format_sse(e)
+                if sub.overflowed and sub.queue.empty():
+                    # 消费过慢已丢事件：通知客户端重新拉取快照，断开后由客户端重连
+                    yield format_sse({"id": bus.current_id(), "kind": "resync"})
+                    break
+        finally:
+            bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+def service_metrics():
+    """按路由的延迟直方图、在途请求数、每请求 SQL/模型调用次数与耗时，以及连接池等待等全局直方图。"""
+    return metrics.registry.snapshot("api")
+
+
+@app.get("/metrics/traces")
+def trace_metrics(trace_id: str | None = None, limit: int = Query(default=50, ge=1, le=1000)):
+    """最近请求明细；带 trace_id 时只返回该链路（与 agent/model 的同名接口对照即可分解端到端耗时）。"""
+    return metrics.registry.find_traces(trace_id, limit)
+
+
+@app.get("/metrics/events")
+def event_bus_metrics():
+    return bus.stats()
+
+
+@app.get("/metrics/model-client")
+def model_client_metrics():
+    """api -> model-service 连接池/微批指标（批大小、排队时延等）；MODEL_BACKEND=local 时为进程内打分的请求数与规则状态。"""
+    return model_client.stats()
+
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    """读缓存命中/未命中、合并加载（single-flight）与失效次数。"""
+    return cache.stats()
+
+
+@app.get("/metrics/history")
+def history_metrics():
+    """特征历史：对象数、raw / 降采样分区数、磁盘占用、写入/丢弃读数。"""
+    return _history().stats()
+
+
+async def _area_topn(area_id: str, n: int, model_version: str) -> list[dict[str, Any]]:
+    """单区域 topn（已按 risk_score DESC, target_id ASC 排好序）。"""
+
+    async def load() -> list[dict[str, Any]]:
+        # 物化风险索引：先增量重算本区域特征有变化的对象，再按 (area_id, risk_score DESC) 有序读取
+        try:
+            await risk_index.refresh_area(area_id, model_version)
+        except ModelServiceError as e:
+            raise HTTPException(502, str(e))
+        rows = await risk_index.read_topn(area_id, max(n, 0))
+        return [
+            RiskItem(
+                target_id=r.object_id,
+                target_type=r.object_type,
+                risk_score=r.risk_score,
+                risk_level=r.risk_level,
+                confidence=r.confidence,
+                explain_factors=r.explain_factors or [],
+                model_version=r.model_version or model_version,
+            ).model_dump()
+            for r in rows
+        ]
+
+    # 缓存按 (area_id, n, model_version) + 区域代数；写特征时代数 +1 即失效
+    gen = await cache.generation(topn_namespace(area_id))
+    return await cache.get_or_load(f"topn:{area_id}:{n}:{model_version}:g{gen}", CACHE_TTL_TOPN_S, load)
+
+
+async def _current_model_version() -> str:
+    try:
+        return await model_client.current_version()
+    except ModelServiceError as e:
+        raise HTTPException(502, str(e))
+
+
 @app.get("/risk/topn", response_model=RiskTopNResponse)
 async def risk_topn(area_id: str = "A-001", n: int = 5):
     """对标 V7：TopN 风险点位（模型+置信度+解释因子）。"""
     now = datetime.now(timezone.utc)
-    # 从对象状态表取路段列表（演示：取前 N*2 再让模型排序）
-    with db.session() as s:
-        roads = (
-            s.query(ObjectState)
-            .filter(ObjectState.object_type == "road_segment", ObjectState.area_id == area_id)
-            .limit(max(n * 2, n))
-            .all()
-        )
-    if not roads:
+    items = await _area_topn(area_id, n, await _current_model_version())
+    if not items:
         raise HTTPException(404, "no road segments in this area")
-
-    payload = {
-        "time": now.isoformat(),
-        "area_id": area_id,
-        "targets": [{"target_id": r.object_id, "features": r.features or {}} for r in roads],
+    return RiskTopNResponse(time=now.isoformat(), area_id=area_id, items=items)
+
+
+@app.get("/risk/topn/areas", response_model=MultiAreaTopNResponse)
+async def risk_topn_areas(
+    area_ids: str | None = Query(None, description="逗号分隔；缺省为全部区域"),
+    n: int = Query(20, ge=1, le=1000),
+    k: int = Query(3, ge=0, le=100),
+):
+    """
+    全市/多区域 TopN：各区域并行增量重算并读取各自有序的前 max(n, k) 条（每区域有界），
+    再按 risk_score 多路归并出全局前 n，同时返回每个区域的前 k。
+    各区域复用单区域 topn 的缓存与失效；耗时约等于最慢的区域，而不是各区域之和。
+    """
+    now = datetime.now(timezone.utc)
+    model_version = await _current_model_version()
+    if area_ids:
+        areas = list(dict.fromkeys(a.strip() for a in area_ids.split(",") if a.strip()))
+    else:
+        areas = await cache.get_or_load("risk:areas", CACHE_TTL_AREAS_S, risk_index.list_areas)
+    m = max(n, k)
+    sem = asyncio.Semaphore(TOPN_AREA_CONCURRENCY)
+
+    async def one(area_id: str) -> list[dict[str, Any]]:
+        async with sem:
+            return await _area_topn(area_id, m, model_version)
+
+    per_area = dict(zip(areas, await asyncio.gather(*(one(a) for a in areas))))
+    merged = heapq.merge(
+        *([{**it, "area_id": area_id} for it in items] for area_id, items in per_area.items()),
+        key=lambda it: (-it["risk_score"], it["target_id"]),
+    )
+    return MultiAreaTopNResponse(
+        time=now.isoformat(),
+        area_ids=areas,
+        items=list(islice(merged, n)),
+        by_area={area_id: items[:k] for area_id, items in per_area.items()},
+    )
+
+
+@app.get("/objects/changes")
+async def object_changes(
+    request: Request,
+    since: float | None = Query(None, description="updated_at 下限（epoch 秒，含）；缺省为全量"),
+    cursor: str | None = None,
+    object_type: str | None = None,
+    limit: int = Query(5000, ge=1),
+):
+    """
+    按 (updated_at, object_id) 键集分页读取对象特征变化，供下游增量同步（如 model-service 特征库）。
+    next_cursor 为空表示已读到当前末尾；Accept: application/x-msgpack 时以 MessagePack 返回（结构相同）。
+    """
+    stmt = select(
+        ObjectState.object_id, ObjectState.object_type, ObjectState.area_id, ObjectState.features, ObjectState.updated_at
+    )
+    if since is not None:
+        stmt = stmt.where(ObjectState.updated_at >= datetime.fromtimestamp(since, timezone.utc))
+    if object_type:
+        stmt = stmt.where(ObjectState.object_type == object_type)
+    if cursor:
+        try:
+            after_at, after_id = pagination.decode_cursor(cursor)
+        except pagination.CursorError as e:
+            raise HTTPException(400, str(e))
+        stmt = stmt.where(
+            (ObjectState.updated_at > after_at) | ((ObjectState.updated_at == after_at) & (ObjectState.object_id > after_id))
+        )
+    limit = min(limit, OBJECT_CHANGES_MAX_PAGE)
+    stmt = stmt.order_by(ObjectState.updated_at, ObjectState.object_id).limit(limit)
+    async with db.async_session() as s:
+        rows = (await s.execute(stmt)).all()
+    body = {
+        "items": [
+            {"object_id": oid, "object_type": otype, "area_id": area, "features": features or {}, "updated_at": epoch(at)}
+            for oid, otype, area, features, at in rows
+        ],
+        "next_cursor": pagination.encode_cursor(rows[-1][4], rows[-1][0]) if len(rows) == limit else None,
     }
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(f"{MODEL_SERVICE_URL}/infer/topn", json=payload)
-    if resp.status_code != 200:
-        raise HTTPException(502, f"model-service error: {resp.text}")
-    data = resp.json()
-    items = [RiskItem(**it) for it in data["items"][:n]]
-    return RiskTopNResponse(time=payload["time"], area_id=area_id, items=items)
+    if "msgpack" in request.headers.get("accept", ""):
+        return Response(wire.dumps(body), media_type=wire.MSGPACK)
+    return body
 
 
 @app.get("/objects/{object_id}")
-def get_object_state(object_id: str):
+async def get_object_state(object_id: str):
     """对标 V7：对象状态快照接口 get_object_state(object_id)。"""
-    with db.session() as s:
-        obj = s.query(ObjectState).filter(ObjectState.object_id == object_id).first()
+
+    async def load() -> dict[str, Any]:
+        async with db.async_session() as s:
+            obj = await s.get(ObjectState, object_id)
         if not obj:
             raise HTTPException(404, "object not found")
         return {
@@ -164,202 +435,430 @@ def get_object_state(object_id: str):
             "updated_at": obj.updated_at.isoformat(),
         }
 
+    return await cache.get_or_load(object_key(object_id), CACHE_TTL_OBJECT_S, load, guard=OBJECT_NAMESPACE)
+
+
+# -----------------------------
+# 特征历史：单对象序列、滚动特征、批量窗口聚合
+# -----------------------------
+
+
+def _history():
+    if feature_history is None:
+        raise HTTPException(503, "feature history disabled (HISTORY_ENABLED=false)")
+    return feature_history
+
+
+@app.get("/objects/{object_id}/history")
+def get_object_history(object_id: str, feature: str, start: datetime | None = None, end: datetime | None = None):
+    """单对象某特征的时间序列，默认最近 1 小时；已降采样的时段按粗槽返回均值/最大值。"""
+    store = _history()
+    end_ts = epoch(end)
+    start_ts = epoch(start) if start else end_ts - 3600
+    if not 0 < end_ts - start_ts <= HISTORY_MAX_SPAN_S:
+        raise HTTPException(400, f"start must be before end, span <= {HISTORY_MAX_SPAN_S}s")
+    points = store.series(object_id, feature, start_ts, end_ts)
+    return {"object_id": object_id, "feature": feature, "count": len(points), "points": points}
+
+
+@app.get("/objects/{object_id}/rolling")
+def get_object_rolling(object_id: str):
+    """由特征历史派生的滚动特征（rain_1h_mm 等），定义见 history.ROLLING_FEATURES。"""
+    now = datetime.now(timezone.utc)
+    values = _history().rolling([object_id], now)[object_id]
+    return {
+        "object_id": object_id,
+        "time": now.isoformat(),
+        "features": values,
+        "definitions": {k: {"source": f, "agg": a, "window_s": w} for k, (f, a, w) in ROLLING_FEATURES.items()},
+    }
+
+
+@app.post("/history/aggregate")
+def history_aggregate(req: HistoryAggregateRequest):
+    """批量窗口聚合：最近 window_s 秒内每个对象的 sum/mean/min/max/count/last/accum，无读数为 null。"""
+    store = _history()
+    if req.agg not in AGGS:
+        raise HTTPException(400, f"agg must be one of {', '.join(AGGS)}")
+    if len(req.object_ids) > HISTORY_MAX_OBJECTS:
+        raise HTTPException(400, f"at most {HISTORY_MAX_OBJECTS} object_ids per request")
+    if req.window_s > HISTORY_MAX_SPAN_S:
+        raise HTTPException(400, f"window_s must be <= {HISTORY_MAX_SPAN_S}")
+    now = req.time or datetime.now(timezone.utc)
+    values = store.window(req.object_ids, req.feature, req.agg, req.window_s, now)
+    return {"time": now.isoformat(), "feature": req.feature, "agg": req.agg, "window_s": req.window_s, "values": values}
+
+
+# -----------------------------
+# 空间查询：框选 / 半径 / k 近邻（进程内网格索引，可选附带当前风险分）
+# -----------------------------
+
+
+def _geo_item(e, distance_m: float | None = None) -> dict[str, Any]:
+    item = {"object_id": e.object_id, "object_type": e.object_type, "area_id": e.area_id, "lon": e.lon, "lat": e.lat}
+    if distance_m is not None:
+        item["distance_m"] = round(distance_m, 1)
+    return item
+
+
+async def _attach_risk(items: list[dict[str, Any]]) -> None:
+    """一次 IN 查询补上 risk_score 索引行；未建索引的对象类型为 null，dirty 表示特征已变、分数待重算。"""
+    ids = [it["object_id"] for it in items]
+    rows: dict[str, RiskScore] = {}
+    async with db.async_session() as s:
+        for start in range(0, len(ids), 1000):
+            chunk = ids[start : start + 1000]
+            rows.update((r.object_id, r) for r in await s.scalars(select(RiskScore).where(RiskScore.object_id.in_(chunk))))
+    for it in items:
+        r = rows.get(it["object_id"])
+        it["risk"] = (
+            None
+            if r is None
+            else {
+                "risk_score": r.risk_score,
+                "risk_level": r.risk_level,
+                "confidence": r.confidence,
+                "model_version": r.model_version,
+                "dirty": r.dirty,
+            }
+        )
+
+
+async def _geo_response(items: list[dict[str, Any]], truncated: bool, with_risk: bool) -> dict[str, Any]:
+    if with_risk and items:
+        await _attach_risk(items)
+    return {"count": len(items), "truncated": truncated, "items": items}
+
+
+@app.get("/geo/bbox")
+async def geo_bbox(
+    min_lon: float,
+    min_lat: float,
+    max_lon: float,
+    max_lat: float,
+    object_type: str | None = None,
+    area_id: str | None = None,
+    limit: int = Query(500, ge=1, le=GEO_MAX_RESULTS),
+    with_risk: bool = False,
+):
+    """框选范围内的对象（按 object_id 排序）。"""
+    if min_lon > max_lon or min_lat > max_lat:
+        raise HTTPException(400, "min_lon/min_lat must not exceed max_lon/max_lat")
+    entries, truncated = geo_index.bbox(min_lon, min_lat, max_lon, max_lat, object_type, area_id, limit)
+    return await _geo_response([_geo_item(e) for e in entries], truncated, with_risk)
+
+
+@app.get("/geo/radius")
+async def geo_radius(
+    lon: float = Query(..., ge=-180, le=180),
+    lat: float = Query(..., ge=-90, le=90),
+    radius_m: float = Query(2000, gt=0, le=GEO_MAX_RADIUS_M),
+    object_type: str | None = None,
+    area_id: str | None = None,
+    limit: int = Query(500, ge=1, le=GEO_MAX_RESULTS),
+    with_risk: bool = False,
+):
+    """半径内的对象，按距离由近到远（例如：积水点 2 km 内的路段与泵站）。"""
+    hits, truncated = geo_index.radius(lon, lat, radius_m, object_type, area_id, limit)
+    return await _geo_response([_geo_item(e, d) for d, e in hits], truncated, with_risk)
+
+
+@app.get("/geo/nearest")
+async def geo_nearest(
+    lon: float = Query(..., ge=-180, le=180),
+    lat: float = Query(..., ge=-90, le=90),
+    k: int = Query(10, ge=1, le=1000),
+    object_type: str | None = None,
+    area_id: str | None = None,
+    max_radius_m: float | None = Query(None, gt=0, le=GEO_MAX_RADIUS_M),
+    with_risk: bool = False,
+):
+    """最近的 k 个对象，按距离由近到远。"""
+    hits = geo_index.nearest(lon, lat, k, object_type, area_id, max_radius_m)
+    return await _geo_response([_geo_item(e, d) for d, e in hits], False, with_risk)
+
+
+@app.get("/geo/stats")
+def geo_stats():
+    return geo_index.stats()
+
+
+@app.post("/ingest/features")
+async def ingest_features(request: Request):
+    """
+    传感网关批量上报特征（部分字段合并进 ObjectState.features）：
+    - Content-Type: application/x-ndjson：每行 {"object_id", "features", 可选 "object_type"/"area_id"}；
+    - 其它：紧凑批格式 {"fields": [...], "rows": [[object_id, v1, ...], ...]}。
+    未知对象需带 object_type/area_id 才会新建，否则计入 rejected。
+    """
+    result = ingest.IngestResult()
+    areas: set[str] = set()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        batch: list[ingest.IngestRecord] = []
+        async for rec in ingest.iter_ndjson(request.stream(), result):
+            batch.append(rec)
+            if len(batch) >= ingest.INGEST_BATCH_SIZE:
+                areas |= await ingest.write_batch(batch, result)
+                batch = []
+        if batch:
+            areas |= await ingest.write_batch(batch, result)
+    else:
+        try:
+            body = json.loads(await request.body())
+            records = list(ingest.iter_compact(body, result))
+        except ValueError as e:
+            raise HTTPException(400, f"invalid compact batch: {e}")
+        for start in range(0, len(records), ingest.INGEST_BATCH_SIZE):
+            areas |= await ingest.write_batch(records[start : start + ingest.INGEST_BATCH_SIZE], result)
+    # 后台增量重算受影响区域，风险等级变化经事件流推送
+    risk_index.schedule_refresh(areas)
+    return asdict(result)
+
 
 @app.post("/workflow/incidents", response_model=dict)
-def create_incident(area_id: str = "A-001", title: str = "暴雨内涝事件"):
-    with db.session() as s:
+async def create_incident(area_id: str = "A-001", title: str = "暴雨内涝事件"):
+    now = utcnow()
+    async with db.async_session() as s:
         inc = Incident(area_id=area_id, title=title, status="open")
         s.add(inc)
-        s.flush()
-        s.add(TimelineEvent(incident_id=inc.id, type="incident_created", payload={"title": title}))
-        s.commit()
-        return {"incident_id": inc.id, "status": inc.status}
+        await s.flush()
+        event = TimelineEvent(incident_id=inc.id, type="incident_created", payload={"title": title}, created_at=now)
+        s.add(event)
+        await s.commit()
+    _publish_timeline(area_id, event)
+    return {"incident_id": inc.id, "status": inc.status}
 
 
 @app.post("/workflow/incidents/{incident_id}/tasks", response_model=WorkflowTriggerResponse)
-def create_tasks(incident_id: str, task_pack: TaskPack):
+async def create_tasks(incident_id: str, task_pack: TaskPack):
     """创建任务（演示级）。"""
     if incident_id != task_pack.incident_id:
         raise HTTPException(400, "incident_id mismatch")
-    created: list[str] = []
-    with db.session() as s:
-        inc = s.query(Incident).filter(Incident.id == incident_id).first()
-        if not inc:
-            raise HTTPException(404, "incident not found")
-        for t in task_pack.tasks:
-            task = Task(
-                incident_id=incident_id,
-                task_type=t.task_type,
-                target_object_id=t.target_object_id,
-                owner_org=t.owner_org,
-                sla_minutes=t.sla_minutes,
-                required_evidence=t.required_evidence,
-                need_approval=t.need_approval,
-                status="pending",
-                title=t.title or t.task_type,
-                detail=t.detail,
-            )
-            s.add(task)
-            s.flush()
-            created.append(task.id)
-            s.add(
-                TimelineEvent(
-                    incident_id=incident_id,
-                    type="task_created",
-                    payload={"task_id": task.id, "task_type": task.task_type, "target": task.target_object_id},
-                )
-            )
-        s.commit()
-    return WorkflowTriggerResponse(incident_id=incident_id, created_task_ids=created, status="created")
-
-
-@app.get("/workflow/incidents/{incident_id}/tasks")
-def list_tasks(incident_id: str):
-    with db.session() as s:
-        tasks = s.query(Task).filter(Task.incident_id == incident_id).order_by(Task.created_at.desc()).all()
-        return [
+    # 批量写入：客户端生成 ULID 主键，无需逐条 flush 回读 id；任务与时间线各一条批量 INSERT
+    now = utcnow()
+    task_rows: list[dict[str, Any]] = []
+    event_rows: list[dict[str, Any]] = []
+    for t in task_pack.tasks:
+        task_id = new_id("task")
+        task_rows.append(
             {
-                "task_id": t.id,
+                "id": task_id,
+                "incident_id": incident_id,
                 "task_type": t.task_type,
                 "target_object_id": t.target_object_id,
                 "owner_org": t.owner_org,
                 "sla_minutes": t.sla_minutes,
-                "status": t.status,
-                "need_approval": t.need_approval,
                 "required_evidence": t.required_evidence,
-                "created_at": t.created_at.isoformat(),
-                "updated_at": t.updated_at.isoformat(),
+                "need_approval": t.need_approval,
+                "status": "pending",
+                "title": t.title or t.task_type,
+                "detail": t.detail,
+                "created_at": now,
+                "updated_at": now,
             }
-            for t in tasks
-        ]
+        )
+        event_rows.append(
+            {
+                "id": new_id("tl"),
+                "incident_id": incident_id,
+                "type": "task_created",
+                "payload": {"task_id": task_id, "task_type": t.task_type, "target": t.target_object_id},
+                "created_at": now,
+            }
+        )
+    created = [row["id"] for row in task_rows]
+    async with db.async_session() as s:
+        inc = await s.get(Incident, incident_id)
+        if not inc:
+            raise HTTPException(404, "incident not found")
+        if task_rows:
+            await s.execute(insert(Task), task_rows)
+            await s.execute(insert(TimelineEvent), event_rows)
+            await incident_metrics.on_tasks_created(s, incident_id, len(task_rows))
+        await s.commit()
+    await cache.bump([incident_namespace(incident_id)])
+    for row in event_rows:
+        _publish_timeline(inc.area_id, TimelineEvent(**row))
+    return WorkflowTriggerResponse(incident_id=incident_id, created_task_ids=created, status="created")
+
+
+def _task_dict(t: Task) -> dict[str, Any]:
+    return {
+        "task_id": t.id,
+        "task_type": t.task_type,
+        "target_object_id": t.target_object_id,
+        "owner_org": t.owner_org,
+        "sla_minutes": t.sla_minutes,
+        "status": t.status,
+        "need_approval": t.need_approval,
+        "required_evidence": t.required_evidence,
+        "created_at": t.created_at.isoformat(),
+        "updated_at": t.updated_at.isoformat(),
+    }
+
+
+def _event_dict(e: TimelineEvent) -> dict[str, Any]:
+    return {"event_id": e.id, "time": e.created_at.isoformat(), "type": e.type, "payload": e.payload}
+
+
+def _publish_timeline(area_id: str | None, e: TimelineEvent) -> None:
+    bus.publish(
+        "timeline",
+        incident_id=e.incident_id,
+        area_id=area_id,
+        cursor=pagination.encode_cursor(e.created_at, e.id),
+        **_event_dict(e),
+    )
+
+
+def _parse_cursor(cursor: str | None) -> tuple[datetime, str] | None:
+    if cursor is None:
+        return None
+    try:
+        return pagination.decode_cursor(cursor)
+    except pagination.CursorError as e:
+        raise HTTPException(400, str(e))
+
+
+async def _keyset_page(
+    s: AsyncSession,
+    model: type[Task] | type[TimelineEvent],
+    incident_id: str,
+    limit: int | None,
+    cursor: tuple[datetime, str] | None,
+    descending: bool,
+) -> tuple[list[Any], str | None]:
+    """按 (incident_id, created_at, id) 键集分页；返回 (本页行, 下一页游标)。"""
+    stmt = select(model).where(model.incident_id == incident_id)
+    if cursor is not None:
+        stmt = stmt.where(pagination.after_cursor(model, cursor, descending))
+    stmt = stmt.order_by(*pagination.order_by(model, descending))
+    if limit is None:
+        return list((await s.scalars(stmt)).all()), None
+    rows = list((await s.scalars(stmt.limit(limit + 1))).all())
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, pagination.encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+@app.get("/workflow/incidents/{incident_id}/tasks")
+async def list_tasks(
+    incident_id: str,
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+):
+    """任务列表（新建在前）。传 limit 时分页，下一页游标见响应头 X-Next-Cursor。"""
+    async with db.async_session() as s:
+        tasks, next_cursor = await _keyset_page(s, Task, incident_id, limit, _parse_cursor(cursor), descending=True)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_task_dict(t) for t in tasks]
 
 
 @app.post("/workflow/tasks/{task_id}/ack")
-def ack_task(task_id: str, ack: TaskAck):
-    with db.session() as s:
-        task = s.query(Task).filter(Task.id == task_id).first()
+async def ack_task(task_id: str, ack: TaskAck):
+    now = utcnow()
+    async with db.async_session() as s:
+        # 行锁（Postgres）：并发回执同一任务时按顺序更新状态与指标
+        task = await s.get(Task, task_id, with_for_update=True)
         if not task:
             raise HTTPException(404, "task not found")
+        inc = await s.get(Incident, task.incident_id)
+        old_status = task.status
+        first_ack = task.last_ack is None
         task.status = ack.status
-        task.last_ack = {"actor": ack.actor, "note": ack.note, "evidence": ack.evidence, "time": datetime.now(timezone.utc).isoformat()}
-        task.updated_at = datetime.now(timezone.utc)
-        s.add(
-            TimelineEvent(
-                incident_id=task.incident_id,
-                type="task_ack",
-                payload={"task_id": task.id, "status": task.status, "actor": ack.actor, "evidence": ack.evidence},
-            )
+        task.last_ack = {"actor": ack.actor, "note": ack.note, "evidence": ack.evidence, "time": now.isoformat()}
+        task.updated_at = now
+        event = TimelineEvent(
+            incident_id=task.incident_id,
+            type="task_ack",
+            payload={"task_id": task.id, "status": task.status, "actor": ack.actor, "evidence": ack.evidence},
+            created_at=now,
         )
-        s.commit()
-        return {"ok": True}
-
-
-@app.get("/reports/incidents/{incident_id}")
-def incident_report(incident_id: str):
-    """演示级战报：时间线 + 指标（极简）。"""
-    with db.session() as s:
-        inc = s.query(Incident).filter(Incident.id == incident_id).first()
-        if not inc:
-            raise HTTPException(404, "incident not found")
-        timeline = (
-            s.query(TimelineEvent).filter(TimelineEvent.incident_id == incident_id).order_by(TimelineEvent.created_at.asc()).all()
+        s.add(event)
+        await incident_metrics.on_task_ack(s, task, old_status, now if first_ack else None)
+        await s.commit()
+    await cache.bump([incident_namespace(task.incident_id)])
+    area_id = inc.area_id if inc else None
+    _publish_timeline(area_id, event)
+    if old_status != task.status:
+        bus.publish(
+            "task_status",
+            incident_id=task.incident_id,
+            area_id=area_id,
+            task_id=task.id,
+            old_status=old_status,
+            new_status=task.status,
+            time=now.isoformat(),
         )
-        tasks = s.query(Task).filter(Task.incident_id == incident_id).all()
-    done = sum(1 for t in tasks if t.status == "done")
-    return {
-        "incident_id": incident_id,
-        "title": inc.title,
-        "status": inc.status,
-        "metrics": {
-            "task_total": len(tasks),
-            "task_done": done,
-            "task_done_rate": (done / len(tasks)) if tasks else 0.0,
-        },
-        "timeline": [{"time": e.created_at.isoformat(), "type": e.type, "payload": e.payload} for e in timeline],
-    }
-
-
-# -----------------------------
-# 演示数据初始化
-# -----------------------------
+    return {"ok": True}
 
 
-def seed_demo_data():
-    now = datetime.now(timezone.utc)
-    with db.session() as s:
-        areas = [
-            ("A-001", "示范区"),
-            ("A-002", "江北新区"),
-            ("A-003", "高新区"),
-        ]
+@app.get("/reports/incidents/{incident_id}")
+async def incident_report(
+    incident_id: str,
+    timeline_limit: int = Query(default=REPORT_TIMELINE_LIMIT, ge=1, le=5000),
+    timeline_cursor: str | None = None,
+):
+    """演示级战报：时间线（按时间正序分页，timeline_next_cursor 取下一页）+ 指标（读增量聚合行）。"""
+    cursor = _parse_cursor(timeline_cursor)
+
+    async def load() -> dict[str, Any]:
+        async with db.async_session() as s:
+            inc = await s.get(Incident, incident_id)
+            if not inc:
+                raise HTTPException(404, "incident not found")
+            timeline, next_cursor = await _keyset_page(
+                s, TimelineEvent, incident_id, timeline_limit, cursor, descending=False
+            )
+            metrics = await s.get(IncidentMetrics, incident_id)
+        return {
+            "incident_id": incident_id,
+            "title": inc.title,
+            "status": inc.status,
+            "metrics": incident_metrics.to_report(metrics),
+            "timeline": [_event_dict(e) for e in timeline],
+            "timeline_next_cursor": next_cursor,
+        }
 
-        for area_id, admin_area in areas:
-            # 若该区域已有对象则跳过
-            if s.query(ObjectState).filter(ObjectState.area_id == area_id).count() > 0:
+    # 派单/回执会让该事件的代数 +1，战报缓存随之失效
+    gen = await cache.generation(incident_namespace(incident_id))
+    key = f"report:{incident_id}:{timeline_limit}:{timeline_cursor or ''}:g{gen}"
+    return await cache.get_or_load(key, CACHE_TTL_REPORT_S, load)
+
+
+@app.get("/reports/incidents/{incident_id}/export")
+async def export_incident(incident_id: str, kind: str = Query(default="all", pattern="^(all|timeline|tasks)$")):
+    """
+    全量导出（NDJSON 流）：首行为事件概要，随后逐行输出时间线事件 / 任务，
+    每行带 "kind" 字段。按键集分批读取，内存占用与事件规模无关。
+    """
+    async with db.async_session() as s:
+        inc = await s.get(Incident, incident_id)
+    if not inc:
+        raise HTTPException(404, "incident not found")
+
+    async def rows():
+        yield _ndjson({"kind": "incident", "incident_id": inc.id, "area_id": inc.area_id, "title": inc.title, "status": inc.status})
+        sections = [("timeline", "timeline", TimelineEvent, _event_dict, False), ("tasks", "task", Task, _task_dict, True)]
+        for section, name, model, to_dict, descending in sections:
+            if kind not in ("all", section):
                 continue
-            # 12 个路段对象，前 3 条调高风险（红/橙）；对象 ID 加入区域前缀避免主键冲突
-            for i in range(1, 13):
-                oid = f"{area_id.lower()}-road-{i:03d}"
-                # 已存在同 ID 则跳过
-                if s.get(ObjectState, oid):
-                    continue
-                high_risk = i <= 3
-                features = {
-                    "rain_now_mmph": 60 + i * 3 if high_risk else 30 + i * 1.5,
-                    "rain_1h_mm": 40 + i * 2 if high_risk else 20 + i * 1.2,
-                    "water_level_m": 6.0 - i * 0.15 if high_risk else 2.5 + (i % 5) * 0.3,
-                    "pump_status": "fault" if high_risk and i % 2 == 0 else ("running" if i % 4 != 0 else "fault"),
-                    "traffic_index": 0.6 + (i % 4) * 0.1,
-                    "drainage_capacity": 0.8 if high_risk else 1.0 + (i % 3) * 0.2,
-                    "elevation_m": 2.5 if high_risk else 5.0 - i * 0.2,
-                }
-                s.add(
-                    ObjectState(
-                        object_id=oid,
-                        object_type="road_segment",
-                        area_id=area_id,
-                        attrs={
-                            "name": f"路段{i}",
-                            "admin_area": admin_area,
-                            "elevation_m": features["elevation_m"],
-                            "drainage_capacity": features["drainage_capacity"],
-                        },
-                        features=features,
-                        dq_tags={"freshness": 0.95, "validity": True},
-                        updated_at=now,
-                    )
-                )
-
-            # 默认事件与预警
-            inc = Incident(area_id=area_id, title=f"{admin_area} 暴雨内涝处置事件（演示）", status="open")
-            s.add(inc)
-            s.flush()
-            s.add(
-                TimelineEvent(
-                    id=f"tl-{uuid4().hex}",
-                    incident_id=inc.id,
-                    type="incident_created",
-                    payload={"title": inc.title},
-                )
-            )
-            s.add(
-                AlertEvent(
-                    incident_id=inc.id,
-                    area_id=area_id,
-                    level="红" if area_id == "A-002" else "橙",
-                    reason="雨强上升+低洼路段风险提升",
-                    created_at=now - timedelta(minutes=5),
-                )
-            )
-            s.add(
-                TimelineEvent(
-                    id=f"tl-{uuid4().hex}",
-                    incident_id=inc.id,
-                    type="alert_event",
-                    payload={"level": "红" if area_id == "A-002" else "橙", "reason": "雨强上升"},
-                )
-            )
+            cursor = None
+            while True:
+                async with db.async_session() as s:
+                    page, next_cursor = await _keyset_page(s, model, incident_id, EXPORT_PAGE_SIZE, cursor, descending)
+                for row in page:
+                    yield _ndjson({"kind": name, **to_dict(row)})
+                if next_cursor is None:
+                    break
+                cursor = pagination.decode_cursor(next_cursor)
 
-        s.commit()
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 
+def _ndjson(obj: dict[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
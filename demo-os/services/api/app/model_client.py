@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any
+
+import httpx
+
+from flood_common import metrics
+
+from . import wire
+
+
+# api -> model-service 传输层（演示级）：
+# - 长连接池：进程内共享一个 httpx.AsyncClient，由 app lifespan 启停；
+# - 微批：短窗口（默认 5ms）内的并发 topn 请求（可跨区域）合并为一次 /infer/topn/batch，
+#   按提交顺序拆分结果回各自请求；窗口为 0 时退化为逐个直连 /infer/topn；
+# - 传输格式（MODEL_WIRE_FORMAT）：msgpack 走列式 /infer/topn/packed（模型侧跳过逐条校验，
+#   等级/解释因子以整数编码，见 wire.py）；json 走原 /infer/topn 与 /infer/topn/batch。
+# - 模型侧特征库（MODEL_FEATURE_STORE=true）：风险重算只发 target_ids 与水位线要求（/infer/topn/stored），
+#   模型侧特征库未同步到所需水位时返回 409，调用方回退为发送特征；
+# - 打分后端（MODEL_BACKEND）：http 为上述远程 model-service；local 为进程内打分（见 model_local.py），
+#   两者接口与结果一致。
+
+MODEL_SERVICE_URL = os.getenv("MODEL_SERVICE_URL", "http://model-service:8002").rstrip("/")
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "20"))
+MODEL_TIMEOUT_S = float(os.getenv("MODEL_TIMEOUT_S", "10"))
+MODEL_BATCH_WINDOW_MS = float(os.getenv("MODEL_BATCH_WINDOW_MS", "5"))
+MODEL_BATCH_MAX_REQUESTS = int(os.getenv("MODEL_BATCH_MAX_REQUESTS", "64"))
+# 模型版本探测缓存时间（秒）：版本变化后物化风险索引会整体置 dirty 重算
+MODEL_VERSION_TTL_S = float(os.getenv("MODEL_VERSION_TTL_S", "30"))
+MODEL_WIRE_FORMAT = os.getenv("MODEL_WIRE_FORMAT", "msgpack").strip().lower()
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "http").strip().lower()
+MODEL_FEATURE_STORE = os.getenv("MODEL_FEATURE_STORE", "false").lower() == "true"
+
+
+class ModelServiceError(Exception):
+    pass
+
+
+class StaleFeatures(ModelServiceError):
+    """模型侧特征库落后于请求要求的水位线。"""
+
+
+class _Pending:
+    __slots__ = ("payload", "future", "enqueued_at", "trace_id")
+
+    def __init__(self, payload: dict[str, Any], future: asyncio.Future):
+        self.payload = payload
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.trace_id = metrics.current_trace_id()
+
+
+class ModelClient:
+    def __init__(
+        self,
+        base_url: str = MODEL_SERVICE_URL,
+        pool_size: int = MODEL_POOL_SIZE,
+        timeout_s: float = MODEL_TIMEOUT_S,
+        batch_window_ms: float = MODEL_BATCH_WINDOW_MS,
+        batch_max_requests: int = MODEL_BATCH_MAX_REQUESTS,
+        wire_format: str = MODEL_WIRE_FORMAT,
+        feature_store: bool = MODEL_FEATURE_STORE,
+    ):
+        if wire_format not in ("msgpack", "json"):
+            raise ValueError(f"MODEL_WIRE_FORMAT must be msgpack or json, got {wire_format!r}")
+        self.wire_format = wire_format
+        self.feature_store = feature_store
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout_s = timeout_s
+        self.batch_window_s = max(batch_window_ms, 0.0) / 1000.0
+        self.batch_max_requests = max(batch_max_requests, 1)
+        self._client: httpx.AsyncClient | None = None
+        self._pending: list[_Pending] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self._version: str | None = None
+        self._version_checked_at = 0.0
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "batched_requests": 0,
+            "batch_size_max": 0,
+            "queue_delay_ms_sum": 0.0,
+            "queue_delay_ms_max": 0.0,
+            "errors": 0,
+            "stored_requests": 0,
+            "stored_stale": 0,
+        }
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout_s,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending:
+            self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise ModelServiceError("model client not started")
+        return self._client
+
+    async def _send(
+        self, path: str, trace_ids: list[str | None] | None, statuses: tuple[int, ...] = (200,), **kwargs: Any
+    ) -> httpx.Response:
+        # 微批合并了多个请求时，X-Trace-Id 带上批内全部 trace（逗号分隔）
+        ids = list(dict.fromkeys(t for t in (trace_ids or [metrics.current_trace_id()]) if t))
+        headers = kwargs.pop("headers", {})
+        if ids:
+            headers[metrics.TRACE_HEADER] = ",".join(ids[:32])
+        t0 = time.perf_counter()
+        try:
+            resp = await self.client.post(path, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            raise ModelServiceError(f"model-service unreachable: {e!r}") from e
+        finally:
+            metrics.registry.observe("model_http_ms", (time.perf_counter() - t0) * 1000)
+        if resp.status_code not in statuses:
+            raise ModelServiceError(f"model-service error: {resp.text}")
+        return resp
+
+    async def _post(self, path: str, payload: dict[str, Any], trace_ids: list[str | None] | None = None) -> Any:
+        return (await self._send(path, trace_ids, json=payload)).json()
+
+    async def _post_packed(
+        self, payloads: list[dict[str, Any]], trace_ids: list[str | None] | None = None
+    ) -> list[list[dict[str, Any]]]:
+        headers = {"Content-Type": wire.MSGPACK, "Accept": wire.MSGPACK}
+        resp = await self._send(wire.PACKED_PATH, trace_ids, content=wire.encode_request(payloads), headers=headers)
+        try:
+            return wire.decode_response(resp.content)
+        except Exception as e:
+            raise ModelServiceError(f"model-service returned an undecodable packed response: {e!r}") from e
+
+    async def _score(
+        self, payloads: list[dict[str, Any]], trace_ids: list[str | None] | None = None
+    ) -> list[list[dict[str, Any]]]:
+        """按 wire_format 提交一组 topn 请求体，按顺序返回各自的 items。"""
+        if self.wire_format == "msgpack":
+            return await self._post_packed(payloads, trace_ids)
+        if len(payloads) == 1:
+            return [(await self._post("/infer/topn", payloads[0], trace_ids))["items"]]
+        data = await self._post("/infer/topn/batch", {"requests": payloads}, trace_ids)
+        return [r["items"] for r in data["results"]]
+
+    async def current_version(self) -> str:
+        """model-service 当前模型版本（TTL 缓存；探测失败时沿用上次已知版本）。"""
+        now = time.monotonic()
+        if self._version is not None and now - self._version_checked_at < MODEL_VERSION_TTL_S:
+            return self._version
+        try:
+            resp = await self.client.get("/health")
+            resp.raise_for_status()
+            self._version = resp.json()["model_version"]
+            self._version_checked_at = now
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            if self._version is None:
+                raise ModelServiceError(f"model-service unreachable: {e!r}") from e
+        return self._version
+
+    async def infer_stored(
+        self, target_ids: list[str], n: int | None, min_updated_at: float | None
+    ) -> list[dict[str, Any]]:
+        """
+        按 target_ids 打分，特征取自模型侧特征库；返回与 infer_topn 相同的 items。
+        特征库水位线低于 min_updated_at（同步一轮后仍是）时抛 StaleFeatures。
+        """
+        self._stats["stored_requests"] += 1
+        payload = {"target_ids": target_ids, "n": n, "min_updated_at": min_updated_at}
+        accept = wire.MSGPACK if self.wire_format == "msgpack" else "application/json"
+        t0 = time.perf_counter()
+        try:
+            resp = await self._send(
+                "/infer/topn/stored", None, statuses=(200, 409), json=payload, headers={"Accept": accept}
+            )
+        except ModelServiceError:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            metrics.record("model", (time.perf_counter() - t0) * 1000)
+        if resp.status_code == 409:
+            self._stats["stored_stale"] += 1
+            raise StaleFeatures(resp.text)
+        try:
+            if self.wire_format == "msgpack":
+                return wire.decode_response(resp.content)[0]
+            return wire.expand_results(resp.json())[0]
+        except Exception as e:
+            self._stats["errors"] += 1
+            raise ModelServiceError(f"model-service returned an undecodable stored response: {e!r}") from e
+
+    async def infer_topn(self, payload: dict[str, Any]) -> list[dict[str, Any]]:
+        """提交一个 /infer/topn 请求体，返回 items（已按风险分降序）。"""
+        t0 = time.perf_counter()
+        try:
+            return await self._infer_topn(payload)
+        finally:
+            # 含微批排队时间，计入当前请求的 model 耗时
+            metrics.record("model", (time.perf_counter() - t0) * 1000)
+
+    async def _infer_topn(self, payload: dict[str, Any]) -> list[dict[str, Any]]:
+        self._stats["requests"] += 1
+        if self.batch_window_s <= 0:
+            try:
+                return (await self._score([payload]))[0]
+            except ModelServiceError:
+                self._stats["errors"] += 1
+                raise
+
+        loop = asyncio.get_running_loop()
+        pending = _Pending(payload, loop.create_future())
+        self._pending.append(pending)
+        if len(self._pending) >= self.batch_max_requests:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window_s, self._flush)
+        return await pending.future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send_batch(self, batch: list[_Pending]) -> None:
+        now = time.perf_counter()
+        st = self._stats
+        st["batches"] += 1
+        st["batched_requests"] += len(batch)
+        st["batch_size_max"] = max(st["batch_size_max"], len(batch))
+        metrics.registry.observe("model_batch_size", len(batch), metrics.SIZE_BUCKETS)
+        metrics.registry.observe("model_batch_targets", sum(len(p.payload["targets"]) for p in batch), metrics.SIZE_BUCKETS)
+        for p in batch:
+            delay_ms = (now - p.enqueued_at) * 1000.0
+            st["queue_delay_ms_sum"] += delay_ms
+            st["queue_delay_ms_max"] = max(st["queue_delay_ms_max"], delay_ms)
+
+        try:
+            results = await self._score([p.payload for p in batch], [p.trace_id for p in batch])
+        except Exception as e:
+            st["errors"] += 1
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        for p, items in zip(batch, results):
+            if not p.future.done():
+                p.future.set_result(items)
+
+    def stats(self) -> dict[str, Any]:
+        st = dict(self._stats)
+        batched = st["batched_requests"]
+        st["batch_size_avg"] = (batched / st["batches"]) if st["batches"] else 0.0
+        st["queue_delay_ms_avg"] = (st["queue_delay_ms_sum"] / batched) if batched else 0.0
+        st["pool_size"] = self.pool_size
+        st["backend"] = "http"
+        st["feature_store"] = self.feature_store
+        st["wire_format"] = self.wire_format
+        st["batch_window_ms"] = self.batch_window_s * 1000.0
+        st["pending"] = len(self._pending)
+        return st
+
+
+def _make_client() -> Any:
+    if MODEL_BACKEND == "local":
+        from .model_local import LocalModelClient
+
+        return LocalModelClient()
+    if MODEL_BACKEND != "http":
+        raise ValueError(f"MODEL_BACKEND must be http or local, got {MODEL_BACKEND!r}")
+    return ModelClient()
+
+
+model_client = _make_client()
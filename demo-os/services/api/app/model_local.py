@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import importlib.machinery
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from flood_common import metrics
+
+from .model_client import ModelServiceError
+
+
+# 进程内打分后端（演示级，MODEL_BACKEND=local）：
+# - 小规模/边缘部署中 api 与 model-service 同机，直接导入 model-service 的打分代码（rules.py + engine.py），
+#   省掉 HTTP、序列化与模型侧请求校验；接口与 ModelClient 相同（start/close/current_version/infer_topn/stats）；
+# - 打分在线程池（默认，不阻塞事件循环）或进程池（spawn，多核并行，规则以原文传给子进程并按内容缓存编译）中执行；
+# - 规则文件与热更新同 model-service（MODEL_RULES_PATH / MODEL_RULES_POLL_S），model_version 一致，
+#   同一份规则下结果与经 HTTP 调用逐项相同。
+# 模型代码以别名包 flood_model 导入，避免与 api 自身的 app 包重名。
+
+MODEL_LOCAL_APP_DIR = os.getenv("MODEL_LOCAL_APP_DIR") or str(Path(__file__).resolve().parents[2] / "model" / "app")
+MODEL_LOCAL_EXECUTOR = os.getenv("MODEL_LOCAL_EXECUTOR", "thread").strip().lower()
+MODEL_LOCAL_WORKERS = int(os.getenv("MODEL_LOCAL_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+_ALIAS = "flood_model"
+
+
+def load_model_module(name: str) -> ModuleType:
+    """导入 model-service 的 app.<name>（别名 flood_model.<name>）；进程池子进程内同样经此导入。"""
+    if _ALIAS not in sys.modules:
+        if not os.path.isfile(os.path.join(MODEL_LOCAL_APP_DIR, "engine.py")):
+            raise ModelServiceError(f"model-service code not found in {MODEL_LOCAL_APP_DIR} (MODEL_LOCAL_APP_DIR)")
+        spec = importlib.machinery.ModuleSpec(_ALIAS, None, is_package=True)
+        spec.submodule_search_locations = [MODEL_LOCAL_APP_DIR]
+        sys.modules[_ALIAS] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(f"{_ALIAS}.{name}")
+
+
+def _init_worker() -> None:
+    load_model_module("engine")
+
+
+def _score(payload: dict[str, Any], rules: Any) -> list[dict[str, Any]]:
+    """与 model-service /infer/topn 相同：列式打分 + TopN（n 为空返回全量排序）。"""
+    targets = payload["targets"]
+    return load_model_module("engine").score_topn(
+        [t["target_id"] for t in targets],
+        [t.get("features") or {} for t in targets],
+        payload.get("n"),
+        rules,
+    )
+
+
+class LocalModelClient:
+    # 同进程打分不经网络，没有模型侧特征库（MODEL_FEATURE_STORE 不生效）
+    feature_store = False
+
+    def __init__(self, executor: str = MODEL_LOCAL_EXECUTOR, workers: int = MODEL_LOCAL_WORKERS):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"MODEL_LOCAL_EXECUTOR must be thread or process, got {executor!r}")
+        self.executor = executor
+        self.workers = max(workers, 1)
+        self.rule_store = load_model_module("rules").rule_store
+        self._pool: Executor | None = None
+        self._stats = {"requests": 0, "targets": 0, "errors": 0}
+
+    async def start(self) -> None:
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="model-local")
+            await self.rule_store.start()
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self.rule_store.stop()
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def current_version(self) -> str:
+        return self.rule_store.current().version
+
+    async def infer_topn(self, payload: dict[str, Any]) -> list[dict[str, Any]]:
+        """与 ModelClient.infer_topn 相同的请求体/返回值。"""
+        if self._pool is None:
+            raise ModelServiceError("model client not started")
+        self._stats["requests"] += 1
+        self._stats["targets"] += len(payload["targets"])
+        t0 = time.perf_counter()
+        try:
+            # 请求开始时取一次规则，热更新不影响在途请求（与 model-service 一致）
+            return await asyncio.get_running_loop().run_in_executor(self._pool, _score, payload, self.rule_store.current())
+        except Exception as e:
+            self._stats["errors"] += 1
+            raise ModelServiceError(f"local scoring failed: {e!r}") from e
+        finally:
+            metrics.record("model", (time.perf_counter() - t0) * 1000)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self._stats,
+            "backend": "local",
+            "executor": self.executor,
+            "workers": self.workers,
+            "model_version": self.rule_store.current().version,
+            "rules": self.rule_store.stats(),
+        }
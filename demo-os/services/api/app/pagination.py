@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import and_, or_
+
+
+# 键集分页（演示级）：按 (created_at, id) 排序，游标是上一页最后一行的 (created_at, id)，
+# 配合 (incident_id, created_at, id) 复合索引，翻到第 N 页的代价与第 1 页相同。
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), str(row_id)
+    except Exception as e:
+        raise CursorError(f"invalid cursor: {cursor!r}") from e
+
+
+def after_cursor(model: Any, cursor: tuple[datetime, str], descending: bool = False):
+    """游标之后（升序：更晚；降序：更早）的行过滤条件。"""
+    created_at, row_id = cursor
+    if descending:
+        return or_(model.created_at < created_at, and_(model.created_at == created_at, model.id < row_id))
+    return or_(model.created_at > created_at, and_(model.created_at == created_at, model.id > row_id))
+
+
+def order_by(model: Any, descending: bool = False) -> tuple[Any, Any]:
+    if descending:
+        return model.created_at.desc(), model.id.desc()
+    return model.created_at.asc(), model.id.asc()
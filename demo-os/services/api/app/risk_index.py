@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections.abc import Iterable
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .events import bus
+from .history import HISTORY_DERIVE_ROLLING, epoch, feature_history
+from .model_client import ModelServiceError, StaleFeatures, model_client
+from .storage import db
+from .storage.models import ObjectState, RiskScore
+
+
+# 物化风险索引（演示级）：
+# - risk_score 表保存每个路段最近一次模型打分，按 (area_id, risk_score DESC) 建索引；
+# - 写特征时 mark_dirty 置脏，topn 前只把本区域 dirty 的对象送模型重算；
+# - 模型版本变化时整体置脏一次，之后 topn 就是一次有序、带 limit 的索引读；
+# - HISTORY_DERIVE_ROLLING 开启时，送模型前用特征历史派生的滚动特征（rain_1h_mm 等）覆盖快照里的同名字段；
+# - 模型侧特征库开启（MODEL_FEATURE_STORE）且不派生滚动特征时，只发 target_ids 与本批 updated_at 最大值作为水位线要求，
+#   不再读取/发送 features；特征库落后时回退为读取并发送特征。
+
+logger = logging.getLogger(__name__)
+
+RISK_INDEX_OBJECT_TYPE = "road_segment"
+RISK_REFRESH_CHUNK = int(os.getenv("RISK_REFRESH_CHUNK", "2000"))
+
+_area_locks: dict[str, asyncio.Lock] = {}
+_pending_areas: set[str] = set()
+_refresher: asyncio.Task | None = None
+_known_model_version: str | None = None
+
+
+async def backfill() -> int:
+    """为尚无索引行的路段补齐 dirty 行（启动时调用，幂等）。"""
+    async with db.async_session() as s:
+        missing = (
+            select(ObjectState.object_id, ObjectState.object_type, ObjectState.area_id)
+            .outerjoin(RiskScore, RiskScore.object_id == ObjectState.object_id)
+            .where(ObjectState.object_type == RISK_INDEX_OBJECT_TYPE, RiskScore.object_id.is_(None))
+        )
+        stmt = RiskScore.__table__.insert().from_select(["object_id", "object_type", "area_id"], missing)
+        result = await s.execute(stmt)
+        await s.commit()
+        return result.rowcount or 0
+
+
+async def mark_dirty(s: AsyncSession, object_ids: Iterable[str]) -> None:
+    """特征写入后调用（与写入同一事务）：对应索引行 feature_rev+1 并置 dirty。"""
+    ids = list(object_ids)
+    if not ids:
+        return
+    await s.execute(
+        update(RiskScore)
+        .where(RiskScore.object_id.in_(ids))
+        .values(dirty=True, feature_rev=RiskScore.feature_rev + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def add_rows(s: AsyncSession, rows: Iterable[tuple[str, str, str]]) -> None:
+    """新建对象（object_id, object_type, area_id）时补 dirty 索引行；已存在则忽略。"""
+    params = [
+        {"object_id": oid, "object_type": otype, "area_id": area}
+        for oid, otype, area in rows
+        if otype == RISK_INDEX_OBJECT_TYPE
+    ]
+    if not params:
+        return
+    stmt = db.dialect_insert(db.async_engine.dialect.name, RiskScore).on_conflict_do_nothing(index_elements=["object_id"])
+    await s.execute(stmt, params)
+
+
+async def _invalidate_model_version(version: str) -> None:
+    """模型版本变化：把非当前版本的索引行整体置脏（每个进程每个版本只做一次）。"""
+    global _known_model_version
+    if _known_model_version == version:
+        return
+    async with db.async_session() as s:
+        await s.execute(
+            update(RiskScore)
+            .where((RiskScore.model_version.is_(None)) | (RiskScore.model_version != version))
+            .values(dirty=True)
+            .execution_options(synchronize_session=False)
+        )
+        await s.commit()
+    _known_model_version = version
+
+
+async def refresh_area(area_id: str, model_version: str) -> int:
+    """只重算本区域 dirty 的对象；返回重算条数。同一区域的并发刷新串行化。"""
+    await _invalidate_model_version(model_version)
+    use_store = model_client.feature_store and not (HISTORY_DERIVE_ROLLING and feature_history is not None)
+    lock = _area_locks.setdefault(area_id, asyncio.Lock())
+    columns = (
+        RiskScore.object_id,
+        RiskScore.feature_rev,
+        RiskScore.risk_level,
+        RiskScore.model_version,
+        ObjectState.updated_at if use_store else ObjectState.features,
+    )
+    now = datetime.now(timezone.utc)
+    total = 0
+    last_id: str | None = None
+    async with lock:
+        # 按 object_id 键集分页读取 dirty 行：每页 RISK_REFRESH_CHUNK 条，大区域不会一次把全部特征读进内存
+        while True:
+            stmt = (
+                select(*columns)
+                .join(ObjectState, ObjectState.object_id == RiskScore.object_id)
+                .where(RiskScore.area_id == area_id, RiskScore.dirty.is_(True))
+                .order_by(RiskScore.object_id)
+                .limit(RISK_REFRESH_CHUNK)
+            )
+            if last_id is not None:
+                stmt = stmt.where(RiskScore.object_id > last_id)
+            async with db.async_session() as s:
+                chunk = (await s.execute(stmt)).all()
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            total += len(chunk)
+            revs = {oid: rev for oid, rev, _, _, _ in chunk}
+            # 已打过分的对象记录旧等级，用于推送风险等级变化
+            old_levels = {oid: level for oid, _, level, version, _ in chunk if version is not None}
+            items = await _score_chunk(area_id, chunk, now, use_store)
+            await _write_scores(items, revs, now)
+            for it in items:
+                old = old_levels.get(it["target_id"])
+                if old is not None and old != it["risk_level"]:
+                    bus.publish(
+                        "risk_level",
+                        area_id=area_id,
+                        target_id=it["target_id"],
+                        old_level=old,
+                        new_level=it["risk_level"],
+                        risk_score=it["risk_score"],
+                        time=now.isoformat(),
+                    )
+            if len(chunk) < RISK_REFRESH_CHUNK:
+                break
+    return total
+
+
+async def _score_chunk(area_id: str, chunk: list[Any], now: datetime, use_store: bool) -> list[dict[str, Any]]:
+    """一批 dirty 行送模型打分（全量排序）；chunk 行的最后一列为 updated_at（use_store）或 features。"""
+    ids = [row[0] for row in chunk]
+    if use_store:
+        try:
+            return await model_client.infer_stored(ids, None, max(epoch(row[4]) for row in chunk))
+        except StaleFeatures as e:
+            logger.warning("model feature store behind for %s, sending features instead: %s", area_id, e)
+        stmt = select(ObjectState.object_id, ObjectState.features).where(ObjectState.object_id.in_(ids))
+        async with db.async_session() as s:
+            features = dict((await s.execute(stmt)).all())
+    else:
+        features = {row[0]: row[4] for row in chunk}
+    targets = [{"target_id": oid, "features": features.get(oid) or {}} for oid in ids]
+    if HISTORY_DERIVE_ROLLING and feature_history is not None:
+        # 窗口扫描是纯 Python CPU 计算，放到线程里执行，避免阻塞事件循环
+        rolling = await asyncio.to_thread(feature_history.rolling, ids, now)
+        for t in targets:
+            if rolling[t["target_id"]]:
+                t["features"] = {**t["features"], **rolling[t["target_id"]]}
+    return await model_client.infer_topn({"time": now.isoformat(), "area_id": area_id, "targets": targets, "n": None})
+
+
+def schedule_refresh(area_ids: Iterable[str]) -> None:
+    """特征写入后在后台增量重算受影响区域（合并重复区域），使等级变化无需轮询即可推送。"""
+    global _refresher
+    _pending_areas.update(area_ids)
+    if _pending_areas and (_refresher is None or _refresher.done()):
+        _refresher = asyncio.get_running_loop().create_task(_drain_refresh())
+
+
+async def _drain_refresh() -> None:
+    while _pending_areas:
+        area_id = _pending_areas.pop()
+        try:
+            await refresh_area(area_id, await model_client.current_version())
+        except ModelServiceError as e:
+            # 模型暂不可用：保持 dirty，下一次 topn 或写入时再重算
+            logger.warning("background risk refresh for %s failed: %s", area_id, e)
+        except Exception:  # noqa: BLE001 - 单个区域失败（如数据库错误）不影响其余待刷新区域
+            logger.exception("background risk refresh for %s failed", area_id)
+
+
+async def _write_scores(items: list[dict[str, Any]], revs: dict[str, int], scored_at: datetime) -> None:
+    t = RiskScore.__table__
+    stmt = (
+        t.update()
+        .where(t.c.object_id == bindparam("b_object_id"), t.c.feature_rev == bindparam("b_feature_rev"))
+        .values(
+            risk_score=bindparam("b_risk_score"),
+            risk_level=bindparam("b_risk_level"),
+            confidence=bindparam("b_confidence"),
+            explain_factors=bindparam("b_explain_factors"),
+            model_version=bindparam("b_model_version"),
+            dirty=False,
+            scored_at=scored_at,
+        )
+    )
+    params = [
+        {
+            "b_object_id": it["target_id"],
+            "b_feature_rev": revs[it["target_id"]],
+            "b_risk_score": it["risk_score"],
+            "b_risk_level": it["risk_level"],
+            "b_confidence": it["confidence"],
+            "b_explain_factors": it["explain_factors"],
+            "b_model_version": it["model_version"],
+        }
+        for it in items
+    ]
+    async with db.async_session() as s:
+        await s.execute(stmt, params)
+        await s.commit()
+
+
+async def list_areas() -> list[str]:
+    """有风险索引行的全部区域（全市 topn 用）。"""
+    async with db.async_session() as s:
+        return list(await s.scalars(select(RiskScore.area_id).distinct().order_by(RiskScore.area_id)))
+
+
+async def read_topn(area_id: str, n: int) -> list[RiskScore]:
+    async with db.async_session() as s:
+        return list(
+            await s.scalars(
+                select(RiskScore)
+                .where(RiskScore.area_id == area_id, RiskScore.object_type == RISK_INDEX_OBJECT_TYPE)
+                .order_by(RiskScore.risk_score.desc(), RiskScore.object_id.asc())
+                .limit(n)
+            )
+        )
@@ -0,0 +1,550 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import JSON, Connection, Table, insert, select
+
+from .storage import db
+from .storage.models import (
+    AlertEvent,
+    Incident,
+    IncidentMetrics,
+    ObjectState,
+    RiskScore,
+    Task,
+    TimelineEvent,
+    encode_ulid,
+    utcnow,
+)
+
+
+# 合成城市数据生成（演示级，容量测试用）：
+# - 数据按「区域 × 类型 × 分块」切成互相独立的生成单元：路段块、事件块（含任务/时间线/预警/指标）；
+# - 每个单元用 Random(f"{seed}:{area}:{kind}:{chunk}") 独立取随机数，主键（路段编号、按生成时间编码的 ULID）
+#   全部由种子推出：同样的参数重跑得到相同的数据（对象的 updated_at 除外：它记录实际写入时间，
+#   供空间索引/特征同步按水位线增量读取）；
+# - 每个单元一个事务：Postgres 用 COPY，其他方言用多行 INSERT；内存只与分块大小有关；
+# - 续跑：单元提交前先查它的最后一个主键是否已存在，存在就跳过——中断后用同样的参数重跑即可接着写；
+# - 路段/泵站带坐标（attrs.lon / attrs.lat）：区域中心按固定网格排布在城市中心周围，对象围绕区域中心正态分布；
+# - 路段同时写入 dirty 的 risk_score 行，事件同时写入与任务/回执一致的 incident_metrics（rebuild-metrics --check 可核对）。
+
+SEED_CHUNK_SIZE = int(os.getenv("SEED_CHUNK_SIZE", "5000"))
+# 合成数据的时间锚点：事件时间分布在锚点之前 history_days 天内（固定锚点才能保证可复现）
+DEFAULT_ANCHOR = datetime(2024, 7, 1, tzinfo=timezone.utc)
+
+ROAD_SEGMENT = "road_segment"
+PUMP_STATION = "pump_station"
+# 城市中心与区域网格：区域 i 的中心在第 (i // 32) 行、第 (i % 32) 列，间距 AREA_SPACING_DEG
+CITY_CENTER = (118.78, 32.04)
+AREA_SPACING_DEG = 0.05
+AREA_GRID_COLUMNS = 32
+# 对象相对区域中心的标准差（度），约 1.3 km
+AREA_SPREAD_DEG = 0.012
+AREA_NAMES = {"A-001": "示范区", "A-002": "江北新区", "A-003": "高新区"}
+TASK_TEMPLATES = (
+    # (task_type, owner_org, sla_minutes, title, required_evidence)
+    ("现场巡查", "区排水", 30, "巡查积水与排水口", ["定位", "照片"]),
+    ("封控准备", "交警", 20, "封控/绕行准备", ["定位", "照片"]),
+    ("泵站抢修", "泵站运维", 60, "泵站故障抢修", ["照片", "维修单"]),
+    ("排涝调度", "城管", 45, "移动泵车调度排涝", ["定位", "照片", "视频"]),
+)
+
+
+@dataclass
+class SeedConfig:
+    areas: int = 3
+    segments_per_area: int = 12
+    pumps_per_area: int = 0
+    incidents_per_area: int = 1
+    tasks_per_incident: int = 0
+    # 已回执任务占比；回执中 done / in_progress 各占一部分
+    ack_ratio: float = 0.6
+    # 低洼易涝路段占比：标高低、排水弱、泵站故障率高
+    hotspot_ratio: float = 0.25
+    history_days: float = 30.0
+    seed: int = 20240701
+    anchor: datetime = DEFAULT_ANCHOR
+    chunk_size: int = SEED_CHUNK_SIZE
+
+
+@dataclass
+class SeedResult:
+    units: int = 0
+    skipped: int = 0
+    rows: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def add(self, table: str, count: int) -> None:
+        self.rows[table] = self.rows.get(table, 0) + count
+
+
+def area_id(index: int) -> str:
+    return f"A-{index + 1:03d}"
+
+
+def area_name(aid: str) -> str:
+    return AREA_NAMES.get(aid, f"合成区{aid[2:]}")
+
+
+def area_center(index: int) -> tuple[float, float]:
+    # 中心位置只取决于区域序号（与区域总数无关），增加区域数续跑时已有区域不变
+    return (
+        CITY_CENTER[0] + (index % AREA_GRID_COLUMNS - 1) * AREA_SPACING_DEG,
+        CITY_CENTER[1] + (index // AREA_GRID_COLUMNS) * AREA_SPACING_DEG,
+    )
+
+
+def segment_id(aid: str, index: int, total: int) -> str:
+    width = max(3, len(str(total)))
+    return f"{aid.lower()}-road-{index + 1:0{width}d}"
+
+
+def pump_id(aid: str, index: int, total: int) -> str:
+    width = max(3, len(str(total)))
+    return f"{aid.lower()}-pump-{index + 1:0{width}d}"
+
+
+def _rng(cfg: SeedConfig, *parts: Any) -> random.Random:
+    # 字符串种子经 sha512 派生，跨进程/跨平台稳定（不受 PYTHONHASHSEED 影响）
+    return random.Random(":".join(str(p) for p in (cfg.seed, *parts)))
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return min(max(value, low), high)
+
+
+def _ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def _ulid_id(prefix: str, rng: random.Random, at: datetime) -> str:
+    return f"{prefix}-{encode_ulid(_ms(at), rng.getrandbits(80))}"
+
+
+class _Area:
+    """区域级参数：本轮降雨强度与基础水位，同区域路段共享。"""
+
+    __slots__ = ("id", "name", "rain", "storm", "lon", "lat")
+
+    def __init__(self, cfg: SeedConfig, index: int):
+        self.id = area_id(index)
+        self.name = area_name(self.id)
+        self.lon, self.lat = area_center(index)
+        rng = _rng(cfg, self.id)
+        self.rain = rng.gammavariate(4.0, 10.0)  # 均值约 40 mm/h，长尾
+        self.storm = self.rain > 45
+
+
+# -----------------------------
+# 行生成
+# -----------------------------
+
+
+def _location(rng: random.Random, area: _Area) -> tuple[float, float]:
+    return round(rng.gauss(area.lon, AREA_SPREAD_DEG), 6), round(rng.gauss(area.lat, AREA_SPREAD_DEG), 6)
+
+
+def segment_features(rng: random.Random, area: _Area, hotspot: bool) -> dict[str, Any]:
+    elevation = _clamp(rng.gauss(2.8 if hotspot else 5.5, 0.8), 0.5, 12.0)
+    drainage = _clamp(rng.lognormvariate(math.log(0.8 if hotspot else 1.1), 0.2), 0.3, 2.0)
+    rain_now = area.rain * rng.lognormvariate(0.0, 0.25) * (1.3 if hotspot else 1.0)
+    rain_1h = rain_now * rng.uniform(0.5, 0.9)
+    water_level = 1.5 + rain_1h / (drainage * 12.0) + max(0.0, 5.0 - elevation) * 0.4 + rng.gauss(0.0, 0.3)
+    fault_p = 0.3 if hotspot else 0.05
+    pump = "fault" if rng.random() < fault_p else ("offline" if rng.random() < 0.02 else "running")
+    return {
+        "rain_now_mmph": round(rain_now, 1),
+        "rain_1h_mm": round(rain_1h, 1),
+        "water_level_m": round(_clamp(water_level, 0.2, 8.0), 2),
+        "pump_status": pump,
+        "traffic_index": round(_clamp(rng.betavariate(2.0, 3.0) + (0.2 if hotspot else 0.0), 0.0, 1.0), 2),
+        "drainage_capacity": round(drainage, 2),
+        "elevation_m": round(elevation, 2),
+    }
+
+
+def segment_rows(cfg: SeedConfig, area: _Area, start: int, stop: int, rng: random.Random) -> dict[Table, list[dict]]:
+    updated_at = utcnow()
+    objects, risks = [], []
+    for i in range(start, stop):
+        oid = segment_id(area.id, i, cfg.segments_per_area)
+        features = segment_features(rng, area, rng.random() < cfg.hotspot_ratio)
+        lon, lat = _location(rng, area)
+        objects.append(
+            {
+                "object_id": oid,
+                "object_type": ROAD_SEGMENT,
+                "area_id": area.id,
+                "attrs": {
+                    "name": f"路段{i + 1}",
+                    "admin_area": area.name,
+                    "lon": lon,
+                    "lat": lat,
+                    "elevation_m": features["elevation_m"],
+                    "drainage_capacity": features["drainage_capacity"],
+                },
+                "features": features,
+                "dq_tags": {"freshness": round(rng.uniform(0.85, 1.0), 2), "validity": True},
+                "updated_at": updated_at,
+            }
+        )
+        risks.append(
+            {
+                "object_id": oid,
+                "object_type": ROAD_SEGMENT,
+                "area_id": area.id,
+                "risk_score": 0.0,
+                "risk_level": "蓝",
+                "confidence": 0.0,
+                "explain_factors": [],
+                "model_version": None,
+                "feature_rev": 0,
+                "dirty": True,
+                "scored_at": None,
+            }
+        )
+    return {ObjectState.__table__: objects, RiskScore.__table__: risks}
+
+
+def pump_rows(cfg: SeedConfig, area: _Area, start: int, stop: int, rng: random.Random) -> dict[Table, list[dict]]:
+    updated_at = utcnow()
+    objects = []
+    for i in range(start, stop):
+        lon, lat = _location(rng, area)
+        features = {
+            "pump_status": "fault" if rng.random() < 0.08 else ("offline" if rng.random() < 0.02 else "running"),
+            "capacity_m3h": float(rng.choice((500, 800, 1200, 2000, 3000))),
+            "sump_level_m": round(_clamp(rng.gauss(1.2 + area.rain / 40.0, 0.4), 0.1, 5.0), 2),
+        }
+        objects.append(
+            {
+                "object_id": pump_id(area.id, i, cfg.pumps_per_area),
+                "object_type": PUMP_STATION,
+                "area_id": area.id,
+                "attrs": {"name": f"泵站{i + 1}", "admin_area": area.name, "lon": lon, "lat": lat},
+                "features": features,
+                "dq_tags": {"freshness": round(rng.uniform(0.85, 1.0), 2), "validity": True},
+                "updated_at": updated_at,
+            }
+        )
+    return {ObjectState.__table__: objects}
+
+
+def incident_rows(cfg: SeedConfig, area: _Area, start: int, stop: int, rng: random.Random) -> dict[Table, list[dict]]:
+    incidents, alerts, tasks, events, metrics = [], [], [], [], []
+    for k in range(start, stop):
+        created = cfg.anchor - timedelta(seconds=rng.uniform(0, cfg.history_days * 86400))
+        inc_id = _ulid_id("inc", rng, created)
+        suffix = "演示" if k == 0 else f"演示 #{k + 1}"
+        title = f"{area.name} 暴雨内涝处置事件（{suffix}）"
+        level = "红" if area.storm and rng.random() < 0.6 else "橙"
+        alert_at = created + timedelta(seconds=rng.uniform(30, 600))
+        last_at = alert_at
+
+        events.append(
+            {
+                "id": _ulid_id("tl", rng, created),
+                "incident_id": inc_id,
+                "type": "incident_created",
+                "payload": {"title": title},
+                "created_at": created,
+            }
+        )
+        alerts.append(
+            {
+                "id": _ulid_id("al", rng, alert_at),
+                "incident_id": inc_id,
+                "area_id": area.id,
+                "level": level,
+                "reason": "雨强上升+低洼路段风险提升",
+                "created_at": alert_at,
+            }
+        )
+        events.append(
+            {
+                "id": _ulid_id("tl", rng, alert_at),
+                "incident_id": inc_id,
+                "type": "alert_event",
+                "payload": {"level": level, "reason": "雨强上升"},
+                "created_at": alert_at,
+            }
+        )
+
+        m = {
+            "incident_id": inc_id,
+            "task_total": 0,
+            "task_pending": 0,
+            "task_done": 0,
+            "task_other": 0,
+            "task_acked": 0,
+            "ack_seconds_sum": 0.0,
+            "sla_breached": 0,
+        }
+        for _ in range(cfg.tasks_per_incident):
+            task_type, owner, sla, task_title, evidence = rng.choice(TASK_TEMPLATES)
+            target = segment_id(area.id, rng.randrange(max(cfg.segments_per_area, 1)), cfg.segments_per_area)
+            task_at = alert_at + timedelta(seconds=rng.uniform(10, 1800))
+            task_id = _ulid_id("task", rng, task_at)
+            status, last_ack, updated = "pending", None, task_at
+            m["task_total"] += 1
+            events.append(
+                {
+                    "id": _ulid_id("tl", rng, task_at),
+                    "incident_id": inc_id,
+                    "type": "task_created",
+                    "payload": {"task_id": task_id, "task_type": task_type, "target": target},
+                    "created_at": task_at,
+                }
+            )
+            if rng.random() < cfg.ack_ratio:
+                # 回执耗时：指数分布，均值约 0.7 个 SLA，少部分超时
+                elapsed = rng.expovariate(1.0 / (sla * 60 * 0.7))
+                ack_at = task_at + timedelta(seconds=elapsed)
+                status = "done" if rng.random() < 0.75 else "in_progress"
+                actor = f"{owner}-{rng.randrange(1, 200):03d}"
+                last_ack = {"actor": actor, "note": "", "evidence": evidence, "time": ack_at.isoformat()}
+                updated = ack_at
+                events.append(
+                    {
+                        "id": _ulid_id("tl", rng, ack_at),
+                        "incident_id": inc_id,
+                        "type": "task_ack",
+                        "payload": {"task_id": task_id, "status": status, "actor": actor, "evidence": evidence},
+                        "created_at": ack_at,
+                    }
+                )
+                # 与 incident_metrics.compute 同口径：首次回执时间 - 任务创建时间
+                m["task_acked"] += 1
+                m["ack_seconds_sum"] += (ack_at - task_at).total_seconds()
+                if (ack_at - task_at).total_seconds() > sla * 60:
+                    m["sla_breached"] += 1
+            m["task_done" if status == "done" else ("task_pending" if status == "pending" else "task_other")] += 1
+            last_at = max(last_at, updated)
+            tasks.append(
+                {
+                    "id": task_id,
+                    "incident_id": inc_id,
+                    "task_type": task_type,
+                    "target_object_id": target,
+                    "owner_org": owner,
+                    "assignee": None,
+                    "sla_minutes": sla,
+                    "required_evidence": evidence,
+                    "need_approval": level == "红" and task_type == "封控准备",
+                    "status": status,
+                    "title": task_title,
+                    "detail": f"对 {target} {task_title}，回传证据。",
+                    "last_ack": last_ack,
+                    "created_at": task_at,
+                    "updated_at": updated,
+                }
+            )
+
+        incidents.append(
+            {
+                "id": inc_id,
+                "area_id": area.id,
+                "title": title,
+                "status": "open" if k == 0 or rng.random() < 0.3 else "closed",
+                "created_at": created,
+                "updated_at": last_at,
+            }
+        )
+        metrics.append({**m, "updated_at": last_at})
+    return {
+        AlertEvent.__table__: alerts,
+        Task.__table__: tasks,
+        TimelineEvent.__table__: events,
+        IncidentMetrics.__table__: metrics,
+        Incident.__table__: incidents,
+    }
+
+
+# -----------------------------
+# 单元划分与写入
+# -----------------------------
+
+
+@dataclass
+class _Unit:
+    area: _Area
+    kind: str
+    chunk: int
+    start: int
+    stop: int
+    build: Callable[[SeedConfig, _Area, int, int, random.Random], dict[Table, list[dict]]]
+    # 判断是否已提交的表与主键列（取本单元最后一行）
+    marker_table: Table
+    marker_column: str
+    # 无需生成行即可确定的最后一个主键（路段/泵站）；事件主键依赖随机序列，只能生成后再取
+    last_key: str | None = None
+
+
+def plan(cfg: SeedConfig) -> Iterator[_Unit]:
+    # 每个事件约 4 行 + 每个任务 2~3 行；按行数折算事件块大小，让各单元事务大小相近
+    inc_chunk = max(1, cfg.chunk_size // (4 + 3 * cfg.tasks_per_incident))
+    seg_chunk = max(1, cfg.chunk_size // 2)
+    for index in range(cfg.areas):
+        area = _Area(cfg, index)
+        for chunk, start in enumerate(range(0, cfg.segments_per_area, seg_chunk)):
+            stop = min(start + seg_chunk, cfg.segments_per_area)
+            last = segment_id(area.id, stop - 1, cfg.segments_per_area)
+            yield _Unit(area, "segments", chunk, start, stop, segment_rows, ObjectState.__table__, "object_id", last)
+        for chunk, start in enumerate(range(0, cfg.pumps_per_area, cfg.chunk_size)):
+            stop = min(start + cfg.chunk_size, cfg.pumps_per_area)
+            last = pump_id(area.id, stop - 1, cfg.pumps_per_area)
+            yield _Unit(area, "pumps", chunk, start, stop, pump_rows, ObjectState.__table__, "object_id", last)
+        for chunk, start in enumerate(range(0, cfg.incidents_per_area, inc_chunk)):
+            stop = min(start + inc_chunk, cfg.incidents_per_area)
+            yield _Unit(area, "incidents", chunk, start, stop, incident_rows, Incident.__table__, "id")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+def _copy(conn: Connection, table: Table, rows: list[dict]) -> None:
+    """Postgres COPY FROM STDIN（psycopg 3）；JSON 列先序列化成文本。"""
+    columns = [c for c in table.columns if c.name in rows[0]]
+    json_cols = {c.name for c in columns if isinstance(c.type, JSON)}
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        with cursor.copy(f"COPY {table.name} ({', '.join(c.name for c in columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(
+                    [
+                        json.dumps(row[c.name], ensure_ascii=False, default=_json_default)
+                        if c.name in json_cols and row[c.name] is not None
+                        else row[c.name]
+                        for c in columns
+                    ]
+                )
+    finally:
+        cursor.close()
+
+
+def _write(conn: Connection, table: Table, rows: list[dict]) -> None:
+    if not rows:
+        return
+    if conn.dialect.name == "postgresql":
+        _copy(conn, table, rows)
+    else:
+        conn.execute(insert(table), rows)
+
+
+def _committed(conn: Connection, unit: _Unit, last_key: str) -> bool:
+    column = unit.marker_table.c[unit.marker_column]
+    return conn.execute(select(column).where(column == last_key)).first() is not None
+
+
+def run(cfg: SeedConfig, progress: Callable[[str], None] | None = None) -> SeedResult:
+    result = SeedResult()
+    t0 = time.perf_counter()
+    last_report = t0
+    for unit in plan(cfg):
+        if unit.last_key is not None:
+            with db.engine.connect() as conn:
+                if _committed(conn, unit, unit.last_key):
+                    result.skipped += 1
+                    continue
+        rng = _rng(cfg, unit.area.id, unit.kind, unit.chunk)
+        tables = unit.build(cfg, unit.area, unit.start, unit.stop, rng)
+        last_key = tables[unit.marker_table][-1][unit.marker_column]
+        with db.engine.begin() as conn:
+            if _committed(conn, unit, last_key):
+                result.skipped += 1
+                continue
+            for table, rows in tables.items():
+                _write(conn, table, rows)
+                result.add(table.name, len(rows))
+        result.units += 1
+        now = time.perf_counter()
+        if progress and now - last_report >= 2.0:
+            last_report = now
+            total = sum(result.rows.values())
+            progress(
+                f"{unit.area.id} {unit.kind} [{unit.start}, {unit.stop})  rows={total:,}  "
+                f"{total / (now - t0):,.0f} rows/s  skipped_units={result.skipped}"
+            )
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+# -----------------------------
+# 开箱演示数据（AUTO_SEED）
+# -----------------------------
+
+
+def seed_demo_data() -> None:
+    """AUTO_SEED：固定的演示对象与默认事件（每区 12 个路段，前 3 条为红/橙高风险，A-002 为红色预警）。
+
+    界面演示与示例（a-001-road-001、红/橙 TopN）依赖这份固定数据，不用随机生成器；已有对象的区域跳过。
+    risk_score / incident_metrics 行由启动时的 backfill 补齐。
+    """
+    now = datetime.now(timezone.utc)
+    with db.session() as s:
+        for index, (aid, admin_area) in enumerate(AREA_NAMES.items()):
+            if s.query(ObjectState).filter(ObjectState.area_id == aid).count() > 0:
+                continue
+            lon, lat = area_center(index)
+            for i in range(1, 13):
+                oid = f"{aid.lower()}-road-{i:03d}"
+                if s.get(ObjectState, oid):
+                    continue
+                high_risk = i <= 3
+                features = {
+                    "rain_now_mmph": 60 + i * 3 if high_risk else 30 + i * 1.5,
+                    "rain_1h_mm": 40 + i * 2 if high_risk else 20 + i * 1.2,
+                    "water_level_m": 6.0 - i * 0.15 if high_risk else 2.5 + (i % 5) * 0.3,
+                    "pump_status": "fault" if high_risk and i % 2 == 0 else ("running" if i % 4 != 0 else "fault"),
+                    "traffic_index": 0.6 + (i % 4) * 0.1,
+                    "drainage_capacity": 0.8 if high_risk else 1.0 + (i % 3) * 0.2,
+                    "elevation_m": 2.5 if high_risk else 5.0 - i * 0.2,
+                }
+                s.add(
+                    ObjectState(
+                        object_id=oid,
+                        object_type=ROAD_SEGMENT,
+                        area_id=aid,
+                        attrs={
+                            "name": f"路段{i}",
+                            "admin_area": admin_area,
+                            "elevation_m": features["elevation_m"],
+                            "drainage_capacity": features["drainage_capacity"],
+                            # 区域中心周围 4 × 3 的小网格（约 400 m 间距）
+                            "lon": round(lon + ((i - 1) % 4 - 1.5) * 0.004, 6),
+                            "lat": round(lat + ((i - 1) // 4 - 1) * 0.004, 6),
+                        },
+                        features=features,
+                        dq_tags={"freshness": 0.95, "validity": True},
+                        updated_at=now,
+                    )
+                )
+
+            level = "红" if aid == "A-002" else "橙"
+            inc = Incident(area_id=aid, title=f"{admin_area} 暴雨内涝处置事件（演示）", status="open")
+            s.add(inc)
+            s.flush()
+            s.add(TimelineEvent(incident_id=inc.id, type="incident_created", payload={"title": inc.title}))
+            s.add(
+                AlertEvent(
+                    incident_id=inc.id,
+                    area_id=aid,
+                    level=level,
+                    reason="雨强上升+低洼路段风险提升",
+                    created_at=now - timedelta(minutes=5),
+                )
+            )
+            s.add(TimelineEvent(incident_id=inc.id, type="alert_event", payload={"level": level, "reason": "雨强上升"}))
+
+        s.commit()
@@ -1,17 +1,77 @@
 from __future__ import annotations
 
 import os
-from contextlib import contextmanager
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from flood_common import metrics
 
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./demo.db")
+# 异步连接池大小：接口并发受连接池约束，而不是 Starlette 线程池
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+
+def _async_url(url: str) -> str:
+    """同步 URL -> 异步驱动 URL：Postgres 用 psycopg(async)，SQLite 用 aiosqlite。"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:") :]
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+psycopg://" + url.split("://", 1)[1]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+def _timed_pool(base: type) -> type:
+    """连接池子类：记录取连接（checkout）的等待耗时，池耗尽时排队时间会体现在这里。"""
+
+    class TimedPool(base):
+        def _do_get(self):
+            t0 = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                metrics.record("db_pool_checkout", (time.perf_counter() - t0) * 1000)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def _instrument(sync_engine: Engine) -> None:
+    """SQL 次数/耗时：计入当前请求与全局直方图 db_ms。"""
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started_at = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        metrics.record("db", (time.perf_counter() - context._query_started_at) * 1000)
+
+
+_sync_pool_kwargs = {} if DATABASE_URL.startswith("sqlite") else {"poolclass": _timed_pool(QueuePool)}
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True, **_sync_pool_kwargs)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+_async_pool_kwargs = (
+    {}
+    if ASYNC_DATABASE_URL.startswith("sqlite")
+    else {"poolclass": _timed_pool(AsyncAdaptedQueuePool), "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, **_async_pool_kwargs)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+_instrument(engine)
+_instrument(async_engine.sync_engine)
+
 
 @contextmanager
 def session():
@@ -22,3 +82,21 @@ def session():
         db.close()
 
 
+@asynccontextmanager
+async def async_session() -> AsyncIterator[AsyncSession]:
+    db: AsyncSession = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def dialect_insert(dialect: str, table):
+    """支持 ON CONFLICT 的方言 insert（Postgres / SQLite），用于批量 upsert。"""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"upsert not supported on dialect {dialect!r}")
+    return insert(table)
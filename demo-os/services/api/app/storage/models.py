@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import os
+import threading
+import time
 from datetime import datetime, timezone
 from typing import Any
 
-from sqlalchemy import JSON, Boolean, Column, DateTime, Integer, String, Text
+from sqlalchemy import JSON, Boolean, Column, DateTime, Float, Index, Integer, String, Text
 from sqlalchemy.orm import DeclarativeBase
 
 from .db import engine
@@ -13,6 +16,41 @@ def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+# 客户端生成的 ULID 风格主键：48 位毫秒时间戳 + 80 位随机数，Crockford Base32 编码共 26 位，
+# 字典序即时间序；同一毫秒内随机部分单调 +1，保证同进程内不冲突且有序。
+_CROCKFORD32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_ulid_last_ms = 0
+_ulid_last_rand = 0
+
+
+def _ulid() -> str:
+    global _ulid_last_ms, _ulid_last_rand
+    with _ulid_lock:
+        ms = time.time_ns() // 1_000_000
+        if ms <= _ulid_last_ms:
+            ms = _ulid_last_ms
+            rand = (_ulid_last_rand + 1) & ((1 << 80) - 1)
+            if rand == 0:
+                # 同一毫秒内随机部分耗尽（几乎不可能）：借用下一毫秒
+                ms += 1
+        else:
+            rand = int.from_bytes(os.urandom(10), "big")
+        _ulid_last_ms, _ulid_last_rand = ms, rand
+    return encode_ulid(ms, rand)
+
+
+def encode_ulid(ms: int, rand: int) -> str:
+    """给定毫秒时间戳与 80 位随机部分编码 ULID（合成数据用它生成可复现的主键）。"""
+    value = (ms << 80) | (rand & ((1 << 80) - 1))
+    return "".join(_CROCKFORD32[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def new_id(prefix: str) -> str:
+    """带业务前缀的 ULID，例如 task-01J9ZK3Q2W6Y8N4T0B5R7C1D3E。"""
+    return f"{prefix}-{_ulid()}"
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -28,6 +66,32 @@ class ObjectState(Base):
     updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
 
 
+# 按 updated_at 水位线增量同步（/objects/changes、空间索引）用的键集索引
+ix_object_state_updated = Index("ix_object_state_updated", ObjectState.updated_at, ObjectState.object_id)
+
+
+class RiskScore(Base):
+    """物化风险索引：每个路段最近一次模型打分结果（特征变化时置 dirty，按需增量重算）。"""
+
+    __tablename__ = "risk_score"
+    object_id = Column(String, primary_key=True)
+    object_type = Column(String, nullable=False)
+    area_id = Column(String, nullable=False)
+    risk_score = Column(Float, nullable=False, default=0.0)
+    risk_level = Column(String, nullable=False, default="蓝")
+    confidence = Column(Float, nullable=False, default=0.0)
+    explain_factors = Column(JSON, nullable=False, default=list)
+    model_version = Column(String, nullable=True)
+    # 写特征时 feature_rev+1 并置 dirty；重算回写时校验 feature_rev，避免覆盖并发写入
+    feature_rev = Column(Integer, nullable=False, default=0)
+    dirty = Column(Boolean, nullable=False, default=True)
+    scored_at = Column(DateTime(timezone=True), nullable=True)
+
+
+Index("ix_risk_score_area_score", RiskScore.area_id, RiskScore.risk_score.desc())
+Index("ix_risk_score_area_dirty", RiskScore.area_id, RiskScore.dirty)
+
+
 class Incident(Base):
     __tablename__ = "incident"
     id = Column(String, primary_key=True)
@@ -38,9 +102,8 @@ class Incident(Base):
     updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
 
     def __init__(self, **kwargs: Any):
-        # 简化：使用时间戳作为 id（演示级）
         if "id" not in kwargs:
-            kwargs["id"] = f"inc-{int(datetime.now().timestamp()*1000)}"
+            kwargs["id"] = new_id("inc")
         super().__init__(**kwargs)
 
 
@@ -64,10 +127,14 @@ class Task(Base):
 
     def __init__(self, **kwargs: Any):
         if "id" not in kwargs:
-            kwargs["id"] = f"task-{int(datetime.now().timestamp()*1000)}"
+            kwargs["id"] = new_id("task")
         super().__init__(**kwargs)
 
 
+# 键集分页索引：按事件/任务的 (created_at, id) 顺序翻页
+ix_task_incident_created = Index("ix_task_incident_created", Task.incident_id, Task.created_at, Task.id)
+
+
 class TimelineEvent(Base):
     __tablename__ = "timeline_event"
     id = Column(String, primary_key=True)
@@ -78,10 +145,29 @@ class TimelineEvent(Base):
 
     def __init__(self, **kwargs: Any):
         if "id" not in kwargs:
-            kwargs["id"] = f"tl-{int(datetime.now().timestamp()*1000)}"
+            kwargs["id"] = new_id("tl")
         super().__init__(**kwargs)
 
 
+ix_timeline_incident_created = Index("ix_timeline_incident_created", TimelineEvent.incident_id, TimelineEvent.created_at, TimelineEvent.id)
+
+
+class IncidentMetrics(Base):
+    """事件级指标聚合：随任务创建/回执在同一事务内增量维护，战报 O(1) 读取。"""
+
+    __tablename__ = "incident_metrics"
+    incident_id = Column(String, primary_key=True)
+    task_total = Column(Integer, nullable=False, default=0)
+    task_pending = Column(Integer, nullable=False, default=0)
+    task_done = Column(Integer, nullable=False, default=0)
+    task_other = Column(Integer, nullable=False, default=0)
+    # 首次回执：已回执任务数、回执耗时（秒）之和、超 SLA 回执数
+    task_acked = Column(Integer, nullable=False, default=0)
+    ack_seconds_sum = Column(Float, nullable=False, default=0.0)
+    sla_breached = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+
+
 class AlertEvent(Base):
     __tablename__ = "alert_event"
     id = Column(String, primary_key=True)
@@ -93,11 +179,14 @@ class AlertEvent(Base):
 
     def __init__(self, **kwargs: Any):
         if "id" not in kwargs:
-            kwargs["id"] = f"al-{int(datetime.now().timestamp()*1000)}"
+            kwargs["id"] = new_id("al")
         super().__init__(**kwargs)
 
 
 def ensure_schema():
     Base.metadata.create_all(bind=engine)
+    # create_all 不会给已存在的表补索引：后加的索引单独补建
+    for ix in (ix_task_incident_created, ix_timeline_incident_created, ix_object_state_updated):
+        ix.create(bind=engine, checkfirst=True)
 
 
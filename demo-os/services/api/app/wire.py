@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import Any
+
+import msgpack
+
+
+# api -> model-service 紧凑传输的编解码（演示级），对端见 services/model/app/wire.py：
+# - 把 /infer/topn 请求体（每个目标一个特征 dict）转成列式：target_ids 一列、每个特征一列，
+#   缺该特征的行号记在 absent 里（与显式 null 区分）；
+# - 响应按列解码，等级/解释因子由整数编码查响应里的名称表展开，风险分标签按 score_label 模板格式化；
+#   展开后与 JSON 接口返回的 items 逐项一致。
+
+MSGPACK = "application/x-msgpack"
+PACKED_PATH = "/infer/topn/packed"
+
+
+def _columns(features_list: list[dict[str, Any]]) -> tuple[dict[str, list[Any]], dict[str, list[int]]]:
+    keys = dict.fromkeys(key for f in features_list for key in f)
+    columns: dict[str, list[Any]] = {}
+    absent: dict[str, list[int]] = {}
+    for key in keys:
+        col = [f.get(key) for f in features_list]
+        columns[key] = col
+        if None in col:
+            rows = [i for i, f in enumerate(features_list) if key not in f]
+            if rows:
+                absent[key] = rows
+    return columns, absent
+
+
+def encode_request(payloads: list[dict[str, Any]]) -> bytes:
+    requests = []
+    for p in payloads:
+        targets = p["targets"]
+        columns, absent = _columns([t["features"] for t in targets])
+        requests.append(
+            {
+                "area_id": p.get("area_id"),
+                "time": p.get("time"),
+                "n": p.get("n"),
+                "target_ids": [t["target_id"] for t in targets],
+                "features": columns,
+                "absent": absent,
+            }
+        )
+    return msgpack.packb({"requests": requests})
+
+
+def dumps(obj: Any) -> bytes:
+    return msgpack.packb(obj)
+
+
+def decode_response(body: bytes) -> list[list[dict[str, Any]]]:
+    """解码为与 /infer/topn(/batch) 相同形状的 items 列表（每个请求一份）。"""
+    return expand_results(msgpack.unpackb(body))
+
+
+def expand_results(data: dict[str, Any]) -> list[list[dict[str, Any]]]:
+    """列式结果（msgpack 或 JSON 解出的 dict）展开为 items 列表。"""
+    version = data["model_version"]
+    target_type = data["target_type"]
+    factors = data["factors"]
+    levels = data["levels"]
+    label = data["score_label"].format
+    return [
+        [
+            {
+                "target_id": tid,
+                "target_type": target_type,
+                "risk_score": score,
+                "risk_level": levels[level],
+                "confidence": conf,
+                "explain_factors": [factors[c] for c in codes] + [label(score)],
+                "model_version": version,
+            }
+            for tid, score, level, conf, codes in zip(
+                r["target_ids"], r["risk_score"], r["risk_level"], r["confidence"], r["explain"]
+            )
+        ]
+        for r in data["results"]
+    ]
@@ -0,0 +1 @@
+# api / model / agent 共用的基础模块（构建镜像时安装进各服务，本地开发用 pip install -e services/common）
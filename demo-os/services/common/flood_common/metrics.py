@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any
+from uuid import uuid4
+
+
+# 请求级指标与链路追踪（演示级，api / model / agent 三个服务共用这一份实现）：
+# - MetricsMiddleware：按路由模板统计延迟直方图、状态码、在途请求数；
+# - X-Trace-Id：入站有则沿用，没有则生成；响应头回写，出站调用经 trace_headers() 透传；
+# - record(kind, ms)：把一次下游调用（SQL、模型、LLM、工具）计入当前请求与全局直方图；
+# - 最近 TRACE_BUFFER_SIZE 个请求的明细留在环形缓冲区，可按 trace_id 查询，拼出跨服务的耗时分解。
+
+TRACE_HEADER = "x-trace-id"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9_.,:-]{1,256}$")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数（取所在桶上界；落在最后一个桶时取最大值）。"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= target:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {f"le_{b}": c for b, c in zip(self.buckets, self.counts)} | {"le_inf": self.counts[-1]},
+        }
+
+
+class RequestTrace:
+    """单个请求内的下游调用累计：kind -> [次数, 总耗时 ms]。"""
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: dict[str, list[float]] = {}
+
+    def add(self, kind: str, ms: float) -> None:
+        span = self.spans.get(kind)
+        if span is None:
+            self.spans[kind] = [1, ms]
+        else:
+            span[0] += 1
+            span[1] += ms
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        return {k: {"count": int(c), "ms": round(ms, 3)} for k, (c, ms) in self.spans.items()}
+
+
+_current: ContextVar[RequestTrace | None] = ContextVar("request_trace", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self.inflight = 0
+        self.routes: dict[str, Histogram] = {}
+        self.statuses: dict[str, dict[int, int]] = {}
+        self.route_spans: dict[str, dict[str, list[float]]] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.traces: deque[dict[str, Any]] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS) -> None:
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(buckets)
+        hist.observe(value)
+
+    def finish_request(self, route: str, status: int, ms: float, trace: RequestTrace) -> None:
+        hist = self.routes.get(route)
+        if hist is None:
+            hist = self.routes[route] = Histogram()
+            self.statuses[route] = {}
+            self.route_spans[route] = {}
+        hist.observe(ms)
+        self.statuses[route][status] = self.statuses[route].get(status, 0) + 1
+        spans = self.route_spans[route]
+        for kind, (count, span_ms) in trace.spans.items():
+            agg = spans.setdefault(kind, [0, 0.0])
+            agg[0] += count
+            agg[1] += span_ms
+        self.traces.append(
+            {
+                "trace_id": trace.trace_id,
+                "route": route,
+                "status": status,
+                "ms": round(ms, 3),
+                "spans": trace.as_dict(),
+                "time": time.time(),
+            }
+        )
+
+    def snapshot(self, service: str) -> dict[str, Any]:
+        routes = {}
+        for route, hist in self.routes.items():
+            count = hist.count or 1
+            routes[route] = {
+                "latency_ms": hist.snapshot(),
+                "status": {str(k): v for k, v in self.statuses[route].items()},
+                # 每请求平均的下游调用次数/耗时
+                "per_request": {
+                    kind: {"count": round(c / count, 3), "ms": round(ms / count, 3)}
+                    for kind, (c, ms) in self.route_spans[route].items()
+                },
+            }
+        return {
+            "service": service,
+            "inflight": self.inflight,
+            "routes": routes,
+            "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+        }
+
+    def find_traces(self, trace_id: str | None, limit: int) -> list[dict[str, Any]]:
+        if trace_id:
+            return [t for t in self.traces if trace_id in t["trace_id"].split(",")][-limit:]
+        return list(self.traces)[-limit:]
+
+
+registry = Registry()
+
+
+def current_trace_id() -> str | None:
+    trace = _current.get()
+    return trace.trace_id if trace else None
+
+
+def trace_headers() -> dict[str, str]:
+    trace_id = current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+
+def record(kind: str, ms: float) -> None:
+    """记录一次下游调用：计入当前请求（若有）与全局直方图 <kind>_ms。"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(kind, ms)
+    registry.observe(f"{kind}_ms", ms)
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件（不缓冲响应体，SSE/NDJSON 流式响应不受影响）。"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"x-trace-id"), "")
+        trace = RequestTrace(incoming if _TRACE_ID_RE.match(incoming) else uuid4().hex[:16])
+        token = _current.set(trace)
+        status = 500
+
+        async def send_with_trace(message: dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"x-trace-id", trace.trace_id.encode("latin-1"))]
+            await send(message)
+
+        registry.inflight += 1
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            registry.inflight -= 1
+            route = scope.get("route")
+            name = f"{scope['method']} {route.path if route is not None else '<unmatched>'}"
+            registry.finish_request(name, status, (time.perf_counter() - t0) * 1000, trace)
+            _current.reset(token)
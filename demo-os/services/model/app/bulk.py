@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import multiprocessing
+import os
+from collections import deque
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from . import engine
+from .rules import CompiledRules
+
+
+# 超大目标集分块打分（演示级）：
+# - 请求体为 NDJSON 流（每行 {"target_id", "features"}），按 BULK_CHUNK_SIZE 行切块，
+#   原始字节直接交给进程池，解析 + 列式打分都在子进程完成，不经过 Pydantic；
+# - 每块在子进程内先选出本块 TopN，主进程用大小为 n 的堆做归并；
+# - 同时在途的块数受 BULK_MAX_INFLIGHT 限制，峰值内存取决于块大小而非请求大小；
+# - 同分按输入顺序（全局行号）排序，结果与 engine.score_topn 一致；
+# - 规则随每块传给子进程（只序列化规则原文，子进程按内容缓存编译结果），热更新期间同一请求内各块规则一致。
+
+BULK_WORKERS = int(os.getenv("MODEL_BULK_WORKERS", "0")) or (os.cpu_count() or 1)
+BULK_CHUNK_SIZE = int(os.getenv("MODEL_BULK_CHUNK_SIZE", "20000"))
+BULK_MAX_INFLIGHT = int(os.getenv("MODEL_BULK_MAX_INFLIGHT", "0")) or BULK_WORKERS * 2
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn：不从带事件循环/线程的服务进程 fork
+        _pool = ProcessPoolExecutor(max_workers=BULK_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def score_chunk(raw: bytes, offset: int, n: int | None, rules: CompiledRules) -> tuple[int, int, list[Any]]:
+    """
+    子进程内执行：解析一块 NDJSON 并打分。
+    返回 (有效行数, 拒绝行数, 结果)：n 为空时结果为按输入顺序的全部 item；
+    否则为本块 TopN 的 (risk_score, -全局行号, item)，供主进程归并。
+    """
+    ids: list[str] = []
+    feats: list[dict[str, Any]] = []
+    rows: list[int] = []
+    rejected = 0
+    for i, line in enumerate(raw.split(b"\n")):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            target_id = obj["target_id"]
+            features = obj.get("features") or {}
+        except Exception:
+            rejected += 1
+            continue
+        if not isinstance(target_id, str) or not isinstance(features, dict):
+            rejected += 1
+            continue
+        ids.append(target_id)
+        feats.append(features)
+        rows.append(offset + i)
+
+    scores = engine.compute_scores(feats, rules)
+    if n is None:
+        return len(ids), rejected, [engine.build_item(ids[i], feats[i], scores[i], rules) for i in range(len(ids))]
+    top = engine.select_topn(scores, n)
+    return len(ids), rejected, [(scores[i], -rows[i], engine.build_item(ids[i], feats[i], scores[i], rules)) for i in top]
+
+
+async def iter_chunks(stream: AsyncIterator[bytes], chunk_size: int | None = None) -> AsyncIterator[tuple[bytes, int]]:
+    """把请求字节流按行切块，产出 (块原始字节, 块首行全局行号)。"""
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    buf = b""
+    lines: list[bytes] = []
+    offset = 0
+    async for data in stream:
+        buf += data
+        parts = buf.split(b"\n")
+        buf = parts.pop()
+        lines.extend(parts)
+        while len(lines) >= chunk_size:
+            yield b"\n".join(lines[:chunk_size]), offset
+            offset += chunk_size
+            del lines[:chunk_size]
+    if buf.strip():
+        lines.append(buf)
+    if lines:
+        yield b"\n".join(lines), offset
+
+
+class BulkResult:
+    def __init__(self):
+        self.count = 0
+        self.rejected = 0
+        self.chunks = 0
+
+
+async def _scored_chunks(
+    stream: AsyncIterator[bytes], n: int | None, rules: CompiledRules, result: BulkResult
+) -> AsyncIterator[list[Any]]:
+    """按提交顺序产出各块结果；在途块数达到上限时先等最早的一块（背压到请求读取）。"""
+    loop = asyncio.get_running_loop()
+    inflight: deque[asyncio.Future] = deque()
+
+    def collect(out: tuple[int, int, list[Any]]) -> list[Any]:
+        count, rejected, items = out
+        result.count += count
+        result.rejected += rejected
+        result.chunks += 1
+        return items
+
+    try:
+        async for raw, offset in iter_chunks(stream):
+            inflight.append(loop.run_in_executor(pool(), score_chunk, raw, offset, n, rules))
+            if len(inflight) >= BULK_MAX_INFLIGHT:
+                yield collect(await inflight.popleft())
+        while inflight:
+            yield collect(await inflight.popleft())
+    finally:
+        for fut in inflight:
+            fut.cancel()
+
+
+async def topn(stream: AsyncIterator[bytes], n: int, rules: CompiledRules) -> tuple[list[dict[str, Any]], BulkResult]:
+    """归并各块 TopN，返回全局 TopN（风险分降序，同分按输入顺序）。"""
+    result = BulkResult()
+    heap: list[tuple[float, int, dict[str, Any]]] = []
+    async for entries in _scored_chunks(stream, n, rules, result):
+        for entry in entries:
+            if len(heap) < n:
+                heapq.heappush(heap, entry)
+            elif heap and entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+    heap.sort(key=lambda e: (e[0], e[1]), reverse=True)
+    return [item for _, _, item in heap], result
+
+
+async def stream_all(stream: AsyncIterator[bytes], rules: CompiledRules) -> AsyncIterator[bytes]:
+    """按输入顺序逐块产出全部打分结果（NDJSON）。"""
+    result = BulkResult()
+    async for items in _scored_chunks(stream, None, rules, result):
+        yield "".join(json.dumps(it, ensure_ascii=False, separators=(",", ":")) + "\n" for it in items).encode("utf-8")
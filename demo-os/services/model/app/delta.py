@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from . import engine
+from .rules import CompiledRules
+
+
+# 增量重算（演示级）：
+# - 按 (model_version, target_id) 缓存最近一次的特征与打分结果，LRU 淘汰，受条目数与估算字节数双上限；
+# - 请求里特征未变的目标直接复用结果，只把变化/新增的目标送引擎打分；
+# - 每个 (model_version, area_id) 维护一个按 (risk_score 降序, target_id 升序) 有序的列表，
+#   变化时二分删除/插入，TopN 直接取前 n 个，无需全量排序；
+# - 被 LRU 淘汰的目标会从所属区域的排序中移除，该区域标记为不完整（complete=false），
+#   调用方应发送一次全量（replace=true）以重建；
+# - 规则热更新后模型版本变化：首个新版本请求到来时整体丢弃其它版本的条目、区域排序与不完整标记
+#   （否则每次热更新都留下一整套排序，内存随重载次数增长），新版本下尚无排序的区域同样返回 complete=false。
+
+DELTA_CACHE_MAX_ENTRIES = int(os.getenv("MODEL_DELTA_CACHE_MAX_ENTRIES", "500000"))
+DELTA_CACHE_MAX_BYTES = int(os.getenv("MODEL_DELTA_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# 单条缓存的固定开销估算（item dict、key 元组、slots 对象等），加上特征 JSON 长度
+_ENTRY_OVERHEAD_BYTES = 600
+
+
+class _Entry:
+    __slots__ = ("area_id", "features", "item", "size")
+
+    def __init__(self, area_id: str, features: dict[str, Any], item: dict[str, Any], size: int):
+        self.area_id = area_id
+        self.features = features
+        self.item = item
+        self.size = size
+
+
+class Ranking:
+    """单个区域的有序结构：keys 按 (-risk_score, target_id) 升序。"""
+
+    __slots__ = ("keys", "scores")
+
+    def __init__(self):
+        self.keys: list[tuple[float, str]] = []
+        self.scores: dict[str, float] = {}
+
+    def upsert(self, target_id: str, score: float) -> None:
+        self.remove(target_id)
+        bisect.insort(self.keys, (-score, target_id))
+        self.scores[target_id] = score
+
+    def upsert_many(self, pairs: list[tuple[str, float]]) -> None:
+        """批量更新：变化量较大（如首次全量）时追加后整体排序一次，否则逐条二分插入。"""
+        if len(pairs) * 8 < len(self.keys):
+            for target_id, score in pairs:
+                self.upsert(target_id, score)
+            return
+        for target_id, _ in pairs:
+            self.remove(target_id)
+        self.keys.extend((-score, target_id) for target_id, score in pairs)
+        self.keys.sort()
+        self.scores.update(pairs)
+
+    def remove(self, target_id: str) -> None:
+        score = self.scores.pop(target_id, None)
+        if score is not None:
+            i = bisect.bisect_left(self.keys, (-score, target_id))
+            del self.keys[i]
+
+    def top(self, n: int | None) -> list[str]:
+        keys = self.keys if n is None else self.keys[: max(n, 0)]
+        return [target_id for _, target_id in keys]
+
+
+class DeltaScorer:
+    def __init__(self, max_entries: int = DELTA_CACHE_MAX_ENTRIES, max_bytes: int = DELTA_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._rankings: dict[tuple[str, str], Ranking] = {}
+        self._incomplete: set[tuple[str, str]] = set()
+        self._version: str | None = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.retired = 0
+
+    def apply(
+        self,
+        rules: CompiledRules,
+        area_id: str,
+        targets: list[tuple[str, dict[str, Any]]],
+        removed: list[str],
+        replace: bool,
+        n: int | None,
+    ) -> dict[str, Any]:
+        """
+        合并一次增量：targets 为 (target_id, features)；replace=True 表示这是该区域的全量，
+        未出现的目标视为已移除。返回新的 TopN 及本次复用/重算/移除条数。
+        """
+        latest = dict(targets)  # 同一目标出现多次时以最后一次为准
+        model_version = rules.version
+        with self._lock:
+            if model_version != self._version:
+                self._retire(model_version)
+            area_key = (model_version, area_id)
+            if area_key not in self._rankings and not replace:
+                self._incomplete.add(area_key)
+            ranking = self._rankings.setdefault(area_key, Ranking())
+
+            changed_ids: list[str] = []
+            changed_feats: list[dict[str, Any]] = []
+            for target_id, features in latest.items():
+                entry = self._entries.get((model_version, target_id))
+                if entry is not None and entry.area_id == area_id and entry.features == features:
+                    self._entries.move_to_end((model_version, target_id))
+                    self.hits += 1
+                    continue
+                self.misses += 1
+                changed_ids.append(target_id)
+                changed_feats.append(features)
+
+            scores = engine.compute_scores(changed_feats, rules)
+            for target_id, features, score in zip(changed_ids, changed_feats, scores):
+                self._drop((model_version, target_id))
+                item = engine.build_item(target_id, features, score, rules)
+                size = _ENTRY_OVERHEAD_BYTES + len(target_id) + len(json.dumps(features, ensure_ascii=False))
+                self._entries[(model_version, target_id)] = _Entry(area_id, features, item, size)
+                self._bytes += size
+            ranking.upsert_many(list(zip(changed_ids, scores)))
+
+            drops = set(removed)
+            if replace:
+                drops |= set(ranking.scores) - latest.keys()
+                self._incomplete.discard(area_key)
+            for target_id in drops:
+                self._drop((model_version, target_id))
+
+            self._evict()
+            items = [self._entries[(model_version, tid)].item for tid in ranking.top(n)]
+            return {
+                "items": items,
+                "rescored": len(changed_ids),
+                "unchanged": len(latest) - len(changed_ids),
+                "removed": len(drops),
+                "total": len(ranking.scores),
+                "complete": area_key not in self._incomplete,
+            }
+
+    def _retire(self, version: str) -> None:
+        """切换到新模型版本：丢弃其它版本的全部条目、区域排序与不完整标记。"""
+        for key in [k for k in self._entries if k[0] != version]:
+            self._bytes -= self._entries.pop(key).size
+            self.retired += 1
+        self._rankings = {k: r for k, r in self._rankings.items() if k[0] == version}
+        self._incomplete = {k for k in self._incomplete if k[0] == version}
+        self._version = version
+
+    def _drop(self, key: tuple[str, str]) -> _Entry | None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            ranking = self._rankings.get((key[0], entry.area_id))
+            if ranking is not None:
+                ranking.remove(key[1])
+        return entry
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, _ = next(iter(self._entries.items()))
+            entry = self._drop(key)
+            self.evictions += 1
+            self._incomplete.add((key[0], entry.area_id))
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "model_version": self._version,
+            "entries": len(self._entries),
+            "bytes_est": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "areas": len(self._rankings),
+            "incomplete_areas": len(self._incomplete),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "retired": self.retired,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+delta_scorer = DeltaScorer()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import heapq
+from typing import Any
+
+from .rules import MISSING, CompiledRules
+
+
+# 列式批量打分引擎（演示级）：
+# - 打分公式来自规则文件编译出的 CompiledRules（见 rules.py），与 rules.reference 逐项等价，结果逐位一致；
+# - 先把特征按列抽成 list[float]，一次循环算出全部风险分；
+# - TopN 用 heapq.nlargest 做部分选择，置信度/解释因子只为入选对象计算；
+# - 不构造逐条 Pydantic 对象，直接产出可 JSON 序列化的 dict；
+# - score_columns 直接吃列式输入（wire.py），结果也按列返回，等级/解释因子为整数编码。
+# 仍保持纯 Python，避免 numpy 等编译依赖。
+
+
+def compute_scores(features_list: list[dict[str, Any]], rules: CompiledRules) -> list[float]:
+    """批量计算风险分（0~10），顺序与输入一致。"""
+    return rules.scores(features_list)
+
+
+def select_topn(scores: list[float], n: int | None) -> list[int]:
+    """按风险分降序返回下标；n 为空时全量排序（稳定，同分保持输入顺序）。"""
+    idx = range(len(scores))
+    if n is None or n >= len(scores):
+        return sorted(idx, key=scores.__getitem__, reverse=True)
+    return heapq.nlargest(max(n, 0), idx, key=scores.__getitem__)
+
+
+def build_item(target_id: str, features: dict[str, Any], score: float, rules: CompiledRules) -> dict[str, Any]:
+    return {
+        "target_id": target_id,
+        "target_type": "road_segment",
+        "risk_score": score,
+        "risk_level": rules.risk_level(score),
+        "confidence": rules.confidence(features, target_id),
+        "explain_factors": rules.explain_factors(features, score),
+        "model_version": rules.version,
+    }
+
+
+def score_topn(
+    target_ids: list[str],
+    features_list: list[dict[str, Any]],
+    n: int | None,
+    rules: CompiledRules,
+) -> list[dict[str, Any]]:
+    """批量打分并返回 TopN（n 为空返回全量），结果与逐条 rules.reference + 全排序一致。"""
+    scores = rules.scores(features_list)
+    return [build_item(target_ids[i], features_list[i], scores[i], rules) for i in select_topn(scores, n)]
+
+
+def score_groups(
+    groups: list[tuple[list[str], list[dict[str, Any]], int | None]],
+    rules: CompiledRules,
+) -> list[list[dict[str, Any]]]:
+    """多组（如多个区域/请求）合并为一次列式打分，再按组各自选 TopN。"""
+    all_features: list[dict[str, Any]] = []
+    for _, features_list, _ in groups:
+        all_features.extend(features_list)
+    scores = rules.scores(all_features)
+
+    results: list[list[dict[str, Any]]] = []
+    offset = 0
+    for target_ids, features_list, n in groups:
+        end = offset + len(features_list)
+        part = scores[offset:end]
+        results.append([build_item(target_ids[i], features_list[i], part[i], rules) for i in select_topn(part, n)])
+        offset = end
+    return results
+
+
+def score_columns(
+    target_ids: list[str],
+    columns: dict[str, list[Any]],
+    n: int | None,
+    rules: CompiledRules,
+) -> dict[str, list[Any]]:
+    """
+    列式输入打分：不先拼成逐对象 dict，直接按特征列打分、选 TopN；
+    只为入选对象还原特征 dict（计算置信度/解释因子）。结果与 score_topn 逐项一致，
+    risk_level 为 rules.level_names 下标，explain 为 rules.factor_names 下标（风险分标签由调用方展开）。
+    """
+    scores = rules.scores_columns(columns, len(target_ids))
+    order = select_topn(scores, n)
+    cols = list(columns.items())
+    ids: list[str] = []
+    out_scores: list[float] = []
+    levels: list[int] = []
+    confidence: list[float] = []
+    explain: list[list[int]] = []
+    for i in order:
+        features = {key: col[i] for key, col in cols if col[i] is not MISSING}
+        tid = target_ids[i]
+        score = scores[i]
+        ids.append(tid)
+        out_scores.append(score)
+        levels.append(rules.level_code(score))
+        confidence.append(rules.confidence(features, tid))
+        explain.append(rules.explain_codes(features))
+    return {"target_ids": ids, "risk_score": out_scores, "risk_level": levels, "confidence": confidence, "explain": explain}
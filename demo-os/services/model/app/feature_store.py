@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from array import array
+from collections.abc import Iterable
+from typing import Any
+
+import httpx
+import msgpack
+
+from .rules import MISSING
+
+
+# 模型侧特征库（演示级）：
+# - 常驻内存保存每个路段最新特征，api 只需按 area_id 或 target_ids 请求打分，不必每次把全部特征发过来；
+# - 记录为 __slots__ 对象：浮点特征存 array('d')，其余取值（字符串/整数/null 等）存元组；
+#   特征名元组与区域 ID 驻留共享，同结构的几十万条记录只保存一份键元组；
+# - 字符串取值按特征分别驻留（pump_status 这类枚举），某个特征的不同取值超过 MODEL_FEATURE_INTERN_MAX
+#   （编号、自由文本等高基数字段）即停止驻留并丢弃其驻留表，驻留表不会随运行时间无限增长；
+# - 数据来源：定时拉取 api 的 /objects/changes（按 ObjectState.updated_at 键集分页），水位线回退 2 秒重读，
+#   容忍提交顺序差异（按 updated_at 比较新旧，重复读幂等）；
+# - 水位线：watermark 为最近一次“读到末尾”的同步所见的最大 updated_at，synced_at 为该次同步开始时刻；
+#   请求可带 min_updated_at / max_staleness_s，不满足时先同步一轮，仍不满足则拒绝（调用方回退为发送特征）。
+# 对象只增不删（与 ObjectState 一致）。
+
+logger = logging.getLogger(__name__)
+
+MODEL_FEATURE_SYNC_URL = os.getenv("MODEL_FEATURE_SYNC_URL", "").strip().rstrip("/")
+MODEL_FEATURE_SYNC_S = float(os.getenv("MODEL_FEATURE_SYNC_S", "2"))
+MODEL_FEATURE_SYNC_PAGE = int(os.getenv("MODEL_FEATURE_SYNC_PAGE", "5000"))
+MODEL_FEATURE_OBJECT_TYPE = os.getenv("MODEL_FEATURE_OBJECT_TYPE", "road_segment")
+MODEL_FEATURE_INTERN_MAX = int(os.getenv("MODEL_FEATURE_INTERN_MAX", "256"))
+_SYNC_OVERLAP_S = 2.0
+
+
+class StaleStore(Exception):
+    pass
+
+
+class _Record:
+    __slots__ = ("object_id", "area_id", "updated_at", "num_keys", "nums", "other_keys", "others")
+
+    def __init__(
+        self,
+        object_id: str,
+        area_id: str,
+        updated_at: float,
+        num_keys: tuple[str, ...],
+        nums: array,
+        other_keys: tuple[str, ...],
+        others: tuple[Any, ...],
+    ):
+        self.object_id = object_id
+        self.area_id = area_id
+        self.updated_at = updated_at
+        self.num_keys = num_keys
+        self.nums = nums
+        self.other_keys = other_keys
+        self.others = others
+
+
+def columns_of(records: list[_Record]) -> dict[str, list[Any]]:
+    """记录还原为 engine.score_columns 的列式输入：没有该特征的行为 MISSING。"""
+    n = len(records)
+    cols: dict[str, list[Any]] = {}
+    # 键元组是驻留共享的：每种结构只查一次列，之后逐条按位置写入
+    targets: dict[tuple[str, ...], list[list[Any]]] = {}
+
+    def columns_for(keys: tuple[str, ...]) -> list[list[Any]]:
+        found = targets.get(keys)
+        if found is None:
+            found = targets[keys] = [cols.get(k) or cols.setdefault(k, [MISSING] * n) for k in keys]
+        return found
+
+    for i, r in enumerate(records):
+        for col, v in zip(columns_for(r.num_keys), r.nums):
+            col[i] = v
+        if r.other_keys:
+            for col, v in zip(columns_for(r.other_keys), r.others):
+                col[i] = v
+    return cols
+
+
+class FeatureStore:
+    def __init__(self, sync_url: str = MODEL_FEATURE_SYNC_URL, transport: httpx.AsyncBaseTransport | None = None):
+        self.sync_url = sync_url
+        self._transport = transport
+        self._records: dict[str, _Record] = {}
+        self._areas: dict[str, dict[str, _Record]] = {}
+        self._interned: dict[Any, Any] = {}
+        # 特征名 -> 字符串取值驻留表；None 表示该特征基数过高，不再驻留
+        self._values: dict[str, dict[str, str] | None] = {}
+        self.watermark: float | None = None
+        self.synced_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+        self._stats = {"syncs": 0, "pages": 0, "rows": 0, "applied": 0, "errors": 0, "on_demand": 0, "rejected": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sync_url)
+
+    def _intern(self, value: Any) -> Any:
+        # 只驻留区域 ID 与特征名元组（数量受区域数/结构数约束）：1 / 1.0 / True 相等且同哈希，不能混在一起
+        return self._interned.setdefault(value, value)
+
+    def _intern_value(self, key: str, value: str) -> str:
+        table = self._values.get(key, {})
+        if table is None:
+            return value
+        found = table.get(value)
+        if found is not None:
+            return found
+        if len(table) >= MODEL_FEATURE_INTERN_MAX:
+            # 高基数字段：已共享的取值仍由记录引用，驻留表本身释放
+            self._values[key] = None
+            return value
+        if not table:
+            self._values[key] = table
+        table[value] = value
+        return value
+
+    # ---------- 写入 ----------
+
+    def upsert(self, object_id: str, area_id: str, features: dict[str, Any], updated_at: float) -> bool:
+        """合并一条对象特征；比已有记录旧（updated_at 更小）时忽略。"""
+        old = self._records.get(object_id)
+        if old is not None and old.updated_at > updated_at:
+            return False
+        num_keys: list[str] = []
+        nums = array("d")
+        other_keys: list[str] = []
+        others: list[Any] = []
+        for key, v in features.items():
+            if v.__class__ is float:
+                num_keys.append(key)
+                nums.append(v)
+            else:
+                other_keys.append(key)
+                others.append(self._intern_value(key, v) if v.__class__ is str else v)
+        rec = _Record(
+            object_id,
+            self._intern(area_id),
+            updated_at,
+            self._intern(tuple(num_keys)),
+            nums,
+            self._intern(tuple(other_keys)),
+            tuple(others),
+        )
+        self._records[object_id] = rec
+        if old is not None and old.area_id != rec.area_id:
+            self._areas.get(old.area_id, {}).pop(object_id, None)
+        self._areas.setdefault(rec.area_id, {})[object_id] = rec
+        return True
+
+    def apply_rows(self, rows: Iterable[dict[str, Any]]) -> int:
+        applied = 0
+        for row in rows:
+            if row.get("object_type", MODEL_FEATURE_OBJECT_TYPE) != MODEL_FEATURE_OBJECT_TYPE:
+                continue
+            applied += self.upsert(row["object_id"], row["area_id"], row.get("features") or {}, float(row["updated_at"]))
+        return applied
+
+    # ---------- 读取 ----------
+
+    def lookup(
+        self, area_id: str | None = None, target_ids: list[str] | None = None
+    ) -> tuple[list[_Record], list[str]]:
+        """按 target_ids（保持请求顺序）或 area_id（按 object_id 排序）取记录；返回 (记录, 库中没有的 target_id)。"""
+        if target_ids is not None:
+            get = self._records.get
+            found = [get(tid) for tid in target_ids]
+            return [r for r in found if r is not None], [tid for tid, r in zip(target_ids, found) if r is None]
+        area = self._areas.get(area_id or "", {})
+        return [area[oid] for oid in sorted(area)], []
+
+    def is_fresh(self, min_updated_at: float | None = None, max_staleness_s: float | None = None) -> bool:
+        if self.synced_at is None:
+            return False
+        if min_updated_at is not None and (self.watermark is None or self.watermark < min_updated_at):
+            return False
+        if max_staleness_s is not None and time.time() - self.synced_at > max_staleness_s:
+            return False
+        return True
+
+    async def ensure(
+        self,
+        min_updated_at: float | None = None,
+        max_staleness_s: float | None = None,
+        target_ids: list[str] | None = None,
+    ) -> None:
+        """水位线/新鲜度不满足（或请求的对象尚未同步到）时立即同步一轮；仍不满足抛 StaleStore。"""
+
+        def ok() -> bool:
+            if not self.is_fresh(min_updated_at, max_staleness_s):
+                return False
+            return target_ids is None or all(tid in self._records for tid in target_ids)
+
+        if ok():
+            return
+        if self.enabled:
+            async with self._lock:
+                # 排队期间别的请求可能已同步过
+                if not ok():
+                    self._stats["on_demand"] += 1
+                    try:
+                        await self._sync_pass()
+                    except Exception as e:  # noqa: BLE001 - 同步失败按“不新鲜”处理
+                        logger.warning("feature store on-demand sync failed: %s", e)
+        if not ok():
+            self._stats["rejected"] += 1
+            raise StaleStore(f"feature store behind: {self.watermark_info()}")
+
+    # ---------- 同步 ----------
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.sync_url, timeout=30.0, transport=self._transport)
+        return self._client
+
+    async def sync(self) -> int:
+        """从 api 拉一轮增量直到读到末尾（同一时刻只有一轮）；返回合并的记录数。"""
+        async with self._lock:
+            return await self._sync_pass()
+
+    async def _sync_pass(self) -> int:
+        started = time.time()
+        since = self.watermark - _SYNC_OVERLAP_S if self.watermark is not None else None
+        high = self.watermark
+        applied = 0
+        cursor: str | None = None
+        try:
+            while True:
+                params: dict[str, Any] = {"object_type": MODEL_FEATURE_OBJECT_TYPE, "limit": MODEL_FEATURE_SYNC_PAGE}
+                if since is not None:
+                    params["since"] = since
+                if cursor:
+                    params["cursor"] = cursor
+                resp = await self._http().get("/objects/changes", params=params, headers={"Accept": "application/x-msgpack"})
+                resp.raise_for_status()
+                page = msgpack.unpackb(resp.content)
+                rows = page["items"]
+                applied += self.apply_rows(rows)
+                self._stats["pages"] += 1
+                self._stats["rows"] += len(rows)
+                if rows and (high is None or rows[-1]["updated_at"] > high):
+                    high = float(rows[-1]["updated_at"])
+                cursor = page.get("next_cursor")
+                if not cursor:
+                    break
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            self._stats["applied"] += applied
+        # 读到末尾才推进水位线：此前提交的变化都已合并
+        self.watermark = high
+        self.synced_at = started
+        self._stats["syncs"] += 1
+        return applied
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.sync()
+        except Exception as e:  # noqa: BLE001 - api 可能尚未就绪，后台继续重试
+            logger.warning("feature store initial sync failed: %s", e)
+        if MODEL_FEATURE_SYNC_S > 0:
+            self._task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(MODEL_FEATURE_SYNC_S)
+            try:
+                await self.sync()
+            except Exception as e:  # noqa: BLE001 - 同步失败不影响已有数据，下轮重试
+                logger.warning("feature store sync failed: %s", e)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def watermark_info(self) -> dict[str, Any]:
+        return {
+            "watermark": self.watermark,
+            "synced_at": self.synced_at,
+            "staleness_s": (time.time() - self.synced_at) if self.synced_at is not None else None,
+        }
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "source": self.sync_url,
+            "objects": len(self._records),
+            "areas": len(self._areas),
+            "schemas": sum(1 for v in self._interned.values() if v.__class__ is tuple),
+            "interned_values": sum(len(t) for t in self._values.values() if t is not None),
+            "high_cardinality": sorted(k for k, t in self._values.items() if t is None),
+            "approx_bytes": self._approx_bytes(),
+            **self.watermark_info(),
+            **self._stats,
+        }
+
+    def _approx_bytes(self) -> int:
+        size = sys.getsizeof(self._records) + sum(sys.getsizeof(a) for a in self._areas.values())
+        for r in self._records.values():
+            size += sys.getsizeof(r) + sys.getsizeof(r.nums)
+        return size
+
+
+feature_store = FeatureStore()
@@ -1,29 +1,42 @@
 from __future__ import annotations
 
-import os
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Any
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
+from flood_common import metrics
 
-app = FastAPI(title="Flood Demo Model Service", version="0.1.0")
+from . import bulk, engine, wire
+from .delta import delta_scorer
+from .feature_store import StaleStore, columns_of, feature_store
+from .rules import RuleError, rule_store
 
 
-SEED = int(os.getenv("MODEL_SEED", "42"))
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await rule_store.start()
+    await feature_store.start()
+    try:
+        yield
+    finally:
+        await feature_store.stop()
+        await rule_store.stop()
+        bulk.shutdown()
+
+
+app = FastAPI(title="Flood Demo Model Service", version="0.1.0", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+
 
 # 纯 Python “开源小模型”（演示级）：
 # 为了避免 scipy/numpy 等编译依赖导致的容器构建失败，这里用可解释的线性/规则打分模型。
-MODEL_VERSION = f"open-rule-linear-v1-seed-{SEED}"
-FEATURE_NAMES = [
-    "rain_now_mmph",
-    "rain_1h_mm",
-    "water_level_m",
-    "elevation_m",
-    "drainage_capacity",
-    "pump_fault",
-    "traffic_index",
-]
+# 权重/阈值/等级在规则文件中（MODEL_RULES_PATH，默认 app/rules/flood_risk.json），修改后自动热更新；
+# model_version 由规则文件内容哈希得出。
 
 
 class InferTarget(BaseModel):
@@ -35,6 +48,8 @@ class InferTopNRequest(BaseModel):
     time: str
     area_id: str
     targets: list[InferTarget]
+    # 只需要 TopN 时传入，服务端做部分选择；为空则返回全量排序结果
+    n: int | None = Field(default=None, ge=0)
 
 
 class InferItem(BaseModel):
@@ -51,123 +66,204 @@ class InferTopNResponse(BaseModel):
     items: list[InferItem]
 
 
-def _risk_level(score: float) -> str:
-    if score >= 7.0:
-        return "红"
-    if score >= 5.0:
-        return "橙"
-    if score >= 3.5:
-        return "黄"
-    return "蓝"
+class InferTopNBatchRequest(BaseModel):
+    # 供 api 微批合并：多个 topn 请求（可跨区域）一次打分，按顺序分别返回
+    requests: list[InferTopNRequest]
 
 
-def _safe_float(v: Any, default: float) -> float:
-    try:
-        return float(v)
-    except Exception:
-        return default
+class InferTopNBatchResponse(BaseModel):
+    results: list[InferTopNResponse]
 
 
-def _compute(features: dict[str, Any], target_id: str) -> tuple[float, float, list[str]]:
-    """
-    返回：(risk_score, confidence, explain_factors)
-    - risk_score：0~10
-    - confidence：0.1~0.95
-    - explain_factors：Top 3 贡献因子 + 风险分
-    """
-    rain_now = _safe_float(features.get("rain_now_mmph"), 0.0)  # 当前雨强
-    rain_1h = _safe_float(features.get("rain_1h_mm"), 0.0)  # 1h 累计雨量
-    water_level = _safe_float(features.get("water_level_m"), 0.0)  # 水位
-    elevation = _safe_float(features.get("elevation_m"), 3.0)  # 海拔（低洼更危险）
-    drainage = _safe_float(features.get("drainage_capacity"), 1.0)  # 排水能力
-    pump_status = str(features.get("pump_status", "running"))
-    pump_fault = 1.0 if pump_status.lower() in {"fault", "down", "offline"} else 0.0
-    traffic_index = _safe_float(features.get("traffic_index"), 0.0)
-
-    # 可解释线性/规则打分（演示级、非生产）
-    # 雨更大、水位更高、低洼、排水更差、泵故障、拥堵更危险
-    score = 0.0
-    contrib: list[tuple[str, float]] = []
-
-    c = 0.03 * rain_now
-    score += c
-    contrib.append(("雨强", abs(c)))
-
-    c = 0.02 * rain_1h
-    score += c
-    contrib.append(("累计雨量", abs(c)))
-
-    c = 0.90 * water_level
-    score += c
-    contrib.append(("水位", abs(c)))
-
-    lowland = max(0.0, 3.0 - elevation)
-    c = 0.60 * lowland
-    score += c
-    contrib.append(("低洼度", abs(c)))
-
-    lack_drainage = max(0.0, 1.5 - drainage)
-    c = 0.80 * lack_drainage
-    score += c
-    contrib.append(("排水能力不足", abs(c)))
-
-    c = 1.50 * pump_fault
-    score += c
-    contrib.append(("泵站故障", abs(c)))
-
-    c = 0.80 * traffic_index
-    score += c
-    contrib.append(("道路拥堵", abs(c)))
-
-    # 归一到 0~10
-    if score < 0:
-        score = 0.0
-    if score > 10:
-        score = 10.0
-
-    # 置信度（演示）：按字段完整性和对象稳定噪声给出 0.6~0.95 区间
-    base_conf = 0.8
-    if "rain_now_mmph" not in features:
-        base_conf -= 0.15
-    if "water_level_m" not in features:
-        base_conf -= 0.15
-    if "pump_status" not in features:
-        base_conf -= 0.08
-    # 对象级稳定扰动，避免所有点同一个值
-    jitter = ((sum(ord(c) for c in target_id) % 21) - 10) / 100  # -0.10 ~ +0.10
-    confidence = base_conf + jitter
-    if confidence < 0.6:
-        confidence = 0.6
-    if confidence > 0.95:
-        confidence = 0.95
-
-    contrib.sort(key=lambda x: x[1], reverse=True)
-    explain = [name for name, _ in contrib[:3]]
-    explain.append(f"风险分={score:.2f}")
-    return score, confidence, explain
+class InferDeltaRequest(BaseModel):
+    # 增量重算：只需发送变化的目标；replace=true 表示 targets 是该区域的全量
+    area_id: str
+    targets: list[InferTarget] = Field(default_factory=list)
+    removed: list[str] = Field(default_factory=list)
+    replace: bool = False
+    n: int | None = Field(default=None, ge=0)
+
+
+class InferStoredRequest(BaseModel):
+    # 特征来自模型侧特征库：只传 area_id 或 target_ids 之一
+    area_id: str | None = None
+    target_ids: list[str] | None = None
+    n: int | None = Field(default=None, ge=0)
+    # 新鲜度要求：特征库水位线须不低于 min_updated_at（调用方读到的 ObjectState.updated_at 最大值，epoch 秒），
+    # 且距上次同步不超过 max_staleness_s；不满足时先同步一轮，仍不满足返回 409
+    min_updated_at: float | None = None
+    max_staleness_s: float | None = Field(default=None, ge=0)
+
+
+class InferDeltaResponse(InferTopNResponse):
+    rescored: int
+    unchanged: int
+    removed: int
+    total: int
+    # false：该区域有目标被缓存淘汰，需发送一次 replace=true 的全量
+    complete: bool
 
 
 @app.get("/health")
 def health():
-    return {"ok": True, "model_version": MODEL_VERSION}
+    return {"ok": True, "model_version": rule_store.current().version, "delta_cache": delta_scorer.stats()}
+
+
+@app.get("/rules")
+def get_rules():
+    """当前生效的打分规则（编译后的因子表、等级阈值）与热更新状态。"""
+    return {**rule_store.current().describe(), "store": rule_store.stats()}
+
+
+@app.post("/rules/reload")
+def reload_rules():
+    """立即重新加载规则文件（后台也会按 MODEL_RULES_POLL_S 轮询）；规则有误返回 422，旧规则继续生效。"""
+    try:
+        changed = rule_store.reload()
+    except RuleError as e:
+        raise HTTPException(422, str(e))
+    return {"changed": changed, "model_version": rule_store.current().version}
+
+
+@app.get("/features/stats")
+def feature_store_stats():
+    """模型侧特征库：对象数、水位线、距上次同步的时间、同步/拒绝次数。"""
+    return feature_store.stats()
+
+
+@app.post("/features/sync")
+async def feature_store_sync():
+    """立即从 api 增量同步一轮（后台也会按 MODEL_FEATURE_SYNC_S 定时同步）。"""
+    if not feature_store.enabled:
+        raise HTTPException(503, "feature store disabled (MODEL_FEATURE_SYNC_URL not set)")
+    try:
+        applied = await feature_store.sync()
+    except Exception as e:
+        raise HTTPException(502, f"feature sync failed: {e!r}")
+    return {"applied": applied, **feature_store.watermark_info()}
+
+
+@app.get("/metrics")
+def service_metrics():
+    """按路由的延迟直方图、在途请求数，以及每请求目标数分布。"""
+    return metrics.registry.snapshot("model")
+
+
+@app.get("/metrics/traces")
+def trace_metrics(trace_id: str | None = None, limit: int = Query(default=50, ge=1, le=1000)):
+    return metrics.registry.find_traces(trace_id, limit)
 
 
 @app.post("/infer/topn", response_model=InferTopNResponse)
 def infer_topn(req: InferTopNRequest):
-    items: list[InferItem] = []
-    for t in req.targets:
-        score, confidence, explain_factors = _compute(t.features, t.target_id)
-        items.append(
-            InferItem(
-                target_id=t.target_id,
-                risk_score=score,
-                risk_level=_risk_level(score),
-                confidence=confidence,
-                explain_factors=explain_factors,
-                model_version=MODEL_VERSION,
-            )
+    metrics.registry.observe("targets_per_request", len(req.targets), metrics.SIZE_BUCKETS)
+    # 列式批量打分 + 部分选择；直接返回 dict，避免逐条构造/校验 InferItem
+    items = engine.score_topn(
+        [t.target_id for t in req.targets],
+        [t.features for t in req.targets],
+        req.n,
+        rule_store.current(),
+    )
+    return JSONResponse({"items": items})
+
+
+@app.post("/infer/topn/batch", response_model=InferTopNBatchResponse)
+def infer_topn_batch(req: InferTopNBatchRequest):
+    metrics.registry.observe("batch_requests", len(req.requests), metrics.SIZE_BUCKETS)
+    metrics.registry.observe("targets_per_request", sum(len(r.targets) for r in req.requests), metrics.SIZE_BUCKETS)
+    groups = [([t.target_id for t in r.targets], [t.features for t in r.targets], r.n) for r in req.requests]
+    results = engine.score_groups(groups, rule_store.current())
+    return JSONResponse({"results": [{"items": items} for items in results]})
+
+
+def _score_packed(body: bytes, content_type: str | None, accept: str | None) -> tuple[bytes, str]:
+    groups = wire.decode_request(body, content_type)
+    metrics.registry.observe("batch_requests", len(groups), metrics.SIZE_BUCKETS)
+    metrics.registry.observe("targets_per_request", sum(len(ids) for ids, _, _ in groups), metrics.SIZE_BUCKETS)
+    rules = rule_store.current()
+    return wire.encode_response(rules, [engine.score_columns(ids, cols, n, rules) for ids, cols, n in groups], accept)
+
+
+@app.post("/infer/topn/packed")
+async def infer_topn_packed(request: Request):
+    """
+    内部紧凑传输版 topn/batch（api -> model-service）：列式请求与结果，跳过 Pydantic 校验，
+    等级/解释因子以整数编码；按 Content-Type / Accept 协商 application/x-msgpack 或 JSON，格式见 wire.py。
+    """
+    body = await request.body()
+    try:
+        content, media_type = await run_in_threadpool(
+            _score_packed, body, request.headers.get("content-type"), request.headers.get("accept")
         )
-    items.sort(key=lambda it: it.risk_score, reverse=True)
-    return InferTopNResponse(items=items)
+    except wire.UnsupportedMediaType as e:
+        raise HTTPException(415, str(e))
+    except wire.WireError as e:
+        raise HTTPException(400, str(e))
+    return Response(content, media_type=media_type)
+
+
+def _score_stored(records: list, n: int | None, accept: str | None) -> tuple[bytes, str]:
+    rules = rule_store.current()
+    result = engine.score_columns([r.object_id for r in records], columns_of(records), n, rules)
+    return wire.encode_response(rules, [result], accept, watermark=feature_store.watermark_info())
+
+
+@app.post("/infer/topn/stored")
+async def infer_topn_stored(req: InferStoredRequest, request: Request):
+    """
+    按 area_id 或 target_ids 打分，特征取自模型侧特征库（不随请求发送）。
+    target_ids 保持请求顺序，area_id 按 object_id 排序；结果为列式（同 /infer/topn/packed），附带特征库水位线。
+    """
+    if (req.area_id is None) == (req.target_ids is None):
+        raise HTTPException(422, "exactly one of area_id / target_ids is required")
+    if not feature_store.enabled:
+        raise HTTPException(503, "feature store disabled (MODEL_FEATURE_SYNC_URL not set)")
+    try:
+        await feature_store.ensure(req.min_updated_at, req.max_staleness_s, req.target_ids)
+    except StaleStore as e:
+        return JSONResponse({"detail": str(e), **feature_store.watermark_info()}, status_code=409)
+    records, _ = feature_store.lookup(req.area_id, req.target_ids)
+    metrics.registry.observe("targets_per_request", len(records), metrics.SIZE_BUCKETS)
+    content, media_type = await run_in_threadpool(_score_stored, records, req.n, request.headers.get("accept"))
+    return Response(content, media_type=media_type)
 
 
+@app.post("/infer/topn/delta", response_model=InferDeltaResponse)
+def infer_topn_delta(req: InferDeltaRequest):
+    """
+    增量 TopN：与缓存中的上次特征比对，只重算特征变化/新增的目标，
+    区域排序增量维护（同分按 target_id 升序）。
+    """
+    result = delta_scorer.apply(
+        rule_store.current(),
+        req.area_id,
+        [(t.target_id, t.features) for t in req.targets],
+        req.removed,
+        req.replace,
+        req.n,
+    )
+    return JSONResponse(result)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    边读请求体边写响应：StreamingResponse 默认并发监听断连，会抢读尚未消费的请求体消息，
+    这里关闭该监听；读请求体期间的断连由 request.stream() 抛出 ClientDisconnect 感知。
+    """
+
+    async def listen_for_disconnect(self, receive: Any) -> None:
+        await asyncio.Event().wait()
+
+
+@app.post("/infer/topn/stream")
+async def infer_topn_stream(request: Request, n: int | None = Query(default=None, ge=0)):
+    """
+    大批量模式：请求体为 NDJSON（每行 {"target_id", "features"}），分块在进程池中打分。
+    - 带 n：返回归并后的全局 TopN（及有效/拒绝行数、块数）
+    - 不带 n：以 NDJSON 流按输入顺序返回全部打分结果
+    """
+    rules = rule_store.current()
+    if n is None:
+        return DuplexStreamingResponse(bulk.stream_all(request.stream(), rules), media_type="application/x-ndjson")
+    items, result = await bulk.topn(request.stream(), n, rules)
+    return JSONResponse({"items": items, "count": result.count, "rejected": result.rejected, "chunks": result.chunks})
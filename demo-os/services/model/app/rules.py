@@ -0,0 +1,509 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable
+
+
+# 声明式打分规则（演示级）：
+# - 权重、阈值、风险等级与置信度参数写在规则文件（JSON）里，不再硬编码在代码中；
+# - 加载时校验并“编译”：按因子表生成一段直线式打分函数（特征索引 -> 列、权重与阈值内联为常量），
+#   批量打分时没有逐因子的解释循环；同时保留逐因子解释执行的 reference()，用于一致性校验；
+# - 模型版本 = 规则名 + 文件内容 sha256 前 12 位：内容不变版本不变，下游缓存/风险索引可直接以版本为键；
+# - 热更新：后台按 mtime/size 轮询规则文件，新规则编译成功后整体替换引用（原子），
+#   在途请求继续使用开始时拿到的旧规则；规则有误时保留旧规则并记录错误。
+
+logger = logging.getLogger(__name__)
+
+MODEL_RULES_PATH = os.getenv("MODEL_RULES_PATH") or os.path.join(os.path.dirname(__file__), "rules", "flood_risk.json")
+MODEL_RULES_POLL_S = float(os.getenv("MODEL_RULES_POLL_S", "2"))
+
+# 因子变换：identity = x；below = max(0, 阈值 - x)；above = max(0, x - 阈值)；in = 取值（小写）属于集合时为 1
+TRANSFORMS = ("identity", "below", "above", "in")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def safe_float(v: Any, default: float) -> float:
+    try:
+        return float(v)
+    except Exception:
+        return default
+
+
+def _column(features_list: list[dict[str, Any]], key: str, default: float) -> list[float]:
+    col: list[float] = []
+    append = col.append
+    for f in features_list:
+        v = f.get(key)
+        if v.__class__ is float:
+            append(v)
+        elif v is None:
+            append(default)
+        else:
+            append(safe_float(v, default))
+    return col
+
+
+def _flag_column(features_list: list[dict[str, Any]], key: str, default: str, values: frozenset[str]) -> list[float]:
+    return [1.0 if str(f.get(key, default)).lower() in values else 0.0 for f in features_list]
+
+
+# 列式输入（见 wire.py）中“该对象没有这个特征”的占位；显式 null 仍是 None（与字典里 key: None 一致）
+MISSING: Any = type("Missing", (), {"__repr__": lambda self: "MISSING"})()
+
+
+def _column_of(values: list[Any] | None, default: float, n: int) -> list[float]:
+    """列式输入的数值列；values 为空表示整列缺失。转换规则与 _column 逐条一致。"""
+    if values is None:
+        return [default] * n
+    col: list[float] = []
+    append = col.append
+    for v in values:
+        if v.__class__ is float:
+            append(v)
+        elif v is None or v is MISSING:
+            append(default)
+        else:
+            append(safe_float(v, default))
+    return col
+
+
+def _flag_column_of(values: list[Any] | None, default: str, flags: frozenset[str], n: int) -> list[float]:
+    if values is None:
+        return [1.0 if default.lower() in flags else 0.0] * n
+    return [1.0 if str(default if v is MISSING else v).lower() in flags else 0.0 for v in values]
+
+
+@dataclass(frozen=True)
+class Factor:
+    name: str
+    feature: str
+    weight: float
+    default: Any
+    transform: str = "identity"
+    threshold: float = 0.0
+    values: frozenset[str] = frozenset()
+
+
+def _number(value: Any, where: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise RuleError(f"{where} must be a finite number")
+    return float(value)
+
+
+def _object(value: Any, where: str) -> dict[str, Any]:
+    # 缺省（null/缺失）视为空对象；其余非对象取值按规则错误拒绝，而不是在取字段时抛 AttributeError
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise RuleError(f"{where} must be an object")
+    return value
+
+
+def _integer(value: Any, where: str) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RuleError(f"{where} must be an integer")
+    return value
+
+
+def _parse_factor(i: int, raw: Any) -> Factor:
+    where = f"factors[{i}]"
+    if not isinstance(raw, dict):
+        raise RuleError(f"{where} must be an object")
+    name, feature = raw.get("name"), raw.get("feature")
+    if not isinstance(name, str) or not isinstance(feature, str) or not name or not feature:
+        raise RuleError(f"{where}: name/feature must be non-empty strings")
+    transform = raw.get("transform") or {"type": "identity"}
+    kind = transform.get("type") if isinstance(transform, dict) else None
+    if kind not in TRANSFORMS:
+        raise RuleError(f"{where}: transform.type must be one of {', '.join(TRANSFORMS)}")
+    weight = _number(raw.get("weight"), f"{where}.weight")
+    if kind == "in":
+        values = transform.get("values")
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise RuleError(f"{where}: transform.values must be a list of strings")
+        default = raw.get("default", "")
+        if not isinstance(default, str):
+            raise RuleError(f"{where}.default must be a string for transform 'in'")
+        return Factor(name, feature, weight, default, kind, values=frozenset(v.lower() for v in values))
+    default = _number(raw.get("default", 0.0), f"{where}.default")
+    threshold = _number(transform.get("threshold"), f"{where}.transform.threshold") if kind != "identity" else 0.0
+    return Factor(name, feature, weight, default, kind, threshold)
+
+
+def _compile(factors: tuple[Factor, ...], score_min: float, score_max: float) -> tuple[Callable, Callable, Callable]:
+    """
+    生成直线式代码：scores(features_list) / scores_columns(columns, n) 批量打分（分别取字典列表与列式输入，
+    共用同一段逐行循环）、contributions(features) 单对象各因子贡献。
+    加法顺序与因子顺序一致（逐位等价于 reference()）；常量用 repr 内联，浮点值可精确往返。
+    """
+    columns: dict[tuple[Any, ...], str] = {}
+    sets: list[frozenset[str]] = []
+    from_dicts: list[str] = []
+    from_columns: list[str] = []
+    factor_cols: list[str] = []
+    for f in factors:
+        if f.transform == "in":
+            key: tuple[Any, ...] = ("in", f.feature, f.default, f.values)
+            if key not in columns:
+                sets.append(f.values)
+                columns[key] = f"{len(columns)}"
+                from_dicts.append(f"_flag_column(features_list, {f.feature!r}, {f.default!r}, _SETS[{len(sets) - 1}])")
+                from_columns.append(f"_flag_column_of(get({f.feature!r}), {f.default!r}, _SETS[{len(sets) - 1}], n)")
+        else:
+            key = ("num", f.feature, f.default)
+            if key not in columns:
+                columns[key] = f"{len(columns)}"
+                from_dicts.append(f"_column(features_list, {f.feature!r}, {f.default!r})")
+                from_columns.append(f"_column_of(get({f.feature!r}), {f.default!r}, n)")
+        factor_cols.append(f"x{columns[key]}")
+
+    def term(f: Factor, x: str, t: str, indent: str, out: list[str]) -> str:
+        if f.transform == "below":
+            out.append(f"{indent}{t} = {f.threshold!r} - {x}")
+            return f"{f.weight!r} * ({t} if {t} > 0.0 else 0.0)"
+        if f.transform == "above":
+            out.append(f"{indent}{t} = {x} - {f.threshold!r}")
+            return f"{f.weight!r} * ({t} if {t} > 0.0 else 0.0)"
+        return f"{f.weight!r} * {x}"
+
+    # c<i> 为第 i 列（list[float]），x<i> 为循环中当前对象该列的值
+    idx = list(columns.values())
+    lines = [
+        "def scores(features_list):",
+        f"    return _score_rows({', '.join(from_dicts)})",
+        "",
+        "def scores_columns(columns, n):",
+        "    get = columns.get",
+        f"    return _score_rows({', '.join(from_columns)})",
+        "",
+        f"def _score_rows({', '.join('c' + i for i in idx)}):",
+        "    out = []",
+        "    append = out.append",
+    ]
+    lines.append(f"    for ({', '.join('x' + i for i in idx)},) in zip({', '.join('c' + i for i in idx)}):")
+    lines.append("        score = 0.0")
+    for f, x in zip(factors, factor_cols):
+        expr = term(f, x, "t", "        ", lines)
+        lines.append(f"        score += {expr}")
+    lines += [
+        f"        if score < {score_min!r}:",
+        f"            score = {score_min!r}",
+        f"        if score > {score_max!r}:",
+        f"            score = {score_max!r}",
+        "        append(score)",
+        "    return out",
+        "",
+        "def contributions(features):",
+        "    get = features.get",
+    ]
+    terms: list[str] = []
+    for i, f in enumerate(factors):
+        x = f"v{i}"
+        if f.transform == "in":
+            lines.append(f"    {x} = 1.0 if str(get({f.feature!r}, {f.default!r})).lower() in _SETS[{sets.index(f.values)}] else 0.0")
+        else:
+            lines.append(f"    {x} = _safe_float(get({f.feature!r}), {f.default!r})")
+        terms.append(term(f, x, f"t{i}", "    ", lines))
+    lines.append(f"    return ({', '.join(terms)},)")
+
+    namespace: dict[str, Any] = {
+        "_column": _column,
+        "_flag_column": _flag_column,
+        "_column_of": _column_of,
+        "_flag_column_of": _flag_column_of,
+        "_safe_float": safe_float,
+        "_SETS": tuple(sets),
+    }
+    exec(compile("\n".join(lines) + "\n", "<rules>", "exec"), namespace)
+    return namespace["scores"], namespace["scores_columns"], namespace["contributions"]
+
+
+class CompiledRules:
+    """编译后的规则：不可变；热更新时整体替换。"""
+
+    __slots__ = (
+        "name",
+        "digest",
+        "version",
+        "source",
+        "path",
+        "description",
+        "factors",
+        "factor_names",
+        "score_min",
+        "score_max",
+        "levels",
+        "default_level",
+        "level_names",
+        "conf_base",
+        "conf_penalties",
+        "jitter",
+        "conf_min",
+        "conf_max",
+        "explain_top",
+        "scores",
+        "scores_columns",
+        "contributions",
+    )
+
+    # 解释因子末尾的风险分标签；紧凑传输时只发模板，由调用方按分数展开
+    score_label = "风险分={:.2f}"
+
+    def __init__(self, source: bytes, path: str):
+        try:
+            spec = json.loads(source)
+        except ValueError as e:
+            raise RuleError(f"invalid JSON: {e}") from e
+        if not isinstance(spec, dict):
+            raise RuleError("rule file must be a JSON object")
+        name = spec.get("name")
+        if not isinstance(name, str) or not name:
+            raise RuleError("name must be a non-empty string")
+        raw_factors = spec.get("factors")
+        if not isinstance(raw_factors, list) or not raw_factors:
+            raise RuleError("factors must be a non-empty list")
+
+        self.name = name
+        self.digest = hashlib.sha256(source).hexdigest()
+        self.version = f"{name}-{self.digest[:12]}"
+        self.source = source
+        self.path = path
+        self.description = spec.get("description", "")
+        self.factors = tuple(_parse_factor(i, f) for i, f in enumerate(raw_factors))
+        self.factor_names = tuple(f.name for f in self.factors)
+
+        score = _object(spec.get("score"), "score")
+        self.score_min = _number(score.get("min", 0.0), "score.min")
+        self.score_max = _number(score.get("max", 10.0), "score.max")
+
+        levels = spec.get("levels")
+        if not isinstance(levels, list) or not levels:
+            raise RuleError("levels must be a list ending with a default level (no min)")
+        for i, lv in enumerate(levels):
+            if not isinstance(lv, dict):
+                raise RuleError(f"levels[{i}] must be an object")
+            if not isinstance(lv.get("level"), str):
+                raise RuleError(f"levels[{i}].level must be a string")
+        if "min" in levels[-1]:
+            raise RuleError("levels must be a list ending with a default level (no min)")
+        table = [(_number(lv.get("min"), f"levels[{i}].min"), lv["level"]) for i, lv in enumerate(levels[:-1])]
+        if [m for m, _ in table] != sorted((m for m, _ in table), reverse=True):
+            raise RuleError("levels must be ordered by min, highest first")
+        self.levels = tuple(table)
+        self.default_level = levels[-1]["level"]
+        self.level_names = tuple(level for _, level in table) + (self.default_level,)
+
+        conf = _object(spec.get("confidence"), "confidence")
+        penalties = _object(conf.get("missing_penalty"), "confidence.missing_penalty")
+        jitter = _object(conf.get("jitter"), "confidence.jitter") or {"modulus": 1, "offset": 0, "divisor": 1}
+        self.conf_base = _number(conf.get("base", 0.8), "confidence.base")
+        self.conf_penalties = tuple((k, _number(v, f"confidence.missing_penalty.{k}")) for k, v in penalties.items())
+        self.jitter = (
+            _integer(jitter.get("modulus"), "confidence.jitter.modulus"),
+            _integer(jitter.get("offset"), "confidence.jitter.offset"),
+            _number(jitter.get("divisor"), "confidence.jitter.divisor"),
+        )
+        # 取模/除数在每次打分时使用：编译期拦下，避免热更新后所有打分请求抛 ZeroDivisionError
+        if self.jitter[0] < 1:
+            raise RuleError("confidence.jitter.modulus must be >= 1")
+        if self.jitter[2] == 0:
+            raise RuleError("confidence.jitter.divisor must not be 0")
+        self.conf_min = _number(conf.get("min", 0.0), "confidence.min")
+        self.conf_max = _number(conf.get("max", 1.0), "confidence.max")
+        self.explain_top = _integer(spec.get("explain_top", 3), "explain_top")
+
+        self.scores, self.scores_columns, self.contributions = _compile(self.factors, self.score_min, self.score_max)
+
+    def __reduce__(self):
+        # 进程池传参：只传规则原文，子进程按内容缓存编译结果
+        return (load_source, (self.source, self.path))
+
+    def level_code(self, score: float) -> int:
+        """风险等级在 level_names 中的下标。"""
+        for i, (threshold, _) in enumerate(self.levels):
+            if score >= threshold:
+                return i
+        return len(self.levels)
+
+    def risk_level(self, score: float) -> str:
+        return self.level_names[self.level_code(score)]
+
+    def confidence(self, features: dict[str, Any], target_id: str) -> float:
+        base_conf = self.conf_base
+        for key, penalty in self.conf_penalties:
+            if key not in features:
+                base_conf -= penalty
+        modulus, offset, divisor = self.jitter
+        jitter = ((sum(map(ord, target_id)) % modulus) - offset) / divisor
+        conf = base_conf + jitter
+        if conf < self.conf_min:
+            conf = self.conf_min
+        if conf > self.conf_max:
+            conf = self.conf_max
+        return conf
+
+    def explain_codes(self, features: dict[str, Any]) -> list[int]:
+        """贡献绝对值最大的 explain_top 个因子在 factor_names 中的下标（同值保持因子顺序）。"""
+        contrib = list(map(abs, self.contributions(features)))
+        return sorted(range(len(contrib)), key=contrib.__getitem__, reverse=True)[: self.explain_top]
+
+    def explain_factors(self, features: dict[str, Any], score: float) -> list[str]:
+        names = self.factor_names
+        explain = [names[i] for i in self.explain_codes(features)]
+        explain.append(self.score_label.format(score))
+        return explain
+
+    def reference(self, features: dict[str, Any], target_id: str) -> tuple[float, float, list[str]]:
+        """
+        逐条参考实现：逐因子查字典、解释执行规则（编译后的批量打分须与之逐位一致）。
+        返回：(risk_score, confidence, explain_factors)
+        """
+        score = 0.0
+        contrib: list[tuple[str, float]] = []
+        for f in self.factors:
+            if f.transform == "in":
+                x = 1.0 if str(features.get(f.feature, f.default)).lower() in f.values else 0.0
+            else:
+                x = safe_float(features.get(f.feature), f.default)
+            if f.transform == "below":
+                x = max(0.0, f.threshold - x)
+            elif f.transform == "above":
+                x = max(0.0, x - f.threshold)
+            c = f.weight * x
+            score += c
+            contrib.append((f.name, abs(c)))
+        if score < self.score_min:
+            score = self.score_min
+        if score > self.score_max:
+            score = self.score_max
+        contrib.sort(key=lambda x: x[1], reverse=True)
+        explain = [name for name, _ in contrib[: self.explain_top]]
+        explain.append(f"风险分={score:.2f}")
+        return score, self.confidence(features, target_id), explain
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "model_version": self.version,
+            "name": self.name,
+            "sha256": self.digest,
+            "path": self.path,
+            "description": self.description,
+            "factors": [
+                {
+                    "name": f.name,
+                    "feature": f.feature,
+                    "weight": f.weight,
+                    "default": f.default,
+                    "transform": f.transform,
+                    **({"threshold": f.threshold} if f.transform in ("below", "above") else {}),
+                    **({"values": sorted(f.values)} if f.transform == "in" else {}),
+                }
+                for f in self.factors
+            ],
+            "levels": [{"level": level, "min": m} for m, level in self.levels] + [{"level": self.default_level}],
+        }
+
+
+@lru_cache(maxsize=8)
+def load_source(source: bytes, path: str = "<memory>") -> CompiledRules:
+    return CompiledRules(source, path)
+
+
+def load_file(path: str) -> CompiledRules:
+    with open(path, "rb") as f:
+        return load_source(f.read(), path)
+
+
+class RuleStore:
+    def __init__(self, path: str = MODEL_RULES_PATH):
+        self.path = path
+        self._current = load_file(path)
+        self._stat = self._file_stat()
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def current(self) -> CompiledRules:
+        """请求开始时取一次并在整个请求内使用，热更新不影响在途请求。"""
+        return self._current
+
+    def _file_stat(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self) -> bool:
+        """重新读取规则文件；内容变化且编译成功时原子替换并返回 True。失败抛 RuleError，旧规则保持生效。"""
+        self._stat = self._file_stat()
+        try:
+            rules = load_file(self.path)
+        except (OSError, RuleError, KeyError, TypeError, ValueError) as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise RuleError(self.last_error) from e
+        self.last_error = None
+        if rules.digest == self._current.digest:
+            return False
+        old, self._current = self._current, rules
+        self.loaded_at = time.time()
+        self.reloads += 1
+        logger.info("scoring rules reloaded: %s -> %s", old.version, rules.version)
+        return True
+
+    def check(self) -> bool:
+        if self._file_stat() == self._stat:
+            return False
+        try:
+            return self.reload()
+        except RuleError as e:
+            logger.error("scoring rules reload failed, keeping %s: %s", self._current.version, e)
+            return False
+
+    async def start(self) -> None:
+        if MODEL_RULES_POLL_S > 0:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(MODEL_RULES_POLL_S)
+            try:
+                self.check()
+            except Exception:  # noqa: BLE001 - 监视任务不能退出，否则之后的规则修改都不会生效
+                logger.exception("scoring rules check failed, keeping %s", self._current.version)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "model_version": self._current.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+rule_store = RuleStore()
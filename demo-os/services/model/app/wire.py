@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+import msgpack
+
+from .rules import MISSING, CompiledRules
+
+
+# api <-> model-service 内部紧凑传输（演示级），见 POST /infer/topn/packed：
+# - 请求体按列组织：target_ids 一列，每个特征一列（与 target_ids 等长），
+#   absent 记录“该对象没有这个特征”的行号（与字典里 key: null 区分开，置信度扣分依赖这一点）；
+# - 内部可信链路，不经 Pydantic 逐条校验，只检查结构与列长度；
+# - 结果同样按列返回，风险等级、解释因子以小整数编码，名称表每个响应只发一次；
+# - 编码按 Content-Type / Accept 协商：application/x-msgpack 或 application/json（结构相同，便于调试）。
+#
+# 请求：{"requests": [{"area_id", "time", "n", "target_ids": [...], "features": {key: [...]}, "absent": {key: [行号...]}}]}
+# 响应：{"model_version", "target_type", "factors": [...], "levels": [...], "score_label",
+#        "results": [{"target_ids", "risk_score", "risk_level", "confidence", "explain": [[因子下标...]]}]}
+
+MSGPACK = "application/x-msgpack"
+JSON = "application/json"
+
+
+class WireError(ValueError):
+    pass
+
+
+class UnsupportedMediaType(WireError):
+    pass
+
+
+def wants_msgpack(header: str | None) -> bool:
+    return bool(header) and "msgpack" in header
+
+
+def decode_request(body: bytes, content_type: str | None) -> list[tuple[list[str], dict[str, list[Any]], int | None]]:
+    """解析请求体为 [(target_ids, columns, n)]；absent 行在对应列中替换为 MISSING。"""
+    if wants_msgpack(content_type):
+        try:
+            data = msgpack.unpackb(body)
+        except Exception as e:
+            raise WireError(f"invalid msgpack body: {e}") from e
+    elif not content_type or content_type.startswith(JSON):
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise WireError(f"invalid JSON body: {e}") from e
+    else:
+        raise UnsupportedMediaType(f"unsupported content type: {content_type}")
+
+    requests = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(requests, list):
+        raise WireError("body must be {\"requests\": [...]}")
+    groups = []
+    for i, r in enumerate(requests):
+        target_ids = r.get("target_ids") if isinstance(r, dict) else None
+        columns = r.get("features") or {}
+        n = r.get("n")
+        if not isinstance(target_ids, list) or not isinstance(columns, dict):
+            raise WireError(f"requests[{i}]: target_ids must be a list and features a map")
+        if n is not None and (not isinstance(n, int) or n < 0):
+            raise WireError(f"requests[{i}].n must be a non-negative integer")
+        for key, col in columns.items():
+            if not isinstance(col, list) or len(col) != len(target_ids):
+                raise WireError(f"requests[{i}].features[{key!r}] must have one value per target")
+        absent = r.get("absent") or {}
+        if not isinstance(absent, dict):
+            raise WireError(f"requests[{i}].absent must be a map")
+        size = len(target_ids)
+        for key, rows in absent.items():
+            if not isinstance(rows, list):
+                raise WireError(f"requests[{i}].absent[{key!r}] must be a list of row indices")
+            # 负数下标会从末尾覆盖别的行，bool 是 int 的子类：都按非法行号拒绝
+            for row in rows:
+                if row.__class__ is not int or not 0 <= row < size:
+                    raise WireError(f"requests[{i}].absent[{key!r}]: row index {row!r} out of range [0, {size})")
+            col = columns.get(key)
+            if col is None:
+                continue
+            for row in rows:
+                col[row] = MISSING
+        groups.append((target_ids, columns, n))
+    return groups
+
+
+def encode_response(
+    rules: CompiledRules, results: list[dict[str, list[Any]]], accept: str | None, **extra: Any
+) -> tuple[bytes, str]:
+    """按 Accept 编码（msgpack 或 JSON），返回 (body, media_type)；extra 为附加的顶层字段（如特征库水位线）。"""
+    payload = {
+        **extra,
+        "model_version": rules.version,
+        "target_type": "road_segment",
+        "factors": list(rules.factor_names),
+        "levels": list(rules.level_names),
+        "score_label": rules.score_label,
+        "results": results,
+    }
+    if wants_msgpack(accept):
+        return msgpack.packb(payload), MSGPACK
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), JSON